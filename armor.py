@@ -3,6 +3,7 @@ See the README file for instructions on using this CLI.
 """
 
 import argparse
+import contextlib
 import os
 import sys
 
@@ -12,6 +13,29 @@ from eulith_web3.ledger import LedgerSigner
 from eulith_web3.signing import construct_signing_middleware, LocalSigner
 from eulith_web3.trezor import TrezorSigner
 
+from event_indexer import (
+    DEFAULT_CHUNK_BLOCKS,
+    EVENT_KINDS,
+    handle_history,
+    handle_index,
+)
+from fleet_utils import (
+    DEFAULT_DEPLOY_GAS,
+    DEFAULT_ENABLE_GAS,
+    handle_audit,
+    handle_provision,
+)
+from metrics_export import MetricsRun
+from offline_bundle import (
+    handle_export_unsigned,
+    handle_import_signed,
+    handle_sign_bundle,
+)
+from owner_keyring import keyring_sign_armor, keyring_sign_whitelist
+from profiling import Profiler, profile_option
+from providers import RecordingProvider, install_failover, install_provider
+from rpc_stats import RpcStats
+from setup_journal import handle_setup
 from safe_utils import (
     get_safe_balance,
     handle_start_transfer,
@@ -86,9 +110,25 @@ def deploy_armor(ew3, wallet, auth_address, args):
     print(f"Safe address:  {safe_address}")
 
 
+def keyring_path(args):
+    """
+    The keyring file a command signs with (--keyring or EULITH_KEYRING), or None if the
+    command doesn't take a keyring or none was given.
+    """
+    if not hasattr(args, "keyring"):
+        return None
+
+    return args.keyring or os.environ.get("EULITH_KEYRING")
+
+
 def sign_armor_as_owner(ew3, wallet, auth_address, args):
     validate_addresses([auth_address])
 
+    keyring = keyring_path(args)
+    if keyring:
+        keyring_sign_armor(ew3, auth_address, keyring, args.threshold)
+        return
+
     print("When prompted, please sign the request")
     status = ew3.v0.submit_enable_module_signature(auth_address, wallet)
     if not status:
@@ -164,6 +204,11 @@ def append_whitelist(ew3: EulithWeb3, wallet, auth_address, args):
 
 
 def sign_whitelist(ew3, wallet, auth_address, args):
+    keyring = keyring_path(args)
+    if keyring:
+        keyring_sign_whitelist(ew3, auth_address, keyring, args.list_id)
+        return
+
     print("When prompted, please sign transaction.")
     status = ew3.v0.submit_draft_client_whitelist_signature(args.list_id, wallet)
     if not status:
@@ -205,18 +250,18 @@ def confirm(msg):
     return yesno.startswith("y")
 
 
-def get_kms_wallet():
+def get_kms_wallet(aws_profile=None, kms_key=None):
     import boto3
 
     env_key = "AWS_CREDENTIALS_PROFILE_NAME"
-    aws_credentials_profile_name = os.environ.get(env_key)
+    aws_credentials_profile_name = aws_profile or os.environ.get(env_key)
     if not aws_credentials_profile_name:
         bail(
             "if using wallet type {KMS_WALLET_TYPE!r}, {env_key} environment variable must be set"
         )
 
     env_key = "EULITH_KMS_KEY"
-    kms_key_name = os.environ.get(env_key)
+    kms_key_name = kms_key or os.environ.get(env_key)
     if not kms_key_name:
         bail(
             "if using wallet type {KMS_WALLET_TYPE!r}, {env_key} environment variable must be set"
@@ -229,6 +274,46 @@ def get_kms_wallet():
     return KmsSigner(client, formatted_key_name)
 
 
+def get_wallet(
+    wallet_type=None,
+    private_key=None,
+    kms_key=None,
+    aws_profile=None,
+    account_index=0,
+    derivation_path=None,
+):
+    """
+    Connects the wallet described by the arguments; anything left out comes from the
+    environment (EULITH_WALLET_TYPE, PRIVATE_KEY, EULITH_KMS_KEY, ...).
+    """
+    wallet_type = wallet_type or getenv_or_bail("EULITH_WALLET_TYPE")
+
+    if wallet_type and wallet_type not in WALLET_TYPES:
+        wallet_types_string = ", ".join(WALLET_TYPES)
+        bail(
+            f"invalid wallet type {wallet_type!r}, expected one of: {wallet_types_string}"
+        )
+
+    if wallet_type == KMS_WALLET_TYPE:
+        wallet = get_kms_wallet(aws_profile, kms_key)
+    elif wallet_type == LEDGER_WALLET_TYPE:
+        print("Connecting to Ledger")
+        wallet = LedgerSigner(account_index)
+        print("Connected to Ledger")
+        print()
+    elif wallet_type == TREZOR_WALLET_TYPE:
+        print("Connecting to Trezor")
+        wallet = TrezorSigner(derivation_path) if derivation_path else TrezorSigner()
+        print("Connected to Trezor\n")
+    elif wallet_type == PLAIN_TEXT_WALLET_TYPE:
+        private_key = private_key or getenv_or_bail("PRIVATE_KEY")
+        wallet = LocalSigner(private_key)
+    else:
+        bail(f"unsupported wallet type {wallet_type!r}")
+
+    return wallet
+
+
 def get_eulith_url(network_type):
     if network_type == MAINNET_NETWORK_TYPE:
         return "https://eth-main.eulithrpc.com/v0"
@@ -246,17 +331,71 @@ def get_eulith_url(network_type):
         bail(f"unsupported network type {network_type!r}")
 
 
+def get_eulith_urls(network_type):
+    """
+    Ordered endpoint list for a network: EULITH_<NETWORK>_URLS (comma separated, e.g.
+    EULITH_MAINNET_URLS) if set, otherwise just the default endpoint.
+    """
+    env_urls = os.environ.get(f"EULITH_{network_type.upper()}_URLS")
+    if env_urls:
+        return [u.strip() for u in env_urls.split(",") if u.strip()]
+
+    return [get_eulith_url(network_type)]
+
+
+def strip_option(argv, option):
+    out = []
+    skip = False
+    for a in argv:
+        if skip:
+            skip = False
+        elif a == option:
+            skip = True
+        elif not a.startswith(option + "="):
+            out.append(a)
+
+    return out
+
+
 def validate_addresses(addresses):
     for address in addresses:
         if address and not address.startswith("0x"):
             bail(f"address must be a valid hex number starting with '0x': {address}")
 
 
-if __name__ == "__main__":
-    env_wallet_type = os.environ.get("EULITH_WALLET_TYPE")
-
+def build_parser():
     parser = argparse.ArgumentParser()
-    subparsers = parser.add_subparsers(title="subcommands")
+    parser.add_argument(
+        "--record",
+        type=str,
+        metavar="CASSETTE",
+        help="append every RPC and Eulith service exchange to this file (see mock_eulith.py)",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print per-method RPC call counts, latencies and payload sizes when done",
+    )
+    parser.add_argument(
+        "--trace",
+        type=str,
+        metavar="OUT.jsonl",
+        help="write span-level timings for the subcommand and every call it makes",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        metavar="PREFIX",
+        help="profile the subcommand and write PREFIX.pstats, PREFIX.txt and PREFIX.collapsed",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        type=str,
+        metavar="PATH.prom",
+        help="write OpenMetrics for this run to PATH.prom (for node_exporter's textfile collector)",
+    )
+    subparsers = parser.add_subparsers(title="subcommands", dest="command")
 
     parser_deploy_armor = subparsers.add_parser(
         "deploy-armor", help="Deploy a new Armor contract and Gnosis Safe"
@@ -268,6 +407,16 @@ if __name__ == "__main__":
         "sign-armor-as-owner",
         help="Sign the Armor contract with an owner wallet of the Safe",
     )
+    parser_sign_armor.add_argument(
+        "--keyring",
+        type=str,
+        help="sign with every available owner in this keyring file (or EULITH_KEYRING)",
+    )
+    parser_sign_armor.add_argument(
+        "--threshold",
+        type=int,
+        help="with --keyring, stop once this many owners have signed",
+    )
     parser_sign_armor.set_defaults(func=sign_armor_as_owner)
 
     parser_get_existing_signatures = subparsers.add_parser(
@@ -313,6 +462,11 @@ if __name__ == "__main__":
         "sign-whitelist", help="Sign a previously-created whitelist"
     )
     parser_sign_whitelist.add_argument("--list-id", type=int)
+    parser_sign_whitelist.add_argument(
+        "--keyring",
+        type=str,
+        help="sign with every available owner in this keyring file (or EULITH_KEYRING)",
+    )
     parser_sign_whitelist.set_defaults(func=sign_whitelist)
 
     parser_get_whitelist = subparsers.add_parser(
@@ -332,14 +486,35 @@ if __name__ == "__main__":
         "safe-balance", help="Get a specified ERC20 balance of your safe"
     )
     parser_get_safe_balance.add_argument(
-        "--safe", type=str, help="the address of your safe", required=True
+        "--safe",
+        type=str,
+        nargs="+",
+        help="the address of your safe (several may be given)",
+        required=True,
     )
     parser_get_safe_balance.add_argument(
         "--token",
         type=str,
-        help="the ticker symbol or address of the token",
+        nargs="+",
+        help="the ticker symbol or address of the token (several may be given)",
         required=True,
     )
+    parser_get_safe_balance.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running and print balances that changed on each new block as JSON lines",
+    )
+    parser_get_safe_balance.add_argument(
+        "--interval",
+        type=float,
+        default=2.0,
+        help="seconds between eth_blockNumber polls when watching without a subscription",
+    )
+    parser_get_safe_balance.add_argument(
+        "--poll",
+        action="store_true",
+        help="with --watch, poll for new blocks instead of subscribing to them",
+    )
     parser_get_safe_balance.set_defaults(func=get_safe_balance)
 
     parser_get_transfer_hash = subparsers.add_parser(
@@ -361,6 +536,11 @@ if __name__ == "__main__":
     parser_get_transfer_hash.add_argument(
         "--amount", type=float, help="the amount you want to transfer", required=True
     )
+    parser_get_transfer_hash.add_argument(
+        "--queue",
+        action="store_true",
+        help="use the nonce after the transfers already started for this safe",
+    )
     parser_get_transfer_hash.set_defaults(func=handle_start_transfer)
 
     parser_execute_safe_transfer = subparsers.add_parser(
@@ -368,25 +548,29 @@ if __name__ == "__main__":
         help="Execute a transfer (ERC20 tokens or native) from your safe to a specified wallet",
     )
     parser_execute_safe_transfer.add_argument(
-        "--safe", type=str, help="the address of your safe", required=True
+        "--hash",
+        nargs="+",
+        help="Safe tx hash(es) printed by start-safe-transfer; replaces the other transfer options",
+    )
+    parser_execute_safe_transfer.add_argument(
+        "--safe", type=str, help="the address of your safe"
     )
     parser_execute_safe_transfer.add_argument(
         "--token",
         type=str,
         help="the ticker symbol or address of the token (use the null address for native)",
-        required=True,
     )
     parser_execute_safe_transfer.add_argument(
-        "--dest", type=str, help="the address of the destination", required=True
+        "--dest", type=str, help="the address of the destination"
     )
     parser_execute_safe_transfer.add_argument(
-        "--amount", type=float, help="the amount you want to transfer", required=True
+        "--amount", type=float, help="the amount you want to transfer"
     )
     parser_execute_safe_transfer.add_argument(
         "--owners",
         nargs="+",
-        help="the owners you approved the transaction hash with",
-        required=True,
+        help="the owners you approved the transaction hash with (with --hash, owners whose "
+        "signatures were imported are added automatically)",
     )
     parser_execute_safe_transfer.set_defaults(func=handle_execute_transfer)
 
@@ -404,12 +588,190 @@ if __name__ == "__main__":
     )
     parser_approve_safe_hash.set_defaults(func=handle_approve_hash)
 
+    parser_provision = subparsers.add_parser(
+        "provision",
+        help="Deploy and enable Armor for many trading keys listed in a manifest",
+    )
+    parser_provision.add_argument(
+        "--manifest",
+        type=str,
+        help="YAML or JSON file listing trading keys, owners and thresholds",
+        required=True,
+    )
+    parser_provision.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="how many trading keys to work on at once",
+    )
+    parser_provision.set_defaults(func=handle_provision)
+
+    parser_audit = subparsers.add_parser(
+        "audit",
+        help="Check the Armor/Safe setup of many trading keys against a declared state",
+    )
+    parser_audit.add_argument(
+        "--manifest",
+        type=str,
+        help="the provisioning manifest; owners, threshold and whitelist are checked if given",
+    )
+    parser_audit.add_argument(
+        "--addresses", nargs="*", metavar="ADDR", help="trading addresses to audit"
+    )
+    parser_audit.add_argument(
+        "--networks",
+        nargs="*",
+        choices=NETWORK_TYPES,
+        help="networks to audit (defaults to EULITH_NETWORK_TYPE)",
+    )
+    parser_audit.add_argument("--format", choices=["json", "csv"], default="json")
+    parser_audit.add_argument("--output", type=str, help="write the report to a file")
+    parser_audit.add_argument(
+        "--batch-size",
+        type=int,
+        default=8,
+        help="how many trading keys to audit at once (calls are also rate limited)",
+    )
+    parser_audit.set_defaults(func=handle_audit)
+
+    parser_setup = subparsers.add_parser(
+        "setup",
+        help="Run the whole Armor setup as one resumable, journaled workflow",
+    )
+    parser_setup.add_argument(
+        "--threshold", type=int, help="owner threshold (first run only)"
+    )
+    parser_setup.add_argument(
+        "--owner-addresses",
+        nargs="*",
+        metavar="ADDR",
+        help="all owners of the Safe (first run only)",
+    )
+    parser_setup.add_argument(
+        "--whitelist",
+        nargs="*",
+        metavar="ADDR",
+        help="addresses for the client whitelist (first run only; optional)",
+    )
+    parser_setup.add_argument("--gas", type=int, default=DEFAULT_DEPLOY_GAS)
+    parser_setup.add_argument("--enable-gas", type=int, default=DEFAULT_ENABLE_GAS)
+    parser_setup.add_argument(
+        "--status",
+        action="store_true",
+        help="print the journal for the trading address and exit",
+    )
+    parser_setup.set_defaults(func=handle_setup)
+
+    parser_export_unsigned = subparsers.add_parser(
+        "export-unsigned",
+        help="Write everything waiting on owner signatures to a file for offline signing",
+    )
+    parser_export_unsigned.add_argument(
+        "--output", type=str, default="unsigned-bundle.json"
+    )
+    parser_export_unsigned.add_argument(
+        "--safe",
+        nargs="+",
+        metavar="ADDR",
+        help="safes whose started transfers to include (defaults to your safe)",
+    )
+    parser_export_unsigned.set_defaults(func=handle_export_unsigned)
+
+    parser_sign_bundle = subparsers.add_parser(
+        "sign-bundle",
+        help="Sign every payload of an exported bundle with the wallet (works offline)",
+    )
+    parser_sign_bundle.add_argument("--bundle", type=str, required=True)
+    parser_sign_bundle.add_argument(
+        "--output", type=str, help="defaults to updating the bundle in place"
+    )
+    parser_sign_bundle.set_defaults(func=handle_sign_bundle)
+
+    parser_import_signed = subparsers.add_parser(
+        "import-signed", help="Submit the signatures collected in a signed bundle"
+    )
+    parser_import_signed.add_argument("--bundle", type=str, required=True)
+    parser_import_signed.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="how many signatures to submit at once",
+    )
+    parser_import_signed.set_defaults(func=handle_import_signed)
+
+    parser_index = subparsers.add_parser(
+        "index",
+        help="Scan Safe/Armor events for your safes into the local store",
+    )
+    parser_index.add_argument(
+        "--safe",
+        nargs="+",
+        metavar="ADDR",
+        help="safes to index (defaults to your safe and every safe indexed before)",
+    )
+    parser_index.add_argument(
+        "--from-block",
+        type=int,
+        help="first block for safes not indexed yet (defaults to their deployment block)",
+    )
+    parser_index.add_argument(
+        "--confirmations",
+        type=int,
+        default=5,
+        help="stay this many blocks behind the head to avoid indexing reorged blocks",
+    )
+    parser_index.add_argument(
+        "--chunk-blocks",
+        type=int,
+        default=DEFAULT_CHUNK_BLOCKS,
+        help="initial eth_getLogs block range; adjusted as the endpoint allows",
+    )
+    parser_index.set_defaults(func=handle_index)
+
+    parser_history = subparsers.add_parser(
+        "history",
+        help="Query the events collected by `index` and the actions sent from this machine",
+    )
+    parser_history.add_argument("--safe", type=str, help="only events of this safe")
+    parser_history.add_argument(
+        "--owner",
+        type=str,
+        help="only hashes approved by (and actions sent from) this owner",
+    )
+    parser_history.add_argument(
+        "--chain-id",
+        type=int,
+        help="chain to show; defaults to the only chain in the store, else the network's",
+    )
+    parser_history.add_argument(
+        "--kind", nargs="+", choices=EVENT_KINDS, help="only these kinds of events"
+    )
+    parser_history.add_argument(
+        "--since", type=str, help="e.g. 7d, 12h or an ISO date such as 2024-01-31"
+    )
+    parser_history.add_argument("--limit", type=int, default=50)
+    parser_history.add_argument(
+        "--json", action="store_true", help="print one JSON object per line"
+    )
+    parser_history.set_defaults(func=handle_history)
+
     parser_approve_safe_hash = subparsers.add_parser(
         "show-wallet", help="Show the address of the connected wallet"
     )
     parser_approve_safe_hash.set_defaults(func=show_wallet_address)
 
-    args = parser.parse_args()
+    return parser
+
+
+def run(args, metrics):
+    """
+    Everything after argument parsing; wrapped by MetricsRun so a failure in wallet or
+    environment setup is reported too.
+    """
+    if getattr(getattr(args, "func", None), "offline", False):
+        # Offline commands run on air-gapped machines: no token, network or Eulith connection
+        args.func(None, get_wallet(), os.environ.get("EULITH_TRADING_ADDRESS"), args)
+        sys.exit(0)
 
     eulith_token = getenv_or_bail("EULITH_TOKEN")
     auth_address = os.environ.get("EULITH_TRADING_ADDRESS")
@@ -422,45 +784,75 @@ if __name__ == "__main__":
             f"invalid network type {network_type!r}, expected one of: {network_types_string}"
         )
 
-    wallet_type = getenv_or_bail("EULITH_WALLET_TYPE")
-
-    if wallet_type and wallet_type not in WALLET_TYPES:
-        wallet_types_string = ", ".join(WALLET_TYPES)
-        bail(
-            f"invalid wallet type {wallet_type!r}, expected one of: {wallet_types_string}"
-        )
-
-    eulith_url = get_eulith_url(network_type)
-
-    if wallet_type == KMS_WALLET_TYPE:
-        wallet = get_kms_wallet()
-    elif wallet_type == LEDGER_WALLET_TYPE:
-        print("Connecting to Ledger")
-        wallet = LedgerSigner()
-        print("Connected to Ledger")
-        print()
-    elif wallet_type == TREZOR_WALLET_TYPE:
-        print("Connecting to Trezor")
-        wallet = TrezorSigner()
-        print("Connected to Trezor\n")
-    elif wallet_type == PLAIN_TEXT_WALLET_TYPE:
-        private_key = getenv_or_bail("PRIVATE_KEY")
-        wallet = LocalSigner(private_key)
-    else:
-        bail(f"unsupported wallet type {wallet_type!r}")
+    # With a keyring every signer comes from the keyring. Connecting the EULITH_WALLET_TYPE
+    # wallet as well would claim a Ledger/Trezor the keyring needs to open.
+    wallet = None if keyring_path(args) else get_wallet()
+    eulith_urls = get_eulith_urls(network_type)
 
     with EulithWeb3(
-        eulith_url=eulith_url,
+        eulith_url=eulith_urls[0],
         eulith_token=eulith_token,
-        signing_middle_ware=construct_signing_middleware(wallet),
+        signing_middle_ware=construct_signing_middleware(wallet) if wallet else None,
     ) as ew3:
         if network_type == POLY_NETWORK_TYPE:
             from web3.middleware import geth_poa_middleware
 
             ew3.middleware_onion.inject(geth_poa_middleware, layer=0)
 
+        failover = install_failover(ew3, eulith_urls)
+
+        if args.record:
+            meta = {
+                "argv": strip_option(sys.argv[1:], "--record"),
+                "network_type": network_type,
+                "trading_address": auth_address,
+            }
+            install_provider(ew3, RecordingProvider(ew3.provider, args.record, meta))
+
+        stats = None
+        if args.stats or args.trace or args.metrics_file:
+            stats = RpcStats(args.trace)
+            stats.install(ew3)
+            failover.on_retry = stats.record_retry
+            failover.on_attempt = stats.record_attempt
+            if args.metrics_file:
+                metrics.attach(stats)
+
+        profile_prefix = profile_option(args.profile)
+
         try:
-            args.func(ew3, wallet, auth_address, args)
+            with contextlib.ExitStack() as stack:
+                if stats:
+                    stack.enter_context(stats.span(args.command))
+                if profile_prefix:
+                    stack.enter_context(Profiler(profile_prefix))
+                args.func(ew3, wallet, auth_address, args)
         except AttributeError:
             print_banner()
             print("Did not receive any commands. Try running ./run.sh -h for help")
+        finally:
+            if stats:
+                if args.stats:
+                    stats.print_summary()
+                stats.close()
+            if args.metrics_file:
+                metrics.collect(ew3)
+
+
+if __name__ == "__main__":
+    env_wallet_type = os.environ.get("EULITH_WALLET_TYPE")
+
+    parser = build_parser()
+    args = parser.parse_args()
+
+    if args.metrics_file:
+        safe = getattr(args, "safe", None)
+        if isinstance(safe, list):
+            safe = ",".join(safe)
+        network_type = os.environ.get("EULITH_NETWORK_TYPE", "")
+        metrics = MetricsRun(args.metrics_file, args.command, network_type, safe)
+    else:
+        metrics = contextlib.nullcontext()
+
+    with metrics:
+        run(args, metrics)
@@ -0,0 +1,222 @@
+import json
+import queue
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from web3.types import ChecksumAddress
+
+from eulith_web3.eulith_web3 import EulithWeb3
+from eulith_web3.websocket import EulithWebsocketRequestHandler, SubscribeRequest
+
+# Deployed at the same address on every major EVM chain; see https://www.multicall3.com
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+MULTICALL3_ABI = [
+    {
+        "name": "aggregate3",
+        "type": "function",
+        "stateMutability": "payable",
+        "inputs": [
+            {
+                "name": "calls",
+                "type": "tuple[]",
+                "components": [
+                    {"name": "target", "type": "address"},
+                    {"name": "allowFailure", "type": "bool"},
+                    {"name": "callData", "type": "bytes"},
+                ],
+            }
+        ],
+        "outputs": [
+            {
+                "name": "returnData",
+                "type": "tuple[]",
+                "components": [
+                    {"name": "success", "type": "bool"},
+                    {"name": "returnData", "type": "bytes"},
+                ],
+            }
+        ],
+    },
+    {
+        "name": "getEthBalance",
+        "type": "function",
+        "stateMutability": "view",
+        "inputs": [{"name": "addr", "type": "address"}],
+        "outputs": [{"name": "balance", "type": "uint256"}],
+    },
+]
+
+BALANCE_OF_ABI = [
+    {
+        "name": "balanceOf",
+        "type": "function",
+        "stateMutability": "view",
+        "inputs": [{"name": "owner", "type": "address"}],
+        "outputs": [{"name": "", "type": "uint256"}],
+    }
+]
+
+
+class TrackedToken:
+    def __init__(
+        self, address: ChecksumAddress, symbol: str, decimals: int, native: bool
+    ):
+        self.address = address
+        self.symbol = symbol
+        self.decimals = decimals
+        self.native = native
+
+
+class BalanceReader:
+    """
+    Reads the balance of every (safe, token) pair at a given block. The call data is built once;
+    with Multicall3 deployed, each read is one eth_call no matter how many pairs are tracked.
+    """
+
+    def __init__(
+        self, ew3: EulithWeb3, safes: List[ChecksumAddress], tokens: List[TrackedToken]
+    ):
+        self.ew3 = ew3
+        self.pairs: List[Tuple[ChecksumAddress, TrackedToken]] = [
+            (safe, token) for safe in safes for token in tokens
+        ]
+
+        self.multicall = ew3.eth.contract(
+            address=MULTICALL3_ADDRESS, abi=MULTICALL3_ABI
+        )
+        self.use_multicall = len(ew3.eth.get_code(MULTICALL3_ADDRESS)) > 0
+
+        erc20 = ew3.eth.contract(abi=BALANCE_OF_ABI)
+        self.calls = []
+        for safe, token in self.pairs:
+            if token.native:
+                target = MULTICALL3_ADDRESS
+                data = self.multicall.encodeABI(fn_name="getEthBalance", args=[safe])
+            else:
+                target = token.address
+                data = erc20.encodeABI(fn_name="balanceOf", args=[safe])
+            self.calls.append((target, data))
+
+    def read(self, block: int) -> List[Optional[int]]:
+        if self.use_multicall:
+            results = self.multicall.functions.aggregate3(
+                [(target, True, data) for target, data in self.calls]
+            ).call(block_identifier=block)
+            return [
+                int.from_bytes(data[:32], "big") if ok and len(data) >= 32 else None
+                for ok, data in results
+            ]
+
+        balances = []
+        for (safe, token), (target, data) in zip(self.pairs, self.calls):
+            if token.native:
+                balances.append(self.ew3.eth.get_balance(safe, block))
+            else:
+                raw = self.ew3.eth.call({"to": target, "data": data}, block)
+                balances.append(int.from_bytes(raw[:32], "big") if raw else None)
+
+        return balances
+
+    def describe(
+        self, i: int, balance: Optional[int], block: int, previous=None
+    ) -> Dict:
+        safe, token = self.pairs[i]
+        return {
+            "block": block,
+            "safe": safe,
+            "token": token.address,
+            "symbol": token.symbol,
+            "balance": str(balance) if balance is not None else None,
+            "amount": balance / 10**token.decimals if balance is not None else None,
+            "previous": str(previous) if previous is not None else None,
+        }
+
+
+class NewHeadsHandler(EulithWebsocketRequestHandler):
+    def __init__(self, heads: queue.Queue):
+        self.heads = heads
+
+    def handle_result(self, message):
+        # The first message is the subscription id; later ones carry block headers
+        params = message.get("params") or {}
+        header = params.get("result") if isinstance(params, dict) else None
+        if isinstance(header, dict) and header.get("number"):
+            self.heads.put(int(header["number"], 16))
+
+    def handle_error(self, message):
+        self.heads.put(None)
+
+
+def new_blocks(ew3: EulithWeb3, interval: float, poll: bool) -> Iterator[int]:
+    """
+    Yields each new block number once (skipping straight to the latest if several arrive
+    together). Uses an eth_subscribe newHeads subscription over the Eulith websocket, and falls
+    back to polling eth_blockNumber every `interval` seconds if the endpoint doesn't deliver
+    headers.
+    """
+    last = ew3.eth.block_number
+    yield last
+
+    heads = queue.Queue()
+    subscription = None
+    if not poll:
+        try:
+            subscription = ew3.eulith_service.subscribe(
+                SubscribeRequest(subscription_type=None, args=["newHeads"]),
+                NewHeadsHandler(heads),
+            )
+        except Exception as e:
+            print(f"Could not subscribe to new blocks ({e}), polling", file=sys.stderr)
+
+    try:
+        while subscription is not None:
+            try:
+                block = heads.get(timeout=max(30.0, 5 * interval))
+            except queue.Empty:
+                block = None
+            if block is None:
+                print("No new block headers received, polling", file=sys.stderr)
+                subscription = None
+                break
+
+            while not heads.empty():
+                block = heads.get_nowait() or block
+            if block > last:
+                last = block
+                yield block
+
+        while True:
+            time.sleep(interval)
+            block = ew3.eth.block_number
+            if block > last:
+                last = block
+                yield block
+    finally:
+        if subscription is not None:
+            try:
+                subscription.unsubscribe()
+            except Exception:
+                pass
+
+
+def watch_balances(
+    ew3: EulithWeb3, reader: BalanceReader, interval: float, poll: bool, out=sys.stdout
+):
+    """
+    Prints one JSON object per line for each balance that changed since the previous block
+    (all of them for the first block), reading balances only when a new block arrives.
+    """
+    previous: List[Optional[int]] = [None] * len(reader.pairs)
+    first = True
+
+    for block in new_blocks(ew3, interval, poll):
+        balances = reader.read(block)
+        for i, balance in enumerate(balances):
+            if first or balance != previous[i]:
+                row = reader.describe(i, balance, block, None if first else previous[i])
+                out.write(json.dumps(row) + "\n")
+        out.flush()
+        previous = balances
+        first = False
@@ -0,0 +1,130 @@
+"""
+Per-operation CPU overhead of the generated ISafe/EulithERC20 bindings vs the prebuilt codecs
+in bindings.py. Calls are answered by an in-process provider, so the numbers are encoding,
+decoding and contract setup only, with no network time. Each operation runs for a fixed time
+budget (--seconds) rather than a fixed number of calls, so the slow generated bindings don't
+dominate the run:
+
+    python -m benchmarks.bench_bindings --seconds 0.5
+"""
+
+import argparse
+import time
+
+from eth_abi import encode
+from web3 import Web3
+from web3.providers import BaseProvider
+
+from eulith_web3.contract_bindings.safe.i_safe import ISafe
+from eulith_web3.erc20 import EulithERC20
+
+import bindings
+
+SAFE = Web3.to_checksum_address("0x" + "5a" * 20)
+TOKEN = Web3.to_checksum_address("0x" + "70" * 20)
+OWNERS = [Web3.to_checksum_address(f"0x{i:040x}") for i in range(1, 4)]
+NULL_ADDRESS = "0x0000000000000000000000000000000000000000"
+
+RESPONSES = {
+    bindings.SAFE_NONCE.selector: encode(["uint256"], [42]),
+    bindings.SAFE_GET_THRESHOLD.selector: encode(["uint256"], [2]),
+    bindings.SAFE_GET_OWNERS.selector: encode(["address[]"], [OWNERS]),
+    bindings.SAFE_GET_TRANSACTION_HASH.selector: encode(["bytes32"], [b"\x11" * 32]),
+    bindings.ERC20_SYMBOL.selector: encode(["string"], ["USDC"]),
+    bindings.ERC20_DECIMALS.selector: encode(["uint8"], [6]),
+    bindings.ERC20_BALANCE_OF.selector: encode(["uint256"], [10**12]),
+}
+
+
+class StaticProvider(BaseProvider):
+    def make_request(self, method, params):
+        if method == "eth_chainId":
+            return {"jsonrpc": "2.0", "id": 1, "result": "0x1"}
+        if method == "eth_call":
+            selector = bytes.fromhex(params[0]["data"][2:10])
+            result = Web3.to_hex(RESPONSES[selector])
+            return {"jsonrpc": "2.0", "id": 1, "result": result}
+        raise ValueError(f"unexpected request {method}")
+
+    def is_connected(self, show_traceback=False):
+        return True
+
+
+def operations(w3):
+    """
+    (name, generated binding, prebuilt codec) pairs doing the same work as safe_utils.
+    """
+    args = (TOKEN, 0, b"\x01" * 68, 0, 0, 0, 0, NULL_ADDRESS, NULL_ADDRESS, 42)
+
+    return [
+        (
+            "safe nonce",
+            lambda: ISafe(w3, SAFE).nonce(),
+            lambda: bindings.get_safe(w3, SAFE).nonce(),
+        ),
+        (
+            "safe owners + threshold",
+            lambda: (ISafe(w3, SAFE).get_owners(), ISafe(w3, SAFE).get_threshold()),
+            lambda: (
+                bindings.get_safe(w3, SAFE).get_owners(),
+                bindings.get_safe(w3, SAFE).get_threshold(),
+            ),
+        ),
+        (
+            "safe tx hash",
+            lambda: ISafe(w3, SAFE).get_transaction_hash(*args),
+            lambda: bindings.get_safe(w3, SAFE).get_transaction_hash(*args),
+        ),
+        (
+            "erc20 balance",
+            lambda: EulithERC20(w3, TOKEN).balance_of_float(SAFE),
+            lambda: bindings.get_erc20(w3, TOKEN).balance_of_float(SAFE),
+        ),
+        (
+            "erc20 transfer data",
+            lambda: EulithERC20(w3, TOKEN).transfer(
+                SAFE, 10**6, {"from": SAFE, "gas": 0, "chainId": 1, "gasPrice": 0}
+            )["data"],
+            lambda: Web3.to_hex(
+                bindings.get_erc20(w3, TOKEN).transfer_data_float(SAFE, 1.0)
+            ),
+        ),
+    ]
+
+
+def per_call_us(fn, seconds, iterations=None):
+    """
+    Mean time per call of `fn`, calling it for `seconds` or, if given, exactly `iterations` times.
+    """
+    fn()
+    calls = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while (calls < iterations) if iterations else (time.perf_counter() < deadline):
+        fn()
+        calls += 1
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--seconds",
+        type=float,
+        default=0.25,
+        help="time budget per operation and binding",
+    )
+    parser.add_argument(
+        "--iterations", type=int, help="a fixed number of calls instead of --seconds"
+    )
+    args = parser.parse_args()
+
+    w3 = Web3(StaticProvider())
+    print(f"{'operation':>24}  {'generated':>12}  {'prebuilt':>12}  speedup")
+    for name, generated, prebuilt in operations(w3):
+        # Sanity check: both must return the same thing
+        assert generated() == prebuilt(), name
+
+        slow = per_call_us(generated, args.seconds, args.iterations)
+        fast = per_call_us(prebuilt, args.seconds, args.iterations)
+        print(f"{name:>24}  {slow:10.1f}us  {fast:10.1f}us  {slow / fast:6.1f}x")
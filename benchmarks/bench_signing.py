@@ -0,0 +1,64 @@
+"""
+Throughput of bulk LocalSigner signing, serial vs sharded across a process pool.
+
+    python -m benchmarks.bench_signing --keys 20 --digests 50
+"""
+
+import argparse
+import os
+import time
+
+from eth_utils import keccak
+from eulith_web3.signing import LocalSigner
+
+from bulk_signing import sign_digests
+
+
+def make_pairs(n_keys, n_digests):
+    keys = [keccak(text=f"owner-{i}").hex() for i in range(n_keys)]
+    digests = [keccak(text=f"digest-{j}") for j in range(n_digests)]
+    return [(k, d) for k in keys for d in digests]
+
+
+def bench_serial(pairs):
+    start = time.perf_counter()
+    signers = {}
+    for k, d in pairs:
+        signer = signers.setdefault(k, LocalSigner(k))
+        signer.sign_msg_hash(d)
+
+    return time.perf_counter() - start
+
+
+def bench_bulk(pairs, processes):
+    start = time.perf_counter()
+    sign_digests(pairs, processes=processes)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, default=20)
+    parser.add_argument("--digests", type=int, default=50)
+    parser.add_argument("--processes", type=int, nargs="*", default=None)
+    args = parser.parse_args()
+
+    pairs = make_pairs(args.keys, args.digests)
+
+    # Sanity check: bulk results must match the plain LocalSigner, in order
+    sample = pairs[:: max(1, len(pairs) // 16)]
+    expected = [LocalSigner(k).sign_msg_hash(d) for k, d in sample]
+    assert sign_digests(sample, processes=2) == expected
+
+    n = len(pairs)
+    print(f"Signing {n} digests ({args.keys} keys x {args.digests} digests)\n")
+
+    serial = bench_serial(pairs)
+    print(f"{'serial':>12}: {serial:8.3f}s  {n / serial:10.1f} sig/s")
+
+    cpus = os.cpu_count() or 1
+    for p in args.processes or sorted({2, cpus // 2, cpus} - {0, 1}):
+        t = bench_bulk(pairs, p)
+        print(
+            f"{f'{p} procs':>12}: {t:8.3f}s  {n / t:10.1f} sig/s  ({serial / t:.2f}x)"
+        )
@@ -0,0 +1,188 @@
+"""
+Per-subcommand latency benchmark against a local replay of recorded RPC traffic.
+
+benchmarks/cassettes/ ships synthetic cassettes (see make_cassettes.py) for addresses,
+get-whitelist, safe-balance, start-safe-transfer and execute-safe-transfer. To benchmark other
+commands, or real traffic, record a cassette against a real endpoint:
+
+    ./run.sh --record benchmarks/cassettes/safe-balance.jsonl safe-balance --safe 0x... --token USDC
+
+Then run the handlers against mock_eulith.py with injected latency:
+
+    python -m benchmarks.bench_subcommands --latency-ms 50 --runs 5
+
+Each cassette remembers the command line it was recorded with. The run fails if a command
+makes more round trips than its stored baseline; use --update-baselines to accept new counts.
+"""
+
+import argparse
+import builtins
+import contextlib
+import glob
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from eulith_web3.eulith_web3 import EulithWeb3
+from eulith_web3.signing import LocalSigner, construct_signing_middleware
+
+import bindings
+from armor import build_parser
+from mock_eulith import Cassette, ReplayServer
+from providers import read_cassette_meta, read_cassettes
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CASSETTE_DIR = os.path.join(HERE, "cassettes")
+BASELINES_PATH = os.path.join(HERE, "baselines.json")
+
+# Commands are replayed with a throwaway key; recorded responses don't depend on it
+BENCH_PRIVATE_KEY = "0x" + "11" * 32
+
+
+@contextlib.contextmanager
+def isolated_run():
+    """
+    Runs a handler the same way every time: a fresh local store in a temp file (so transfers
+    and actions from earlier runs neither change the requests made nor land in the real
+    store), no cached token metadata, prompts answered with enter and output discarded.
+    """
+    original_store = os.environ.get("EULITH_STORE_PATH")
+    original_input = builtins.input
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["EULITH_STORE_PATH"] = os.path.join(tmp, "armor.sqlite3")
+        builtins.input = lambda *a: ""
+        bindings.clear_cache()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                yield
+        finally:
+            builtins.input = original_input
+            if original_store is None:
+                os.environ.pop("EULITH_STORE_PATH", None)
+            else:
+                os.environ["EULITH_STORE_PATH"] = original_store
+
+
+def run_case(path, latency_ms, jitter_ms):
+    meta = read_cassette_meta(path)
+    if not meta.get("argv"):
+        raise ValueError(f"{path} has no recorded command line; re-record it")
+
+    args = build_parser().parse_args(meta["argv"])
+    wallet = LocalSigner(BENCH_PRIVATE_KEY)
+
+    with ReplayServer(
+        Cassette(read_cassettes([path])),
+        port=0,
+        latency_ms=latency_ms,
+        jitter_ms=jitter_ms,
+    ) as server:
+        with EulithWeb3(
+            eulith_url=server.url,
+            eulith_token="bench",
+            signing_middle_ware=construct_signing_middleware(wallet),
+        ) as ew3:
+            server.stats.reset()
+            with isolated_run():
+                start = time.perf_counter()
+                args.func(ew3, wallet, meta.get("trading_address"), args)
+                wall = time.perf_counter() - start
+
+        stats = server.stats.snapshot()
+
+    return {
+        "wall_s": wall,
+        "round_trips": stats["requests"],
+        "bytes_sent": stats["bytes_in"],
+        "bytes_received": stats["bytes_out"],
+        "by_method": stats["by_method"],
+        "misses": stats["misses"],
+    }
+
+
+def load_baselines():
+    if not os.path.exists(BASELINES_PATH):
+        return {}
+
+    with open(BASELINES_PATH) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cassettes", default=CASSETTE_DIR)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--update-baselines", action="store_true")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.cassettes, "*.jsonl")))
+    if not paths:
+        print(f"No cassettes in {args.cassettes}; see the docstring of this file.")
+        sys.exit(1)
+
+    baselines = load_baselines()
+    results = {}
+    regressions = []
+
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        runs = [
+            run_case(path, args.latency_ms, args.jitter_ms) for _ in range(args.runs)
+        ]
+        last = runs[-1]
+        result = {
+            "wall_s_median": statistics.median(r["wall_s"] for r in runs),
+            "wall_s_min": min(r["wall_s"] for r in runs),
+            "round_trips": last["round_trips"],
+            "bytes_sent": last["bytes_sent"],
+            "bytes_received": last["bytes_received"],
+            "by_method": last["by_method"],
+        }
+        if last["misses"]:
+            result["misses"] = last["misses"]
+        results[name] = result
+
+        baseline = baselines.get(name, {}).get("round_trips")
+        if baseline is not None and result["round_trips"] > baseline:
+            regressions.append(
+                f"{name}: {result['round_trips']} round trips, baseline is {baseline}"
+            )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(
+            f"latency {args.latency_ms}ms +/- {args.jitter_ms}ms, median of {args.runs} runs\n"
+        )
+        print(
+            f"{'command':<28}{'wall (s)':>10}{'round trips':>13}{'sent (B)':>11}{'recv (B)':>11}"
+        )
+        for name, r in results.items():
+            print(
+                f"{name:<28}{r['wall_s_median']:>10.3f}{r['round_trips']:>13}"
+                f"{r['bytes_sent']:>11}{r['bytes_received']:>11}"
+            )
+            if r.get("misses"):
+                print(f"    no recorded response for: {', '.join(r['misses'])}")
+
+    if args.update_baselines:
+        baselines.update(
+            {n: {"round_trips": r["round_trips"]} for n, r in results.items()}
+        )
+        with open(BASELINES_PATH, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nUpdated {BASELINES_PATH}")
+    elif regressions:
+        print("\nRound trip regressions:")
+        for r in regressions:
+            print(f"  {r}")
+        sys.exit(1)
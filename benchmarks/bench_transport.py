@@ -0,0 +1,124 @@
+"""
+Cold vs. resumed vs. warm request latency for the websocket transport.
+
+  cold:    new connection with a full TLS handshake, then one request
+  resumed: new connection that resumes the TLS session of an earlier one, then one request
+  warm:    one request on a connection that is already open
+
+By default this runs against a local replay server, optionally over TLS with a self-signed
+certificate:
+
+    openssl req -x509 -newkey rsa:2048 -nodes -keyout key.pem -out cert.pem -days 1 \\
+        -subj "/CN=localhost" -addext "subjectAltName=DNS:localhost"
+    python -m benchmarks.bench_transport --certfile cert.pem --keyfile key.pem --latency-ms 20
+
+or against a real endpoint (uses EULITH_TOKEN):
+
+    python -m benchmarks.bench_transport --url https://eth-main.eulithrpc.com/v0
+"""
+
+import argparse
+import os
+import ssl
+import statistics
+import time
+
+from eulith_web3.eulith_service import ensure_formatted_ws_url
+
+from mock_eulith import Cassette, ReplayServer
+from transport import ResumingSSLContext, TransportConfig, TunedWebsocketProvider
+
+REQUEST = ("eth_chainId", [])
+CHAIN_ID_EXCHANGE = {
+    "method": "eth_chainId",
+    "params": [],
+    "response": {"jsonrpc": "2.0", "result": "0x1"},
+}
+
+
+def new_context(cafile):
+    context = ResumingSSLContext()
+    if cafile:
+        context.load_verify_locations(cafile)
+    return context
+
+
+def timed_connect(uri, token, context, config):
+    start = time.perf_counter()
+    provider = TunedWebsocketProvider(uri, token, config, ssl_context=context)
+    provider.make_request(*REQUEST)
+    return (time.perf_counter() - start) * 1000, provider
+
+
+def run(uri, token, rounds, cafile):
+    config = TransportConfig(ping_interval_s=0)
+    cold, resumed, warm = [], [], []
+    resumed_handshakes = 0
+
+    for _ in range(rounds):
+        context = new_context(cafile)
+
+        ms, first = timed_connect(uri, token, context, config)
+        cold.append(ms)
+
+        for _ in range(10):
+            start = time.perf_counter()
+            first.make_request(*REQUEST)
+            warm.append((time.perf_counter() - start) * 1000)
+
+        ms, second = timed_connect(uri, token, context, config)
+        resumed.append(ms)
+        resumed_handshakes += context.resumed
+
+        first.terminate()
+        second.terminate()
+
+    return cold, resumed, warm, resumed_handshakes
+
+
+def summary(samples):
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+    return f"{statistics.median(ordered):>9.2f}{p95:>9.2f}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="benchmark this endpoint instead of a local one")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--certfile", help="serve the local endpoint over TLS")
+    parser.add_argument("--keyfile")
+    args = parser.parse_args()
+
+    if args.url:
+        uri = ensure_formatted_ws_url(args.url)
+        cold, resumed, warm, n_resumed = run(
+            uri, os.environ.get("EULITH_TOKEN", ""), args.rounds, None
+        )
+    else:
+        server_context = None
+        if args.certfile:
+            server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            server_context.load_cert_chain(args.certfile, args.keyfile)
+
+        with ReplayServer(
+            Cassette([CHAIN_ID_EXCHANGE]),
+            port=0,
+            latency_ms=args.latency_ms,
+            ssl_context=server_context,
+        ) as server:
+            uri = ensure_formatted_ws_url(server.url)
+            cold, resumed, warm, n_resumed = run(
+                uri, "bench", args.rounds, args.certfile
+            )
+
+    print(f"{uri}, {args.rounds} rounds\n")
+    print(f"{'':<10}{'p50 ms':>9}{'p95 ms':>9}")
+    print(f"{'cold':<10}{summary(cold)}")
+    print(f"{'resumed':<10}{summary(resumed)}")
+    print(f"{'warm':<10}{summary(warm)}")
+    if uri.startswith("wss://"):
+        print(
+            f"\n{n_resumed} of {args.rounds} second connections resumed a TLS session"
+        )
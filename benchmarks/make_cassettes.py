@@ -0,0 +1,256 @@
+"""
+Writes the synthetic cassettes in benchmarks/cassettes/ that bench_subcommands replays.
+
+Each benchmarked command runs once against a small fake chain: one Armor/Safe pair for the
+trading key and one USDC-like token. The fake chain answers every request the command makes,
+and the exchanges are saved in the same format as `./run.sh --record`. The benchmark then
+measures the client side (round trips, payload sizes, CPU) without a real endpoint:
+
+    python -m benchmarks.make_cassettes
+    python -m benchmarks.bench_subcommands --update-baselines
+
+Cassettes recorded against a real endpoint can sit next to these; re-record or regenerate
+after a change that alters which requests a command makes.
+"""
+
+import argparse
+import json
+import os
+from typing import Dict, List, Optional
+
+from eth_abi import decode, encode
+from web3 import Web3
+
+from eulith_web3.eulith_web3 import EulithWeb3
+from eulith_web3.signing import LocalSigner, construct_signing_middleware
+
+import bindings
+from armor import build_parser
+from balance_watch import MULTICALL3_ADDRESS
+from benchmarks.bench_subcommands import BENCH_PRIVATE_KEY, CASSETTE_DIR, isolated_run
+from mock_eulith import ReplayServer
+from providers import json_default
+
+CHAIN_ID = 1
+TRADING_ADDRESS = Web3.to_checksum_address("0x" + "7a" * 20)
+ARMOR = Web3.to_checksum_address("0x" + "a7" * 20)
+SAFE = Web3.to_checksum_address("0x" + "5a" * 20)
+TOKEN = Web3.to_checksum_address("0x" + "70" * 20)
+DEST = Web3.to_checksum_address("0x" + "d0" * 20)
+OWNERS = [Web3.to_checksum_address(f"0x{i:040x}") for i in (0xA1, 0xA2, 0xA3)]
+BLOCK_NUMBER = 19_000_000
+ZERO_HASH = "0x" + "00" * 32
+
+CASES = {
+    "addresses": ["addresses"],
+    "get-whitelist": ["get-whitelist"],
+    "safe-balance": ["safe-balance", "--safe", SAFE, "--token", "USDC"],
+    "start-safe-transfer": [
+        "start-safe-transfer",
+        "--safe",
+        SAFE,
+        "--token",
+        "USDC",
+        "--dest",
+        DEST,
+        "--amount",
+        "25",
+    ],
+    "execute-safe-transfer": [
+        "execute-safe-transfer",
+        "--safe",
+        SAFE,
+        "--token",
+        "USDC",
+        "--dest",
+        DEST,
+        "--amount",
+        "25",
+        "--owners",
+        *OWNERS[:2],
+    ],
+}
+
+
+def word(types: List[str], values: List) -> str:
+    return Web3.to_hex(encode(types, values))
+
+
+class SyntheticChain:
+    """
+    Answers requests the way the Eulith endpoint would for the fixed accounts above, and
+    keeps every exchange. Duck-types mock_eulith.Cassette, so ReplayServer can serve it.
+    """
+
+    def __init__(self):
+        self.exchanges: List[Dict] = []
+        self.sent: Dict[str, str] = {}
+
+    def lookup(self, method: str, params) -> Optional[Dict]:
+        result = self.answer(method, params)
+        response = {"jsonrpc": "2.0", "result": result}
+        self.exchanges.append(
+            {
+                "kind": "eulith" if method.startswith("eulith_") else "rpc",
+                "method": method,
+                "params": params,
+                "response": response,
+                "elapsed_ms": 0,
+            }
+        )
+        return response
+
+    def answer(self, method: str, params):
+        if method == "eth_chainId":
+            return hex(CHAIN_ID)
+        if method == "eth_blockNumber":
+            return hex(BLOCK_NUMBER)
+        if method == "eulith_get_contracts":
+            return {
+                "contracts": [
+                    {
+                        "authorized_address": TRADING_ADDRESS.lower(),
+                        "contract_address": ARMOR,
+                        "safe_address": SAFE,
+                    }
+                ]
+            }
+        if method == "eulith_get_current_client_whitelist":
+            return {
+                "chain_id": CHAIN_ID,
+                "active": {"list_id": 7, "sorted_addresses": sorted([DEST.lower()])},
+                "draft": None,
+            }
+        if method == "eulith_erc_lookup":
+            return [{"contract_address": TOKEN, "decimals": 6}]
+        if method == "eth_getCode":
+            return "0x6080" if params[0].lower() == MULTICALL3_ADDRESS.lower() else "0x"
+        if method == "eth_getBalance":
+            return hex(0)
+        if method == "eth_call":
+            return self.call(params[0]["to"], bytes.fromhex(params[0]["data"][2:]))
+        if method == "eth_estimateGas":
+            return hex(120_000)
+        if method in ("eth_gasPrice", "eth_maxPriorityFeePerGas"):
+            return hex(10**9)
+        if method == "eth_getTransactionCount":
+            return hex(0)
+        if method in ("eth_getBlockByNumber", "eth_getBlockByHash"):
+            return self.block()
+        if method == "eth_sendRawTransaction":
+            h = Web3.keccak(hexstr=params[0]).hex()
+            self.sent[h] = params[0]
+            return h
+        if method == "eth_getTransactionReceipt":
+            return self.receipt(params[0])
+
+        raise ValueError(f"the synthetic chain has no answer for {method}")
+
+    def call(self, to: str, data: bytes) -> str:
+        selector, args = data[:4], data[4:]
+        if (
+            selector
+            == bindings.Function("aggregate3((address,bool,bytes)[])", []).selector
+        ):
+            (calls,) = decode(["(address,bool,bytes)[]"], args)
+            results = [(True, bytes.fromhex(self.call(t, d)[2:])) for t, _, d in calls]
+            return word(["(bool,bytes)[]"], [results])
+        if selector == bindings.ERC20_SYMBOL.selector:
+            return word(["string"], ["USDC"])
+        if selector == bindings.ERC20_DECIMALS.selector:
+            return word(["uint8"], [6])
+        if selector == bindings.ERC20_BALANCE_OF.selector:
+            return word(["uint256"], [1_000 * 10**6])
+        if selector == bindings.SAFE_NONCE.selector:
+            return word(["uint256"], [12])
+        if selector == bindings.SAFE_GET_THRESHOLD.selector:
+            return word(["uint256"], [2])
+        if selector == bindings.SAFE_GET_OWNERS.selector:
+            return word(["address[]"], [OWNERS])
+        if selector == bindings.SAFE_GET_TRANSACTION_HASH.selector:
+            return word(["bytes32"], [Web3.keccak(args)])
+
+        raise ValueError(f"the synthetic chain has no answer for call {data[:4].hex()}")
+
+    def block(self) -> Dict:
+        return {
+            "number": hex(BLOCK_NUMBER),
+            "hash": "0x" + "b1" * 32,
+            "parentHash": "0x" + "b0" * 32,
+            "timestamp": hex(1_700_000_000),
+            "baseFeePerGas": hex(10**9),
+            "gasLimit": hex(30_000_000),
+            "gasUsed": hex(0),
+            "miner": "0x" + "00" * 20,
+            "difficulty": "0x0",
+            "totalDifficulty": "0x0",
+            "extraData": "0x",
+            "logsBloom": "0x" + "00" * 256,
+            "nonce": "0x" + "00" * 8,
+            "mixHash": ZERO_HASH,
+            "receiptsRoot": ZERO_HASH,
+            "sha3Uncles": ZERO_HASH,
+            "stateRoot": ZERO_HASH,
+            "transactionsRoot": ZERO_HASH,
+            "size": "0x0",
+            "transactions": [],
+            "uncles": [],
+        }
+
+    def receipt(self, tx_hash: str) -> Optional[Dict]:
+        return {
+            "transactionHash": tx_hash,
+            "transactionIndex": "0x0",
+            "blockHash": "0x" + "b1" * 32,
+            "blockNumber": hex(BLOCK_NUMBER),
+            "from": LocalSigner(BENCH_PRIVATE_KEY).address,
+            "to": SAFE,
+            "cumulativeGasUsed": hex(100_000),
+            "gasUsed": hex(100_000),
+            "effectiveGasPrice": hex(10**9),
+            "contractAddress": None,
+            "logs": [],
+            "logsBloom": "0x" + "00" * 256,
+            "status": "0x1",
+            "type": "0x2",
+        }
+
+
+def record(name: str, argv: List[str], out_dir: str) -> int:
+    chain = SyntheticChain()
+    wallet = LocalSigner(BENCH_PRIVATE_KEY)
+    args = build_parser().parse_args(argv)
+
+    with ReplayServer(chain, port=0) as server:
+        with EulithWeb3(
+            eulith_url=server.url,
+            eulith_token="bench",
+            signing_middle_ware=construct_signing_middleware(wallet),
+        ) as ew3:
+            with isolated_run():
+                args.func(ew3, wallet, TRADING_ADDRESS, args)
+
+    meta = {
+        "kind": "meta",
+        "argv": argv,
+        "network_type": "dev",
+        "trading_address": TRADING_ADDRESS,
+        "synthetic": True,
+    }
+    with open(os.path.join(out_dir, f"{name}.jsonl"), "w") as f:
+        for entry in [meta] + chain.exchanges:
+            f.write(json.dumps(entry, default=json_default) + "\n")
+
+    return len(chain.exchanges)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", default=CASSETTE_DIR)
+    parser.add_argument("names", nargs="*", default=sorted(CASES))
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for name in args.names:
+        count = record(name, CASES[name], args.out)
+        print(f"{name}: {count} exchanges")
@@ -0,0 +1,273 @@
+"""
+Lightweight bindings for the Safe and ERC20 functions this tool calls most.
+
+The generated ISafe/EulithERC20 bindings build a web3 contract from the full ABI on every
+method call, and EulithERC20 reads `symbol` and `decimals` from the chain each time it is
+constructed. Here each function's selector and argument types are prepared once at import,
+checksummed addresses are memoised, and token metadata is cached per (chain id, address), so
+a binding costs nothing to create and each call is one encode, one eth_call and one decode.
+"""
+
+import threading
+import weakref
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from eth_abi import decode, encode
+from eth_utils import function_signature_to_4byte_selector
+from web3 import Web3
+from web3._utils.transactions import fill_transaction_defaults
+from web3.exceptions import BadFunctionCallOutput
+from web3.types import ChecksumAddress, TxParams
+
+from eulith_web3.eulith_web3 import EulithWeb3
+
+
+class Function:
+    """
+    A prebuilt codec for one contract function, e.g. Function("balanceOf(address)", ["uint256"]).
+    """
+
+    def __init__(self, signature: str, outputs: List[str]):
+        self.signature = signature
+        args = signature[signature.index("(") + 1 : -1]
+        self.inputs = args.split(",") if args else []
+        self.outputs = outputs
+        self.selector = function_signature_to_4byte_selector(signature)
+
+    def encode(self, *args) -> bytes:
+        return self.selector + encode(self.inputs, args)
+
+    def decode(self, raw: bytes):
+        values = [
+            _checksum_output(t, v)
+            for t, v in zip(self.outputs, decode(self.outputs, raw))
+        ]
+        return values[0] if len(values) == 1 else tuple(values)
+
+    def call(self, ew3: EulithWeb3, address: ChecksumAddress, *args):
+        raw = ew3.eth.call({"to": address, "data": Web3.to_hex(self.encode(*args))})
+        if not raw and self.outputs:
+            raise BadFunctionCallOutput(
+                f"Could not decode {self.signature} returned from {address}: "
+                f"is it a contract on this chain?"
+            )
+        return self.decode(raw)
+
+    def build_transaction(
+        self,
+        ew3: EulithWeb3,
+        address: ChecksumAddress,
+        args: Tuple,
+        override_tx_parameters: Optional[TxParams] = None,
+    ) -> TxParams:
+        # The same defaults web3's ContractFunction.build_transaction fills in
+        tx = dict(override_tx_parameters or {})
+        tx.setdefault("to", address)
+        tx["data"] = Web3.to_hex(self.encode(*args))
+        return fill_transaction_defaults(ew3, tx)
+
+
+def _checksum_output(abi_type: str, value):
+    if abi_type == "address":
+        return checksum(value)
+    if abi_type == "address[]":
+        return [checksum(v) for v in value]
+    return value
+
+
+SAFE_NONCE = Function("nonce()", ["uint256"])
+SAFE_GET_THRESHOLD = Function("getThreshold()", ["uint256"])
+SAFE_GET_OWNERS = Function("getOwners()", ["address[]"])
+SAFE_IS_OWNER = Function("isOwner(address)", ["bool"])
+SAFE_IS_MODULE_ENABLED = Function("isModuleEnabled(address)", ["bool"])
+SAFE_ENABLE_MODULE = Function("enableModule(address)", [])
+SAFE_GET_TRANSACTION_HASH = Function(
+    "getTransactionHash(address,uint256,bytes,uint8,uint256,uint256,uint256,address,address,uint256)",
+    ["bytes32"],
+)
+SAFE_APPROVE_HASH = Function("approveHash(bytes32)", [])
+SAFE_EXEC_TRANSACTION = Function(
+    "execTransaction(address,uint256,bytes,uint8,uint256,uint256,uint256,address,address,bytes)",
+    ["bool"],
+)
+
+ERC20_SYMBOL = Function("symbol()", ["string"])
+ERC20_DECIMALS = Function("decimals()", ["uint8"])
+ERC20_BALANCE_OF = Function("balanceOf(address)", ["uint256"])
+ERC20_TRANSFER = Function("transfer(address,uint256)", ["bool"])
+
+
+class SafeBinding:
+    """
+    The ISafe methods used by this tool, with the same names and arguments.
+    """
+
+    def __init__(self, ew3: EulithWeb3, address: ChecksumAddress):
+        self.ew3 = ew3
+        self.address = address
+
+    def nonce(self) -> int:
+        return SAFE_NONCE.call(self.ew3, self.address)
+
+    def get_threshold(self) -> int:
+        return SAFE_GET_THRESHOLD.call(self.ew3, self.address)
+
+    def get_owners(self) -> List[ChecksumAddress]:
+        return SAFE_GET_OWNERS.call(self.ew3, self.address)
+
+    def is_owner(self, owner: str) -> bool:
+        return SAFE_IS_OWNER.call(self.ew3, self.address, owner)
+
+    def is_module_enabled(self, module: str) -> bool:
+        return SAFE_IS_MODULE_ENABLED.call(self.ew3, self.address, module)
+
+    def enable_module_data(self, module: str) -> bytes:
+        """
+        Call data of enableModule(module), as the Safe executes it on itself.
+        """
+        return SAFE_ENABLE_MODULE.encode(module)
+
+    def get_transaction_hash(
+        self,
+        to: str,
+        value: int,
+        data: bytes,
+        operation: int,
+        safe_tx_gas: int,
+        base_gas: int,
+        gas_price: int,
+        gas_token: str,
+        refund_receiver: str,
+        _nonce: int,
+    ) -> bytes:
+        return SAFE_GET_TRANSACTION_HASH.call(
+            self.ew3,
+            self.address,
+            to,
+            value,
+            bytes(data),
+            operation,
+            safe_tx_gas,
+            base_gas,
+            gas_price,
+            gas_token,
+            refund_receiver,
+            _nonce,
+        )
+
+    def approve_hash(
+        self, hash_to_approve: bytes, override_tx_parameters: Optional[TxParams] = None
+    ) -> TxParams:
+        return SAFE_APPROVE_HASH.build_transaction(
+            self.ew3, self.address, (bytes(hash_to_approve),), override_tx_parameters
+        )
+
+    def exec_transaction(
+        self,
+        to: str,
+        value: int,
+        data: bytes,
+        operation: int,
+        safe_tx_gas: int,
+        base_gas: int,
+        gas_price: int,
+        gas_token: str,
+        refund_receiver: str,
+        signatures: bytes,
+        override_tx_parameters: Optional[TxParams] = None,
+    ) -> TxParams:
+        args = (
+            to,
+            value,
+            bytes(data),
+            operation,
+            safe_tx_gas,
+            base_gas,
+            gas_price,
+            gas_token,
+            refund_receiver,
+            bytes(signatures),
+        )
+        return SAFE_EXEC_TRANSACTION.build_transaction(
+            self.ew3, self.address, args, override_tx_parameters
+        )
+
+
+class Erc20Binding:
+    """
+    The EulithERC20 attributes and reads used by this tool; `symbol` and `decimals` come from
+    the cache instead of the chain.
+    """
+
+    def __init__(
+        self, ew3: EulithWeb3, address: ChecksumAddress, symbol: str, decimals: int
+    ):
+        self.ew3 = ew3
+        self.address = address
+        self.symbol = symbol
+        self.decimals = decimals
+
+    def balance_of(self, account: str) -> int:
+        return ERC20_BALANCE_OF.call(self.ew3, self.address, account)
+
+    def balance_of_float(self, account: str) -> float:
+        return self.balance_of(account) / 10**self.decimals
+
+    def transfer_data_float(self, to: str, whole_token_as_float: float) -> bytes:
+        """
+        Call data of transfer(to, amount), with the amount scaled like EulithERC20.transfer_float.
+        """
+        return ERC20_TRANSFER.encode(to, int(whole_token_as_float * 10**self.decimals))
+
+
+_lock = threading.Lock()
+_chain_ids = weakref.WeakKeyDictionary()
+_token_metadata: Dict[Tuple[int, ChecksumAddress], Tuple[str, int]] = {}
+
+
+@lru_cache(maxsize=4096)
+def checksum(address: str) -> ChecksumAddress:
+    return Web3.to_checksum_address(address)
+
+
+def get_chain_id(ew3: EulithWeb3) -> int:
+    """
+    The chain id of a connection, read from the chain once per connection.
+    """
+    with _lock:
+        chain_id = _chain_ids.get(ew3)
+    if chain_id is None:
+        chain_id = ew3.eth.chain_id
+        with _lock:
+            _chain_ids[ew3] = chain_id
+
+    return chain_id
+
+
+def get_safe(ew3: EulithWeb3, address: str) -> SafeBinding:
+    return SafeBinding(ew3, checksum(address))
+
+
+def get_erc20(ew3: EulithWeb3, address: str) -> Erc20Binding:
+    address = checksum(address)
+    key = (get_chain_id(ew3), address)
+
+    with _lock:
+        metadata = _token_metadata.get(key)
+    if metadata is None:
+        metadata = (
+            ERC20_SYMBOL.call(ew3, address),
+            ERC20_DECIMALS.call(ew3, address),
+        )
+        with _lock:
+            _token_metadata[key] = metadata
+
+    return Erc20Binding(ew3, address, *metadata)
+
+
+def clear_cache():
+    with _lock:
+        _chain_ids.clear()
+        _token_metadata.clear()
+    checksum.cache_clear()
@@ -0,0 +1,179 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from eth_keys.backends import NativeECCBackend
+from eth_keys.datatypes import PrivateKey, Signature
+from hexbytes import HexBytes
+
+from eulith_web3.eulith_web3 import EulithWeb3
+from eulith_web3.exceptions import EulithRpcException
+from eulith_web3.signer import Signer
+from eulith_web3.whitelists import get_client_whitelist_typed_data
+
+from bindings import get_chain_id, get_safe
+from safe_utils import NULL_ADDRESS, get_safe_tx_typed_data
+
+# Below this many digests the cost of spawning workers outweighs the signing itself
+MIN_PARALLEL_BATCH = 32
+
+
+def _sign_chunk(chunk: List[Tuple[str, bytes]]) -> List[bytes]:
+    # Runs in a worker process. Keys repeat a lot (one owner signs many digests), so we
+    # only derive each private key once per chunk.
+    keys = {}
+    out = []
+    for key, digest in chunk:
+        pk = keys.get(key)
+        if pk is None:
+            pk = PrivateKey(HexBytes(key), NativeECCBackend)
+            keys[key] = pk
+        out.append(pk.sign_msg_hash(digest).to_bytes())
+
+    return out
+
+
+def _chunk(items: List, n_chunks: int) -> List[List]:
+    size = max(1, -(-len(items) // n_chunks))
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def sign_digests(
+    pairs: Sequence[Tuple[str, bytes]],
+    processes: Optional[int] = None,
+    chunks_per_process: int = 4,
+) -> List[Signature]:
+    """
+    Sign many (private key, 32 byte digest) pairs, sharding the work across a process pool.
+
+    Signing with local keys is pure-Python secp256k1 and CPU bound, so threads don't help here.
+    Small batches are signed in-process.
+
+    :return: Signatures in the same order as `pairs`
+    """
+    pairs = [(HexBytes(k).hex(), bytes(d)) for k, d in pairs]
+    for _, d in pairs:
+        if len(d) != 32:
+            raise ValueError(f"digest must be 32 bytes, got {len(d)}")
+
+    processes = processes or os.cpu_count() or 1
+
+    if processes == 1 or len(pairs) < MIN_PARALLEL_BATCH:
+        raw = _sign_chunk(pairs)
+    else:
+        chunks = _chunk(pairs, processes * chunks_per_process)
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            raw = [sig for part in pool.map(_sign_chunk, chunks) for sig in part]
+
+    return [Signature(signature_bytes=s) for s in raw]
+
+
+class PresignedSigner(Signer):
+    """
+    A signer that hands back signatures produced ahead of time (e.g. by `sign_digests`).
+
+    Lets bulk-signed results be fed into `submit_enable_module_signature` and
+    `submit_draft_client_whitelist_signature`, which expect a Signer.
+    """
+
+    def __init__(self, address: str, signatures: Dict[bytes, Signature]):
+        self.address = address
+        self.signatures = {bytes(k): v for k, v in signatures.items()}
+
+    def sign_msg_hash(self, message_hash: bytes) -> Signature:
+        sig = self.signatures.get(bytes(message_hash))
+        if sig is None:
+            raise ValueError(
+                f"no presigned signature for hash 0x{bytes(message_hash).hex()} from {self.address}"
+            )
+
+        return sig
+
+
+def address_of(private_key: str) -> str:
+    return PrivateKey(
+        HexBytes(private_key), NativeECCBackend
+    ).public_key.to_checksum_address()
+
+
+def get_enable_module_payload(ew3: EulithWeb3, auth_address: str) -> Tuple[bytes, Dict]:
+    """
+    Computes the Safe hash that owners sign to enable the Armor module, the same way
+    `submit_enable_module_signature` does internally, along with its EIP-712 typed data.
+
+    :return: The 32 byte Safe transaction hash and the typed data for it
+    """
+    aa, sa = ew3.v0.get_armor_and_safe_addresses(auth_address)
+    safe_address = ew3.to_checksum_address(sa)
+    safe = get_safe(ew3, safe_address)
+
+    data = safe.enable_module_data(ew3.to_checksum_address(aa))
+    nonce = safe.nonce()
+
+    digest = bytes(
+        safe.get_transaction_hash(
+            safe_address,
+            0,
+            data,
+            0,
+            0,
+            0,
+            0,
+            NULL_ADDRESS,
+            NULL_ADDRESS,
+            nonce,
+        )
+    )
+
+    return digest, get_safe_tx_typed_data(
+        safe_address, get_chain_id(ew3), safe_address, 0, HexBytes(data), nonce
+    )
+
+
+def get_enable_module_hash(ew3: EulithWeb3, auth_address: str) -> bytes:
+    return get_enable_module_payload(ew3, auth_address)[0]
+
+
+def get_whitelist_payload(ew3: EulithWeb3, list_id: int) -> Tuple[bytes, Dict]:
+    """
+    :return: The hash owners sign to enable a draft whitelist, and its EIP-712 typed data
+    """
+    hsh, error = ew3.eulith_service.get_draft_client_whitelist_hash(list_id)
+    if error:
+        raise EulithRpcException(error)
+
+    return bytes(HexBytes(hsh["hash"])), get_client_whitelist_typed_data(
+        hsh["hash_input"]
+    )
+
+
+def get_whitelist_hash(ew3: EulithWeb3, list_id: int) -> bytes:
+    return get_whitelist_payload(ew3, list_id)[0]
+
+
+def bulk_submit_enable_module_signatures(
+    ew3: EulithWeb3, auth_address: str, private_keys: List[str], processes=None
+) -> List[bool]:
+    digest = get_enable_module_hash(ew3, auth_address)
+    signatures = sign_digests([(k, digest) for k in private_keys], processes)
+
+    return [
+        ew3.v0.submit_enable_module_signature(
+            auth_address, PresignedSigner(address_of(k), {digest: s})
+        )
+        for k, s in zip(private_keys, signatures)
+    ]
+
+
+def bulk_submit_whitelist_signatures(
+    ew3: EulithWeb3, list_id: int, private_keys: List[str], processes=None
+) -> List[bool]:
+    digest = get_whitelist_hash(ew3, list_id)
+    signatures = sign_digests([(k, digest) for k in private_keys], processes)
+
+    return [
+        ew3.v0.submit_draft_client_whitelist_signature(
+            list_id, PresignedSigner(address_of(k), {digest: s})
+        )
+        for k, s in zip(private_keys, signatures)
+    ]
@@ -0,0 +1,392 @@
+import json
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from web3 import Web3
+
+from eulith_web3.eulith_web3 import EulithWeb3
+
+from local_store import LocalStore
+
+KIND_APPROVE = "approve"
+KIND_EXECUTION_SUCCESS = "execution-success"
+KIND_EXECUTION_FAILURE = "execution-failure"
+KIND_MODULE_SUCCESS = "module-success"
+KIND_MODULE_FAILURE = "module-failure"
+KIND_MODULE_TRANSACTION = "module-transaction"
+KIND_TRANSFER_IN = "transfer-in"
+KIND_TRANSFER_OUT = "transfer-out"
+EVENT_KINDS = [
+    KIND_APPROVE,
+    KIND_EXECUTION_SUCCESS,
+    KIND_EXECUTION_FAILURE,
+    KIND_MODULE_SUCCESS,
+    KIND_MODULE_FAILURE,
+    KIND_MODULE_TRANSACTION,
+    KIND_TRANSFER_IN,
+    KIND_TRANSFER_OUT,
+]
+
+SAFE_EVENT_SIGNATURES = {
+    "ApproveHash(bytes32,address)": KIND_APPROVE,
+    "ExecutionSuccess(bytes32,uint256)": KIND_EXECUTION_SUCCESS,
+    "ExecutionFailure(bytes32,uint256)": KIND_EXECUTION_FAILURE,
+    "ExecutionFromModuleSuccess(address)": KIND_MODULE_SUCCESS,
+    "ExecutionFromModuleFailure(address)": KIND_MODULE_FAILURE,
+    # Only emitted by SafeL2
+    "SafeModuleTransaction(address,address,uint256,bytes,uint8)": KIND_MODULE_TRANSACTION,
+}
+SAFE_EVENT_TOPICS = {
+    Web3.keccak(text=sig).hex(): kind for sig, kind in SAFE_EVENT_SIGNATURES.items()
+}
+TRANSFER_TOPIC = Web3.keccak(text="Transfer(address,address,uint256)").hex()
+
+DEFAULT_CHUNK_BLOCKS = 2000
+MAX_CHUNK_BLOCKS = 100_000
+# Grow the range again only while chunks come back this small
+GROW_BELOW_LOGS = 1000
+
+# What providers say when an eth_getLogs range is too big or returns too much
+RANGE_ERROR_MARKERS = (
+    "range",
+    "too many",
+    "more than",
+    "limit",
+    "exceed",
+    "timeout",
+    "timed out",
+    "response size",
+)
+
+
+def is_range_error(e: Exception) -> bool:
+    text = str(e).lower()
+    return any(m in text for m in RANGE_ERROR_MARKERS)
+
+
+def topic_address(topic) -> str:
+    return "0x" + bytes(topic)[-20:].hex()
+
+
+def address_topic(address: str) -> str:
+    return "0x" + "00" * 12 + address.lower()[2:]
+
+
+class AdaptiveChunk:
+    """
+    Block range size for eth_getLogs: halved when the endpoint rejects a range, doubled again
+    while results stay small.
+    """
+
+    def __init__(self, size=DEFAULT_CHUNK_BLOCKS, minimum=1, maximum=MAX_CHUNK_BLOCKS):
+        self.size = size
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def shrink(self) -> bool:
+        if self.size <= self.minimum:
+            return False
+        self.size = max(self.minimum, self.size // 2)
+        return True
+
+    def grow(self):
+        self.size = min(self.maximum, self.size * 2)
+
+
+def decode_log(ew3: EulithWeb3, chain_id: int, log, safes: List[str]) -> List[Dict]:
+    topics = log["topics"]
+    topic0 = topics[0].hex() if topics else None
+    base = {
+        "chain_id": chain_id,
+        "block_number": log["blockNumber"],
+        "tx_hash": log["transactionHash"].hex().lower(),
+        "log_index": log["logIndex"],
+    }
+    data = bytes(log["data"])
+
+    if topic0 == TRANSFER_TOPIC:
+        # ERC721 transfers have the token id as a fourth topic; skip them
+        if len(topics) != 3 or len(data) < 32:
+            return []
+        sender, receiver = topic_address(topics[1]), topic_address(topics[2])
+        amount = str(int.from_bytes(data[:32], "big"))
+        token = log["address"].lower()
+        rows = []
+        for safe, kind in ((sender, KIND_TRANSFER_OUT), (receiver, KIND_TRANSFER_IN)):
+            if safe in safes:
+                rows.append(
+                    dict(
+                        base,
+                        safe=safe,
+                        kind=kind,
+                        token=token,
+                        from_address=sender,
+                        to_address=receiver,
+                        amount=amount,
+                    )
+                )
+        return rows
+
+    kind = SAFE_EVENT_TOPICS.get(topic0)
+    if kind is None:
+        return []
+
+    row = dict(base, safe=log["address"].lower(), kind=kind)
+    if kind == KIND_APPROVE:
+        row["safe_tx_hash"] = "0x" + bytes(topics[1]).hex()
+        row["owner"] = topic_address(topics[2])
+    elif kind in (KIND_EXECUTION_SUCCESS, KIND_EXECUTION_FAILURE):
+        if len(topics) > 1:
+            # Safe 1.4 indexes the hash
+            row["safe_tx_hash"] = "0x" + bytes(topics[1]).hex()
+            row["amount"] = str(int.from_bytes(data[:32], "big"))
+        else:
+            row["safe_tx_hash"] = "0x" + data[:32].hex()
+            row["amount"] = str(int.from_bytes(data[32:64], "big"))
+    elif kind in (KIND_MODULE_SUCCESS, KIND_MODULE_FAILURE):
+        row["module"] = topic_address(topics[1])
+    elif kind == KIND_MODULE_TRANSACTION:
+        module, to, value, _, _ = ew3.codec.decode(
+            ["address", "address", "uint256", "bytes", "uint8"], data
+        )
+        row.update(module=module.lower(), to_address=to.lower(), amount=str(value))
+
+    return [row]
+
+
+def get_logs_for_range(
+    ew3: EulithWeb3, safes: List[str], from_block: int, to_block: int
+) -> List:
+    safe_topics = [address_topic(s) for s in safes]
+    span = {"fromBlock": from_block, "toBlock": to_block}
+
+    logs = ew3.eth.get_logs(
+        dict(
+            span,
+            address=[Web3.to_checksum_address(s) for s in safes],
+            topics=[list(SAFE_EVENT_TOPICS)],
+        )
+    )
+    logs += ew3.eth.get_logs(dict(span, topics=[TRANSFER_TOPIC, safe_topics]))
+    logs += ew3.eth.get_logs(dict(span, topics=[TRANSFER_TOPIC, None, safe_topics]))
+    return logs
+
+
+def find_deployment_block(ew3: EulithWeb3, address: str, head: int) -> int:
+    """
+    Binary search for the first block where `address` has code. Needs an archive node.
+    """
+    address = Web3.to_checksum_address(address)
+    lo, hi = 0, head
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if len(ew3.eth.get_code(address, mid)) > 0:
+            hi = mid
+        else:
+            lo = mid + 1
+
+    return lo
+
+
+def index_safes(
+    ew3: EulithWeb3,
+    store: LocalStore,
+    safes: List[str],
+    from_block: Optional[int],
+    confirmations: int,
+    chunk: AdaptiveChunk,
+) -> int:
+    """
+    Scans from the earliest checkpoint of `safes` to `confirmations` blocks below the head,
+    saving every chunk with its checkpoint. Returns the number of new events stored.
+    """
+    chain_id = ew3.eth.chain_id
+    head = ew3.eth.block_number - confirmations
+    safes = [s.lower() for s in safes]
+
+    starts = []
+    for safe in safes:
+        start = store.get_checkpoint(chain_id, safe)
+        if start is None:
+            start = (
+                from_block
+                if from_block is not None
+                else find_deployment_block(ew3, safe, head)
+            )
+        starts.append(start)
+
+    start = min(starts)
+    total = 0
+    while start <= head:
+        end = min(head, start + chunk.size - 1)
+        try:
+            logs = get_logs_for_range(ew3, safes, start, end)
+        except Exception as e:
+            if is_range_error(e) and chunk.shrink():
+                continue
+            raise
+
+        events = [row for log in logs for row in decode_log(ew3, chain_id, log, safes)]
+        block_times = {
+            n: ew3.eth.get_block(n)["timestamp"]
+            for n in sorted({e["block_number"] for e in events})
+        }
+        total += store.save_chunk(chain_id, safes, end + 1, events, block_times)
+
+        print(
+            f"Indexed blocks {start}-{end} ({len(events)} events, chunk {chunk.size})",
+            file=sys.stderr,
+        )
+        if len(logs) < GROW_BELOW_LOGS:
+            chunk.grow()
+        start = end + 1
+
+    return total
+
+
+def handle_index(ew3, wallet, auth_address, args):
+    with LocalStore() as store:
+        chain_id = ew3.eth.chain_id
+
+        safes = [s.lower() for s in args.safe or []]
+        if not safes:
+            safes = store.known_safes(chain_id)
+            if auth_address:
+                _, safe = ew3.v0.get_armor_and_safe_addresses(auth_address)
+                if safe and safe.lower() not in safes:
+                    safes.append(safe.lower())
+        if not safes:
+            print("No safes to index; pass --safe or set EULITH_TRADING_ADDRESS")
+            exit(1)
+
+        try:
+            total = index_safes(
+                ew3,
+                store,
+                safes,
+                args.from_block,
+                args.confirmations,
+                AdaptiveChunk(args.chunk_blocks),
+            )
+        except ValueError as e:
+            if args.from_block is None and "missing trie node" in str(e):
+                print(
+                    "This endpoint can't look up old contract code; pass --from-block"
+                )
+                exit(1)
+            raise
+
+        print(f"Indexed {total} new events for {len(safes)} safe(s) into {store.path}")
+
+
+def parse_since(value: str) -> float:
+    """
+    `7d`, `12h`, `30m` or an ISO date such as 2024-01-31.
+    """
+    match = re.fullmatch(r"(\d+)([dhm])", value)
+    if match:
+        n, unit = int(match.group(1)), match.group(2)
+        return time.time() - n * {"d": 86400, "h": 3600, "m": 60}[unit]
+
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def format_time(timestamp: Optional[int]) -> str:
+    if timestamp is None:
+        return "-"
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d %H:%M")
+
+
+# What safe-approve-hash and execute-safe-transfer record, by the event kinds they lead to
+ACTION_KINDS = {
+    "approve": [KIND_APPROVE],
+    "execute": [KIND_EXECUTION_SUCCESS, KIND_EXECUTION_FAILURE],
+}
+
+
+def history_chain_id(
+    ew3: EulithWeb3, store: LocalStore, chain_id: Optional[int]
+) -> int:
+    """
+    --chain-id if given, otherwise the only chain in the store; the connection is asked
+    only when the store holds several.
+    """
+    if chain_id:
+        return chain_id
+
+    chains = store.known_chains()
+    if len(chains) == 1:
+        return chains[0]
+
+    return ew3.eth.chain_id
+
+
+def handle_history(ew3, wallet, auth_address, args):
+    since = parse_since(args.since) if args.since else None
+    action_kinds = [
+        a for a, kinds in ACTION_KINDS.items() if set(kinds) & set(args.kind or kinds)
+    ]
+
+    with LocalStore() as store:
+        chain_id = history_chain_id(ew3, store, args.chain_id)
+        rows = store.query_events(
+            chain_id,
+            safe=args.safe,
+            owner=args.owner,
+            kinds=args.kind,
+            since=since,
+            limit=args.limit,
+        )
+        actions = (
+            store.query_actions(
+                chain_id,
+                safe=args.safe,
+                sender=args.owner,
+                kinds=action_kinds,
+                since=since,
+                limit=args.limit,
+            )
+            if action_kinds
+            else []
+        )
+
+    if args.json:
+        for r in rows:
+            print(json.dumps(dict(r, record="event")))
+        for a in actions:
+            print(json.dumps(dict(a, record="action")))
+        return
+
+    if not rows:
+        print("No indexed events match; run `index` first to pick up new ones.")
+    else:
+        print(f"{'time (UTC)':<18}{'block':>10}  {'kind':<20}{'safe':<44}details")
+    for r in rows:
+        if r["kind"] == KIND_APPROVE:
+            details = f"{r['owner']} approved {r['safe_tx_hash']}"
+        elif r["kind"] in (KIND_EXECUTION_SUCCESS, KIND_EXECUTION_FAILURE):
+            details = f"{r['safe_tx_hash']} in {r['tx_hash']}"
+        elif r["kind"] in (KIND_TRANSFER_IN, KIND_TRANSFER_OUT):
+            details = f"{r['amount']} of {r['token']} {r['from_address']} -> {r['to_address']}"
+        else:
+            details = f"module {r['module']} in {r['tx_hash']}"
+        print(
+            f"{format_time(r['timestamp']):<18}{r['block_number']:>10}  "
+            f"{r['kind']:<20}{r['safe']:<44}{details}"
+        )
+
+    if actions:
+        print("\nSent from this machine:")
+        print(f"{'time (UTC)':<18}{'kind':<10}{'safe':<44}{'sender':<44}details")
+        for a in actions:
+            details = f"{a['safe_tx_hash'] or '-'} in {a['tx_hash']}"
+            print(
+                f"{format_time(int(a['created_at'])):<18}{a['kind']:<10}{a['safe']:<44}"
+                f"{a['sender'] or '-':<44}{details}"
+            )
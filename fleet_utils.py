@@ -0,0 +1,484 @@
+import csv
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from web3 import Web3
+
+from eulith_web3.eulith_web3 import EulithWeb3
+from eulith_web3.exceptions import EulithRpcException
+
+from bindings import get_chain_id, get_safe
+from local_store import LocalStore
+from providers import install_failover
+
+STAGE_DEPLOY = "deploy"
+STAGE_OWNER_SIGNATURES = "owner-signatures"
+STAGE_ENABLE = "enable"
+STAGE_SUBMIT_SETUP_SAFE = "submit-setup-safe"
+STAGE_DONE = "done"
+
+DEFAULT_DEPLOY_GAS = 2500000
+DEFAULT_ENABLE_GAS = 500000
+
+
+def load_manifest(path: str) -> Dict:
+    """
+    Load a fleet manifest. YAML needs PyYAML installed; JSON works out of the box.
+
+    Example (YAML):
+
+        defaults:
+          threshold: 2
+          owners: [0x001..., 0x002..., 0x003...]
+        trading_keys:
+          - address: 0xabc...
+          - address: 0xdef...
+            threshold: 1
+            owners: [0x004...]
+    """
+    with open(path) as f:
+        raw = f.read()
+
+    if path.endswith(".json"):
+        manifest = json.loads(raw)
+    else:
+        try:
+            import yaml
+        except ImportError:
+            print("Reading a YAML manifest requires PyYAML: pip install pyyaml")
+            exit(1)
+        manifest = yaml.safe_load(raw)
+
+    if not isinstance(manifest, dict) or not manifest.get("trading_keys"):
+        print(f"Manifest {path} must contain a non-empty `trading_keys` list")
+        exit(1)
+
+    # Two entries for one key would provision it twice, concurrently, with whichever
+    # settings finish last
+    seen = set()
+    for i, e in enumerate(manifest["trading_keys"]):
+        address = e if isinstance(e, str) else (e or {}).get("address")
+        if not isinstance(address, str) or not Web3.is_address(address):
+            print(f"Manifest {path}: trading key #{i + 1} has no valid `address`")
+            exit(1)
+        address = address.lower()
+        if address in seen:
+            print(f"Manifest {path} lists trading key {address} more than once")
+            exit(1)
+        seen.add(address)
+
+    return manifest
+
+
+def manifest_entries(manifest: Dict) -> List[Dict]:
+    defaults = manifest.get("defaults") or {}
+    entries = []
+    for e in manifest["trading_keys"]:
+        if isinstance(e, str):
+            e = {"address": e}
+        entries.append({**defaults, **e})
+
+    return entries
+
+
+class NonceAllocator:
+    """
+    Hands out consecutive nonces for the deployer so that transactions for many keys can be
+    in flight at once instead of waiting for each one to be mined.
+
+    Sends happen while holding the lock, which keeps nonces reaching the node in order and
+    serializes hardware wallet prompts.
+    """
+
+    def __init__(self, ew3: EulithWeb3, address: str):
+        self.ew3 = ew3
+        self.address = address
+        self.lock = threading.Lock()
+        self.next_nonce = None
+
+    def send(self, tx) -> str:
+        with self.lock:
+            if self.next_nonce is None:
+                self.next_nonce = self.ew3.eth.get_transaction_count(
+                    self.address, "pending"
+                )
+            tx["nonce"] = self.next_nonce
+            h = self.ew3.eth.send_transaction(tx)
+            self.next_nonce += 1
+
+        return h.hex()
+
+
+def wait_for_success(ew3: EulithWeb3, tx_hash: str):
+    receipt = ew3.wait_for_transaction_receipt_with_confirmations(
+        tx_hash, confirmations=ew3.default_confirmations
+    )
+    if receipt.get("status") != 1:
+        raise EulithRpcException(f"transaction {tx_hash} reverted")
+
+    return receipt
+
+
+class ProvisionResult:
+    def __init__(self, trading_address: str):
+        self.trading_address = trading_address
+        self.stage = STAGE_DEPLOY
+        self.armor_address = ""
+        self.safe_address = ""
+        self.tx_hashes = {}
+        self.detail = ""
+        self.failed = False
+
+    def advance(self, stage: str, detail: str = ""):
+        self.stage = stage
+        self.detail = detail
+        print(f"[{self.trading_address}] {stage} {detail}".rstrip())
+
+
+def provision_one(
+    ew3: EulithWeb3,
+    nonces: NonceAllocator,
+    entry: Dict,
+    result: ProvisionResult,
+    journal,
+):
+    """
+    Takes one trading key as far through setup as it can go. `journal` is the key's
+    setup_journal.SetupJournal; the enable transaction and the submit-setup-safe outcome are
+    recorded there, so a later run can retry a submission that failed after Armor was enabled.
+    """
+    from setup_journal import STATUS_DONE, STATUS_SENT
+
+    auth_address = result.trading_address
+    owners = [ew3.to_checksum_address(o) for o in entry.get("owners") or []]
+    threshold = int(entry.get("threshold") or 0)
+    existing_safe = entry.get("existing_safe")
+    if existing_safe:
+        existing_safe = ew3.to_checksum_address(existing_safe)
+
+    if not owners or threshold < 1 or threshold > len(owners):
+        raise ValueError(
+            f"need at least one owner and 1 <= threshold <= {len(owners)} owners"
+        )
+
+    # deploy -- skipped if the key already has an Armor, so re-running a manifest is safe
+    aa, sa = ew3.v0.get_armor_and_safe_addresses(auth_address)
+    if not aa:
+        deploy_tx = ew3.v0.get_armor_deploy_tx(auth_address, existing_safe is None)
+        deploy_tx.update(
+            {
+                "from": nonces.address,
+                "gas": int(entry.get("gas") or DEFAULT_DEPLOY_GAS),
+            }
+        )
+        h = nonces.send(deploy_tx)
+        result.tx_hashes[STAGE_DEPLOY] = h
+        result.advance(STAGE_DEPLOY, f"sent {h}")
+        wait_for_success(ew3, h)
+
+        if not ew3.eulith_service.submit_new_armor_hash(h, existing_safe):
+            raise EulithRpcException("failed to submit new armor tx hash")
+
+        aa, sa = ew3.v0.get_armor_and_safe_addresses(auth_address)
+
+    result.armor_address, result.safe_address = aa, sa
+
+    safe = get_safe(ew3, sa)
+    if safe.is_module_enabled(ew3.to_checksum_address(aa)):
+        h = journal.tx_hash(STAGE_ENABLE)
+        if h and journal.status(STAGE_SUBMIT_SETUP_SAFE) != STATUS_DONE:
+            # Enabled by an earlier run whose submit-setup-safe didn't go through
+            result.tx_hashes[STAGE_ENABLE] = h
+            submit_setup_safe(ew3, entry, result, journal, h)
+        else:
+            result.advance(STAGE_DONE, "armor already enabled")
+        return
+
+    # owner signatures -- these come from the owners themselves (sign-armor-as-owner)
+    signatures, error = ew3.eulith_service.get_accepted_enable_armor_signatures(
+        auth_address
+    )
+    if error:
+        raise EulithRpcException(error)
+    # Only signatures from the manifest's owners count towards its threshold
+    wanted = {o.lower() for o in owners}
+    signed = {s["owner_address"].lower() for s in signatures} & wanted
+    if len(signed) < threshold:
+        ignored = len(signatures) - len(signed)
+        result.advance(
+            STAGE_OWNER_SIGNATURES,
+            f"waiting on owners: {len(signed)}/{threshold} signatures"
+            + (f" ({ignored} from addresses not in owners ignored)" if ignored else ""),
+        )
+        return
+
+    # enable
+    status, enable_tx = ew3.eulith_service.get_enable_safe_tx(
+        auth_address, threshold, owners
+    )
+    if not status:
+        raise EulithRpcException(enable_tx)
+
+    enable_tx.update(
+        {
+            "from": nonces.address,
+            "gas": int(entry.get("enable_gas") or DEFAULT_ENABLE_GAS),
+        }
+    )
+    h = nonces.send(enable_tx)
+    journal.record(STAGE_ENABLE, STATUS_SENT, tx_hash=h)
+    result.tx_hashes[STAGE_ENABLE] = h
+    result.advance(STAGE_ENABLE, f"sent {h}")
+    wait_for_success(ew3, h)
+    journal.record(STAGE_ENABLE, STATUS_DONE, result={})
+
+    submit_setup_safe(ew3, entry, result, journal, h)
+
+
+def submit_setup_safe(
+    ew3: EulithWeb3, entry: Dict, result: ProvisionResult, journal, enable_tx_hash: str
+):
+    from setup_journal import STATUS_DONE, STATUS_WAITING
+
+    status, error = ew3.eulith_service.submit_enable_safe_tx_hash(
+        enable_tx_hash, has_ace=bool(entry.get("has_ace", False))
+    )
+    if error:
+        raise EulithRpcException(error)
+    if not status:
+        journal.record(STAGE_SUBMIT_SETUP_SAFE, STATUS_WAITING)
+        result.advance(STAGE_SUBMIT_SETUP_SAFE, "setup safe hash was not accepted")
+        return
+
+    journal.record(STAGE_SUBMIT_SETUP_SAFE, STATUS_DONE, result={})
+    result.advance(STAGE_DONE)
+
+
+def provision_fleet(
+    ew3: EulithWeb3, deployer: str, entries: List[Dict], concurrency: int = 4
+) -> List[ProvisionResult]:
+    nonces = NonceAllocator(ew3, deployer)
+    results = [ProvisionResult(ew3.to_checksum_address(e["address"])) for e in entries]
+
+    from setup_journal import SetupJournal
+
+    chain_id = get_chain_id(ew3)
+
+    def run(entry, result):
+        try:
+            # Each key gets its own store connection rather than sharing one across the pool
+            with LocalStore() as store:
+                journal = SetupJournal(store, chain_id, result.trading_address)
+                provision_one(ew3, nonces, entry, result, journal)
+        except Exception as e:
+            result.failed = True
+            result.detail = str(e)
+            print(f"[{result.trading_address}] failed at {result.stage}: {e}")
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for f in [pool.submit(run, e, r) for e, r in zip(entries, results)]:
+            f.result()
+
+    return results
+
+
+def print_provision_summary(results: List[ProvisionResult]):
+    print("\n~~ SUMMARY ~~")
+    for r in results:
+        state = "FAILED at " + r.stage if r.failed else r.stage
+        print(f"{r.trading_address}  {state:<28} safe={r.safe_address or '-'}")
+        if r.detail:
+            print(f"    {r.detail}")
+
+
+def handle_provision(ew3, wallet, auth_address, args):
+    entries = manifest_entries(load_manifest(args.manifest))
+
+    print(
+        f"About to provision Armor for {len(entries)} trading keys from {wallet.address}."
+    )
+    print(
+        "Each new deployment is expensive (potentially 0.3 ETH or more on mainnet depending on gas price)."
+    )
+    input("\nPlease hit ENTER to proceed...\n")
+
+    results = provision_fleet(ew3, wallet.address, entries, args.concurrency)
+    print_provision_summary(results)
+
+    if any(r.failed for r in results):
+        exit(1)
+
+
+AUDIT_FIELDS = [
+    "network",
+    "chain_id",
+    "trading_address",
+    "armor_address",
+    "safe_address",
+    "owners",
+    "threshold",
+    "module_enabled",
+    "whitelist_active",
+    "whitelist_draft",
+    "error",
+    "drift",
+]
+
+
+def whitelist_addresses(whitelist) -> Optional[List[str]]:
+    if not whitelist:
+        return None
+
+    return sorted(a.lower() for a in whitelist.get("sorted_addresses") or [])
+
+
+def audit_one(
+    ew3: EulithWeb3, chain_id: int, contracts: Dict[str, Dict], auth_address: str
+) -> Dict:
+    row = {"trading_address": auth_address, "chain_id": chain_id}
+
+    contract = contracts.get(auth_address.lower())
+    if not contract:
+        row["error"] = "no armor deployed"
+        return row
+
+    aa = ew3.to_checksum_address(contract["contract_address"])
+    sa = ew3.to_checksum_address(contract["safe_address"])
+    row["armor_address"], row["safe_address"] = aa, sa
+
+    safe = get_safe(ew3, sa)
+    row["owners"] = sorted(o.lower() for o in safe.get_owners())
+    row["threshold"] = safe.get_threshold()
+    row["module_enabled"] = safe.is_module_enabled(aa)
+
+    whitelist = ew3.v0.get_current_client_whitelist(auth_address, row["chain_id"])
+    if whitelist:
+        row["whitelist_active"] = whitelist_addresses(whitelist.get("active"))
+        row["whitelist_draft"] = whitelist_addresses(whitelist.get("draft"))
+
+    return row
+
+
+def find_drift(row: Dict, expected: Dict) -> List[str]:
+    """
+    Compare an audited row against the declared state for its trading key. Only fields the
+    manifest declares are checked, except that every key is expected to have Armor enabled.
+    """
+    if row.get("error"):
+        return [row["error"]]
+
+    drift = []
+    if not row.get("module_enabled"):
+        drift.append("armor module not enabled on safe")
+
+    if expected.get("owners"):
+        want = sorted(o.lower() for o in expected["owners"])
+        if row.get("owners") != want:
+            drift.append(f"owners {row.get('owners')} != expected {want}")
+
+    if expected.get("threshold") and row.get("threshold") != int(expected["threshold"]):
+        drift.append(
+            f"threshold {row.get('threshold')} != expected {expected['threshold']}"
+        )
+
+    if expected.get("whitelist") is not None:
+        want = sorted(a.lower() for a in expected["whitelist"])
+        if row.get("whitelist_active") != want:
+            drift.append(
+                f"active whitelist {row.get('whitelist_active')} != expected {want}"
+            )
+
+    return drift
+
+
+def audit_network(
+    ew3: EulithWeb3, network: str, entries: List[Dict], batch_size: int
+) -> List[Dict]:
+    # One eulith_get_contracts call covers every trading key on this chain
+    status, contracts = ew3.eulith_service.get_deployed_execution_contracts()
+    if not status:
+        raise EulithRpcException(contracts)
+
+    chain_id = ew3.eth.chain_id
+    by_auth = {
+        c["authorized_address"].lower(): c
+        for c in contracts
+        if c["chain_id"] == chain_id
+    }
+
+    def run(entry):
+        auth_address = ew3.to_checksum_address(entry["address"])
+        try:
+            row = audit_one(ew3, chain_id, by_auth, auth_address)
+        except Exception as e:
+            row = {"trading_address": auth_address, "error": str(e)}
+
+        row["network"] = network
+        row["drift"] = find_drift(row, entry)
+        return row
+
+    # The request scheduler behind ew3 paces the actual calls; batch_size only caps the threads
+    with ThreadPoolExecutor(max_workers=batch_size) as pool:
+        return list(pool.map(run, entries))
+
+
+def write_audit_report(rows: List[Dict], fmt: str, out):
+    if fmt == "json":
+        json.dump(rows, out, indent=2, default=str)
+        out.write("\n")
+        return
+
+    writer = csv.DictWriter(out, fieldnames=AUDIT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(
+            {
+                k: ";".join(map(str, v)) if isinstance(v, list) else v
+                for k, v in row.items()
+            }
+        )
+
+
+def handle_audit(ew3, wallet, auth_address, args):
+    from armor import get_eulith_urls
+
+    if args.manifest:
+        entries = manifest_entries(load_manifest(args.manifest))
+    elif args.addresses:
+        entries = [{"address": a} for a in args.addresses]
+    else:
+        print("Either --manifest or --addresses must be supplied")
+        exit(1)
+
+    current_network = os.environ.get("EULITH_NETWORK_TYPE")
+    rows = []
+    for network in args.networks or [current_network]:
+        if network == current_network:
+            rows.extend(audit_network(ew3, network, entries, args.batch_size))
+            continue
+
+        urls = get_eulith_urls(network)
+        with EulithWeb3(urls[0], ew3.eulith_service.token) as nw3:
+            install_failover(nw3, urls)
+            rows.extend(audit_network(nw3, network, entries, args.batch_size))
+
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            write_audit_report(rows, args.format, f)
+        print(f"Wrote audit of {len(rows)} trading keys to {args.output}")
+    else:
+        write_audit_report(rows, args.format, sys.stdout)
+
+    drifted = [r for r in rows if r["drift"]]
+    if drifted:
+        print(f"\n{len(drifted)} of {len(rows)} deployments drifted:", file=sys.stderr)
+        for r in drifted:
+            for d in r["drift"]:
+                print(
+                    f"  [{r['network']}] {r['trading_address']}: {d}", file=sys.stderr
+                )
+        exit(1)
@@ -1,13 +1,20 @@
+import argparse
+import contextlib
 import os
-from typing import List
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List
 
-from eulith_web3.eulith_web3 import EulithWeb3
+from eulith_web3.eulith_web3 import EulithWeb3, eulith_atomic_middleware
 from eulith_web3.ledger import LedgerSigner
 from eulith_web3.signing import LocalSigner, construct_signing_middleware
 from eulith_web3.trezor import TrezorSigner
-from eulith_web3.contract_bindings.safe.i_safe import ISafe
 
 from armor import print_banner
+from bindings import get_safe
+from profiling import Profiler, profile_option
+from providers import install_failover
 
 DEPLOYMENT_GAS_VALUES = {
     "celo-main": 5000000,
@@ -22,6 +29,143 @@ class UnsupportedWalletException(Exception):
     pass
 
 
+def connect(network_id: str, eulith_token: str, wallet=None) -> EulithWeb3:
+    """
+    Connects to the network, signing with `wallet` if one is given. Requests go through a
+    FailoverProvider, so they share the process-wide scheduler's rate and concurrency limits
+    with the prefetch's other lookups.
+    """
+    url = f"https://{network_id}.eulithrpc.com/v0"
+    ew3 = EulithWeb3(
+        url,
+        eulith_token,
+        construct_signing_middleware(wallet) if wallet else None,
+    )
+    if network_id == "celo-main" or network_id == "poly-main":
+        from web3.middleware import geth_poa_middleware
+
+        ew3.middleware_onion.inject(geth_poa_middleware, layer=0)
+
+    install_failover(ew3, [url])
+    return ew3
+
+
+def attach_signer(ew3: EulithWeb3, wallet):
+    """
+    Signs `ew3`'s transactions with `wallet` from now on, as if it had been given to connect().
+    EulithWeb3 puts the signing middleware just inside eulith_atomic_middleware, beneath the
+    request formatters, and the onion can only insert at either end, so the layers from
+    eulith_atomic_middleware outwards are taken off and put back around it.
+    """
+    middleware = construct_signing_middleware(wallet)
+    onion = ew3.middleware_onion
+
+    outer = []
+    for element, name in onion.middlewares:
+        outer.append((element, name))
+        if element is eulith_atomic_middleware:
+            break
+    for _, name in outer:
+        onion.remove(name)
+    onion.add(middleware)
+    for element, name in reversed(outer):
+        onion.add(element, name)
+
+    ew3.wallet_address = middleware.address
+    ew3.signer = middleware.signer
+
+
+def fetch_safe_state(ew3: EulithWeb3, addresses):
+    _, sa = addresses
+    safe = get_safe(ew3, sa)
+    return safe.get_threshold(), safe.get_owners()
+
+
+class StatePrefetch:
+    """
+    Looks up the account state a flow is going to show on background threads, starting as soon
+    as the action (and then the trading key) is known, so it is ready by the time the user has
+    answered the remaining prompts. Errors surface from `get`, just as the direct call would.
+    The flow then carries on with the same connection (see `connected`), which `close` ends.
+    """
+
+    def __init__(self, network_id: str, eulith_token: str):
+        self.pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="prefetch")
+        self.futures: Dict[str, Future] = {}
+        self.fetch_seconds: Dict[str, float] = {}
+        self.used = set()
+        self.waited_seconds = 0.0
+        self.lock = threading.Lock()
+
+        self.connection = self.pool.submit(connect, network_id, eulith_token)
+        self.start("chain_id", lambda ew3: ew3.eth.chain_id)
+
+    def start(self, name: str, fetch: Callable, *depends_on: str):
+        # Dependencies are always submitted first, so waiting on them can't starve the pool
+        deps = [self.futures[d] for d in depends_on]
+
+        def run():
+            ew3 = self.connection.result()
+            args = [d.result() for d in deps]
+            started = time.perf_counter()
+            try:
+                return fetch(ew3, *args)
+            finally:
+                with self.lock:
+                    self.fetch_seconds[name] = time.perf_counter() - started
+
+        self.futures[name] = self.pool.submit(run)
+
+    def watch(self, trading_address: str, include_safe: bool = False):
+        self.start(
+            "signatures",
+            lambda ew3: ew3.v0.get_accepted_enable_armor_signatures(trading_address),
+        )
+        if include_safe:
+            self.start(
+                "addresses",
+                lambda ew3: ew3.v0.get_armor_and_safe_addresses(trading_address),
+            )
+            self.start("safe", fetch_safe_state, "addresses")
+
+    def connected(self, wallet=None) -> EulithWeb3:
+        """
+        The prefetch's connection, signing with `wallet` if one is given.
+        """
+        ew3 = self.connection.result()
+        if wallet:
+            attach_signer(ew3, wallet)
+        return ew3
+
+    def get(self, name: str):
+        started = time.perf_counter()
+        try:
+            return self.futures[name].result()
+        finally:
+            self.waited_seconds += time.perf_counter() - started
+            self.used.add(name)
+
+    def report(self):
+        with self.lock:
+            fetched = sum(self.fetch_seconds.get(name, 0.0) for name in self.used)
+        saved = max(0.0, fetched - self.waited_seconds)
+        print(
+            f"(Prefetched {len(self.used)} lookups while you were answering: "
+            f"waited {self.waited_seconds:.2f}s instead of {fetched:.2f}s, saved {saved:.2f}s)"
+        )
+
+    def close(self):
+        for future in self.futures.values():
+            future.cancel()
+
+        def terminate(connection: Future):
+            if not connection.cancelled() and connection.exception() is None:
+                connection.result().terminate()
+
+        self.connection.add_done_callback(terminate)
+        self.pool.shutdown(wait=False)
+
+
 def print_wallet_types():
     print(
         "For a detailed list of the relevant wallets (signers) involved in DeFi Armor, please see the README.md"
@@ -89,16 +233,7 @@ def run_deploy_new_armor(network_id: str, eulith_token: str):
 
     auth_address = input("What is the address of your TRADING KEY? :  ")
 
-    with EulithWeb3(
-        f"https://{network_id}.eulithrpc.com/v0",
-        eulith_token,
-        construct_signing_middleware(wallet),
-    ) as ew3:
-        if network_id == "celo-main" or network_id == "poly-main":
-            from web3.middleware import geth_poa_middleware
-
-            ew3.middleware_onion.inject(geth_poa_middleware, layer=0)
-
+    with connect(network_id, eulith_token, wallet) as ew3:
         new_or_existing = input_with_retry(
             "\nAre we setting up DeFi Armor on a new Safe (n) or existing Safe? (e) :  ",
             ["n", "e"],
@@ -132,10 +267,7 @@ def run_deploy_new_armor(network_id: str, eulith_token: str):
 
 def run_submit_new_armor_hash(network_id: str, eulith_token: str):
     existing_safe_input = input(f'\nIf you have an existing Safe address, enter it here (otherwise press ENTER) : ')
-    with EulithWeb3(
-            f"https://{network_id}.eulithrpc.com/v0",
-            eulith_token,
-    ) as ew3:
+    with connect(network_id, eulith_token) as ew3:
         if '0x' in existing_safe_input:
             existing_safe = ew3.to_checksum_address(existing_safe_input)
         else:
@@ -153,234 +285,217 @@ def run_submit_new_armor_hash(network_id: str, eulith_token: str):
             print(f'Something is wrong, transaction hash REJECTED')
 
 
-def run_submit_owner_signature(network_id: str, eulith_token: str):
+def run_submit_owner_signature(prefetch: StatePrefetch):
     trading_address = input(
         "\nWhat TRADING KEY would you like to submit an owner signature for? : "
     )
-    with EulithWeb3(
-        f"https://{network_id}.eulithrpc.com/v0",
-        eulith_token,
-    ) as ew3:
-        if network_id == "celo-main" or network_id == "poly-main":
-            from web3.middleware import geth_poa_middleware
+    ew3 = prefetch.connected()
+    print(f'Connected to Eulith services with chain id: {prefetch.get("chain_id")}')
 
-            ew3.middleware_onion.inject(geth_poa_middleware, layer=0)
+    print(f'Fetching existing signatures...\n')
+    existing_signatures = ew3.v0.get_accepted_enable_armor_signatures(
+        trading_address
+    )
+    prefetch.report()
 
-        print(f'Connected to Eulith services with chain id: {ew3.eth.chain_id}')
+    if len(existing_signatures) > 0:
+        print("Discovered existing owner signatures for this account: ")
+        for i, e in enumerate(existing_signatures):
+            print(f'Owner {i}: {e.get("owner_address")}')
 
-        print(f'Fetching existing signatures...\n')
-        existing_signatures = ew3.v0.get_accepted_enable_armor_signatures(
-            trading_address
+        cont = input_with_retry(
+            "\nWould you like to add more signatures? (y, n) : ", ["y", "n"]
         )
-
-        if len(existing_signatures) > 0:
-            print("Discovered existing owner signatures for this account: ")
-            for i, e in enumerate(existing_signatures):
-                print(f'Owner {i}: {e.get("owner_address")}')
-
-            cont = input_with_retry(
-                "\nWould you like to add more signatures? (y, n) : ", ["y", "n"]
+        if cont == "n":
+            print("Goodbye")
+            exit(0)
+
+    another_wallet = True
+    while another_wallet:
+        try:
+            wallet = run_get_wallet(
+                f"\nWhat type of wallet is your next OWNER wallet? Or enter `q` to quit. (ledger, trezor, text, q) : ",
+                acceptable_responses=["ledger", "trezor", "text", "q"],
             )
-            if cont == "n":
-                print("Goodbye")
-                exit(0)
+        except UnsupportedWalletException as e:
+            another_wallet = False
+            continue
 
-        another_wallet = True
-        while another_wallet:
-            try:
-                wallet = run_get_wallet(
-                    f"\nWhat type of wallet is your next OWNER wallet? Or enter `q` to quit. (ledger, trezor, text, q) : ",
-                    acceptable_responses=["ledger", "trezor", "text", "q"],
-                )
-            except UnsupportedWalletException as e:
-                another_wallet = False
-                continue
-
-            print(f"\nDetected wallet address: {wallet.address}")
-            print(f"Press ENTER to continue")
-            input()
-
-            print("\nAwaiting signature....")
-            status = ew3.v0.submit_enable_module_signature(trading_address, wallet)
-            if status:
-                print(f"Signature accepted!")
-            else:
-                print(f"Signature failed")
-                exit(1)
+        print(f"\nDetected wallet address: {wallet.address}")
+        print(f"Press ENTER to continue")
+        input()
 
-            existing_signatures = ew3.v0.get_accepted_enable_armor_signatures(
-                trading_address
-            )
-            print("\nNow have signatures for owners:")
-            for i, e in enumerate(existing_signatures):
-                print(f'Owner {i}: {e.get("owner_address")}')
+        print("\nAwaiting signature....")
+        status = ew3.v0.submit_enable_module_signature(trading_address, wallet)
+        if status:
+            print(f"Signature accepted!")
+        else:
+            print(f"Signature failed")
+            exit(1)
+
+        existing_signatures = ew3.v0.get_accepted_enable_armor_signatures(
+            trading_address
+        )
+        print("\nNow have signatures for owners:")
+        for i, e in enumerate(existing_signatures):
+            print(f'Owner {i}: {e.get("owner_address")}')
 
 
-def run_enable_armor_new_safe(network_id: str, eulith_token: str):
+def run_enable_armor_new_safe(network_id: str, prefetch: StatePrefetch):
     trading_address = input("Which trading key are we enabling Armor for? : ")
+    prefetch.watch(trading_address)
 
     deployment_wallet = run_get_wallet(
         "\nWhat kind of wallet would you like to use for DEPLOYMENT? (ledger, trezor, text) : "
     )
     print(f"Parsed deployment wallet address: {deployment_wallet.address}")
 
-    with EulithWeb3(
-        f"https://{network_id}.eulithrpc.com/v0",
-        eulith_token,
-        construct_signing_middleware(deployment_wallet),
-    ) as ew3:
-        if network_id == "celo-main" or network_id == "poly-main":
-            from web3.middleware import geth_poa_middleware
-
-            ew3.middleware_onion.inject(geth_poa_middleware, layer=0)
+    ew3 = prefetch.connected(deployment_wallet)
+    existing_signatures = prefetch.get("signatures")
+    prefetch.report()
+    signatures_for_owners = []
+    if len(existing_signatures) > 0:
+        print("\n\nDiscovered existing owner signatures for this account: ")
+        for i, e in enumerate(existing_signatures):
+            print(f'Owner {i}: {e.get("owner_address")}')
+            signatures_for_owners.append(e.get("owner_address"))
 
-        existing_signatures = ew3.v0.get_accepted_enable_armor_signatures(
-            trading_address
+        print(
+            "\nIf you would like to provide signatures for more owners signatures on this account, "
+            "you'll need to re-run this script and select option (2)"
         )
-        signatures_for_owners = []
-        if len(existing_signatures) > 0:
-            print("\n\nDiscovered existing owner signatures for this account: ")
-            for i, e in enumerate(existing_signatures):
-                print(f'Owner {i}: {e.get("owner_address")}')
-                signatures_for_owners.append(e.get("owner_address"))
-
-            print(
-                "\nIf you would like to provide signatures for more owners signatures on this account, "
-                "you'll need to re-run this script and select option (2)"
-            )
-            print(
-                "\nNOTE: You do NOT need signatures from all your owners. "
-                "You only need a sufficient threshold of owner signatures to proceed\n"
-            )
-        else:
-            print(
-                "Could not find any valid owner signatures. Cannot enable Armor with no owner signatures. Exiting."
-            )
-            exit(1)
+        print(
+            "\nNOTE: You do NOT need signatures from all your owners. "
+            "You only need a sufficient threshold of owner signatures to proceed\n"
+        )
+    else:
+        print(
+            "Could not find any valid owner signatures. Cannot enable Armor with no owner signatures. Exiting."
+        )
+        exit(1)
 
-        more_owners = "a"
-        full_owner_list = set(signatures_for_owners)
+    more_owners = "a"
+    full_owner_list = set(signatures_for_owners)
 
-        while more_owners == "a":
-            additional_owner_input = input(
-                "Please input additional non-signing owners, separated by commas (ex: 0x123,0x456,0x789) : "
-            )
-            additional_owners = additional_owner_input.split(",")
-
-            for a in additional_owners:
-                try:
-                    parsed_address = ew3.to_checksum_address(a)
-                    full_owner_list.add(parsed_address)
-                except Exception:
-                    print(f"Could not parse {a} as a valid address. Ignoring.")
-
-            print("\nYou are about to enable Armor with these owners: ")
-            for i, o in enumerate(full_owner_list):
-                print(f"Owner {i}: {o}")
-
-            more_owners = input_with_retry(
-                "\nTo continue, press ENTER. To add additional owners, press `a` : ",
-                ["", "a"],
-            )
+    while more_owners == "a":
+        additional_owner_input = input(
+            "Please input additional non-signing owners, separated by commas (ex: 0x123,0x456,0x789) : "
+        )
+        additional_owners = additional_owner_input.split(",")
 
-        threshold = int(
-            input(
-                "\nPlease enter the threshold of owner signatures you would like (ex: 2) : "
-            )
+        for a in additional_owners:
+            try:
+                parsed_address = ew3.to_checksum_address(a)
+                full_owner_list.add(parsed_address)
+            except Exception:
+                print(f"Could not parse {a} as a valid address. Ignoring.")
+
+        print("\nYou are about to enable Armor with these owners: ")
+        for i, o in enumerate(full_owner_list):
+            print(f"Owner {i}: {o}")
+
+        more_owners = input_with_retry(
+            "\nTo continue, press ENTER. To add additional owners, press `a` : ",
+            ["", "a"],
         )
 
-        has_ace_input = input_with_retry(
-            "Do you intend to run an ACE with this account? (y, n) : ", ["y", "n"]
+    threshold = int(
+        input(
+            "\nPlease enter the threshold of owner signatures you would like (ex: 2) : "
         )
-        has_ace = has_ace_input == "y"
+    )
 
-        print("\n\n~~ SUMMARY ~~")
-        print(f"Threshold:   {threshold}")
-        print(f"Has ACE:     {has_ace}")
-        print(f"Owners:      {full_owner_list}")
+    has_ace_input = input_with_retry(
+        "Do you intend to run an ACE with this account? (y, n) : ", ["y", "n"]
+    )
+    has_ace = has_ace_input == "y"
 
-        input(f"\nTo continue, press ENTER...\n")
+    print("\n\n~~ SUMMARY ~~")
+    print(f"Threshold:   {threshold}")
+    print(f"Has ACE:     {has_ace}")
+    print(f"Owners:      {full_owner_list}")
 
-        print(f"Awaiting signature and sending transaction...")
+    input(f"\nTo continue, press ENTER...\n")
 
-        status = ew3.v0.enable_armor_for_new_safe(
-            trading_address,
-            threshold,
-            list(full_owner_list),
-            {
-                "gas": DEPLOYMENT_GAS_VALUES[network_id],
-                "from": deployment_wallet.address,
-            },
-        )
+    print(f"Awaiting signature and sending transaction...")
 
-        if status:
-            print(f"~~ Armor successfully enabled! ~~")
-        else:
-            print(f"Something went wrong!")
+    status = ew3.v0.enable_armor_for_new_safe(
+        trading_address,
+        threshold,
+        list(full_owner_list),
+        {
+            "gas": DEPLOYMENT_GAS_VALUES[network_id],
+            "from": deployment_wallet.address,
+        },
+    )
 
+    if status:
+        print(f"~~ Armor successfully enabled! ~~")
+    else:
+        print(f"Something went wrong!")
 
-def run_enable_armor_existing_safe(network_id: str, eulith_token: str):
+
+def run_enable_armor_existing_safe(network_id: str, prefetch: StatePrefetch):
     trading_address = input("Which trading key are we enabling Armor for? : ")
+    prefetch.watch(trading_address, include_safe=True)
 
     deployment_wallet = run_get_wallet(
         "What kind of wallet would you like to use for DEPLOYMENT? (ledger, trezor, text) : "
     )
     print(f"Parsed deployment wallet address: {deployment_wallet.address}")
 
-    with EulithWeb3(
-        f"https://{network_id}.eulithrpc.com/v0",
-        eulith_token,
-        construct_signing_middleware(deployment_wallet),
-    ) as ew3:
-        if network_id == "celo-main" or network_id == "poly-main":
-            from web3.middleware import geth_poa_middleware
-
-            ew3.middleware_onion.inject(geth_poa_middleware, layer=0)
-
-        existing_signatures = ew3.v0.get_accepted_enable_armor_signatures(
-            trading_address
-        )
-        signatures_for_owners = []
-
-        aa, sa = ew3.v0.get_armor_and_safe_addresses(trading_address)
-        safe = ISafe(ew3, ew3.to_checksum_address(sa))
+    ew3 = prefetch.connected(deployment_wallet)
+    existing_signatures = prefetch.get("signatures")
+    signatures_for_owners = []
 
-        threshold = safe.get_threshold()
-        owners = safe.get_owners()
+    aa, sa = prefetch.get("addresses")
+    threshold, owners = prefetch.get("safe")
+    prefetch.report()
 
-        if len(existing_signatures) > 0:
-            print("\n\nDiscovered existing owner signatures for this account: ")
-            for i, e in enumerate(existing_signatures):
-                print(f'Owner {i}: {e.get("owner_address")}')
-                signatures_for_owners.append(e.get("owner_address"))
+    if len(existing_signatures) > 0:
+        print("\n\nDiscovered existing owner signatures for this account: ")
+        for i, e in enumerate(existing_signatures):
+            print(f'Owner {i}: {e.get("owner_address")}')
+            signatures_for_owners.append(e.get("owner_address"))
 
-            print(
-                "\nIf you would like to provide signatures for more owners signatures on this account, "
-                "you'll need to re-run this script and select option (2)"
-            )
+        print(
+            "\nIf you would like to provide signatures for more owners signatures on this account, "
+            "you'll need to re-run this script and select option (2)"
+        )
 
-        print(f'\nThe threshold for this safe is: {threshold}')
-        print(f'The owners are: {owners}\n')
+    print(f'\nThe threshold for this safe is: {threshold}')
+    print(f'The owners are: {owners}\n')
 
-        input('Press ENTER to continue...')
+    input('Press ENTER to continue...')
 
-        print(f'Enabling new armor on existing safe: {sa}')
+    print(f'Enabling new armor on existing safe: {sa}')
 
-        status = ew3.v0.enable_armor_for_existing_safe(
-            trading_address,
-            {
-                "gas": DEPLOYMENT_GAS_VALUES[network_id],
-                "from": deployment_wallet.address,
-            },
-        )
+    status = ew3.v0.enable_armor_for_existing_safe(
+        trading_address,
+        {
+            "gas": DEPLOYMENT_GAS_VALUES[network_id],
+            "from": deployment_wallet.address,
+        },
+    )
 
-        if status:
-            print(f"~~ Armor successfully enabled! ~~")
-        else:
-            print(f"Something went wrong!")
+    if status:
+        print(f"~~ Armor successfully enabled! ~~")
+    else:
+        print(f"Something went wrong!")
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        metavar="PREFIX",
+        help="profile the chosen action and write PREFIX.pstats, PREFIX.txt and PREFIX.collapsed",
+    )
+    args = parser.parse_args()
+    profile_prefix = profile_option(args.profile)
+
     print_banner()
     print("~~ Welcome to the DeFi Armor interactive setup script ~~")
     print(
@@ -411,17 +526,25 @@ def main():
     print("(4) Enable armor for existing Safe")
     print("(5) Submit new armor transaction hash")
     action = int(input_with_retry(": ", ["1", "2", "3", "4", "5"]))
-
-    if action == 1:
-        run_deploy_new_armor(network_id, eulith_token)
-    elif action == 2:
-        run_submit_owner_signature(network_id, eulith_token)
-    elif action == 3:
-        run_enable_armor_new_safe(network_id, eulith_token)
-    elif action == 4:
-        run_enable_armor_existing_safe(network_id, eulith_token)
-    elif action == 5:
-        run_submit_new_armor_hash(network_id, eulith_token)
+    # These flows connect (and, once the trading key is known, look up the account state they
+    # show) while the user answers the remaining prompts, then use that same connection
+    prefetch = StatePrefetch(network_id, eulith_token) if action in (2, 3, 4) else None
+
+    with Profiler(profile_prefix) if profile_prefix else contextlib.nullcontext():
+        try:
+            if action == 1:
+                run_deploy_new_armor(network_id, eulith_token)
+            elif action == 2:
+                run_submit_owner_signature(prefetch)
+            elif action == 3:
+                run_enable_armor_new_safe(network_id, prefetch)
+            elif action == 4:
+                run_enable_armor_existing_safe(network_id, prefetch)
+            elif action == 5:
+                run_submit_new_armor_hash(network_id, eulith_token)
+        finally:
+            if prefetch:
+                prefetch.close()
 
 
 if __name__ == "__main__":
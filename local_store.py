@@ -0,0 +1,414 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+DEFAULT_STORE_PATH = os.path.join(os.path.expanduser("~"), ".eulith", "armor.sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    chain_id INTEGER NOT NULL,
+    safe TEXT NOT NULL,
+    next_block INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (chain_id, safe)
+);
+
+CREATE TABLE IF NOT EXISTS events (
+    chain_id INTEGER NOT NULL,
+    block_number INTEGER NOT NULL,
+    tx_hash TEXT NOT NULL,
+    log_index INTEGER NOT NULL,
+    safe TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    safe_tx_hash TEXT,
+    owner TEXT,
+    module TEXT,
+    token TEXT,
+    from_address TEXT,
+    to_address TEXT,
+    amount TEXT,
+    PRIMARY KEY (chain_id, tx_hash, log_index, safe)
+);
+CREATE INDEX IF NOT EXISTS events_by_safe ON events (chain_id, safe, block_number);
+CREATE INDEX IF NOT EXISTS events_by_owner ON events (chain_id, owner);
+CREATE INDEX IF NOT EXISTS events_by_safe_tx_hash ON events (safe_tx_hash);
+
+CREATE TABLE IF NOT EXISTS blocks (
+    chain_id INTEGER NOT NULL,
+    block_number INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    PRIMARY KEY (chain_id, block_number)
+);
+
+CREATE TABLE IF NOT EXISTS actions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chain_id INTEGER NOT NULL,
+    safe TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    safe_tx_hash TEXT,
+    tx_hash TEXT,
+    sender TEXT,
+    created_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS pending_transfers (
+    safe_tx_hash TEXT PRIMARY KEY,
+    chain_id INTEGER NOT NULL,
+    safe TEXT NOT NULL,
+    nonce INTEGER NOT NULL,
+    token TEXT NOT NULL,
+    dest TEXT NOT NULL,
+    amount REAL NOT NULL,
+    to_address TEXT NOT NULL,
+    value TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    executed_tx_hash TEXT,
+    executed_at REAL
+);
+CREATE INDEX IF NOT EXISTS pending_transfers_by_safe
+    ON pending_transfers (chain_id, safe, nonce);
+
+CREATE TABLE IF NOT EXISTS safe_signatures (
+    safe_tx_hash TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (safe_tx_hash, owner)
+);
+
+CREATE TABLE IF NOT EXISTS setup_steps (
+    chain_id INTEGER NOT NULL,
+    trading_address TEXT NOT NULL,
+    step TEXT NOT NULL,
+    status TEXT NOT NULL,
+    inputs TEXT,
+    tx_hash TEXT,
+    result TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (chain_id, trading_address, step)
+);
+"""
+
+EVENT_COLUMNS = [
+    "chain_id",
+    "block_number",
+    "tx_hash",
+    "log_index",
+    "safe",
+    "kind",
+    "safe_tx_hash",
+    "owner",
+    "module",
+    "token",
+    "from_address",
+    "to_address",
+    "amount",
+]
+
+
+def get_store_path() -> str:
+    return os.environ.get("EULITH_STORE_PATH", DEFAULT_STORE_PATH)
+
+
+class LocalStore:
+    """
+    The CLI's local sqlite database (EULITH_STORE_PATH, default ~/.eulith/armor.sqlite3): indexed
+    Safe/Armor events with per-chain, per-safe checkpoints, a record of the approvals and
+    executions sent from this machine, the transfers started with start-safe-transfer and the
+    owner signatures imported for them, and the journal of the setup workflow. Addresses and hashes are stored lowercase.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or get_store_path()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self) -> "LocalStore":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_checkpoint(self, chain_id: int, safe: str) -> Optional[int]:
+        row = self.conn.execute(
+            "SELECT next_block FROM checkpoints WHERE chain_id = ? AND safe = ?",
+            (chain_id, safe.lower()),
+        ).fetchone()
+        return row["next_block"] if row else None
+
+    def known_safes(self, chain_id: int) -> List[str]:
+        rows = self.conn.execute(
+            "SELECT safe FROM checkpoints WHERE chain_id = ? ORDER BY safe", (chain_id,)
+        )
+        return [r["safe"] for r in rows]
+
+    def known_chains(self) -> List[int]:
+        """
+        Chains the store holds indexed events or recorded actions for.
+        """
+        rows = self.conn.execute(
+            "SELECT chain_id FROM checkpoints UNION SELECT chain_id FROM actions "
+            "ORDER BY chain_id"
+        )
+        return [r["chain_id"] for r in rows]
+
+    def save_chunk(
+        self,
+        chain_id: int,
+        safes: Iterable[str],
+        next_block: int,
+        events: List[Dict],
+        block_times: Dict[int, int],
+    ) -> int:
+        """
+        Stores one scanned block range and moves the checkpoints past it in a single
+        transaction, so an interrupted scan resumes exactly where it stopped. Returns how many
+        of the events were new.
+        """
+        placeholders = ", ".join("?" for _ in EVENT_COLUMNS)
+        with self.lock, self.conn:
+            inserted = self.conn.executemany(
+                f"INSERT OR IGNORE INTO events ({', '.join(EVENT_COLUMNS)}) "
+                f"VALUES ({placeholders})",
+                [[e.get(c) for c in EVENT_COLUMNS] for e in events],
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO blocks (chain_id, block_number, timestamp) "
+                "VALUES (?, ?, ?)",
+                [(chain_id, n, t) for n, t in block_times.items()],
+            )
+            now = time.time()
+            self.conn.executemany(
+                "INSERT INTO checkpoints (chain_id, safe, next_block, updated_at) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT (chain_id, safe) DO UPDATE SET "
+                "next_block = MAX(next_block, excluded.next_block), "
+                "updated_at = excluded.updated_at",
+                [(chain_id, s.lower(), next_block, now) for s in safes],
+            )
+
+        return max(inserted.rowcount, 0)
+
+    def record_action(
+        self,
+        chain_id: int,
+        safe: str,
+        kind: str,
+        safe_tx_hash: Optional[str],
+        tx_hash: Optional[str],
+        sender: Optional[str],
+    ):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO actions (chain_id, safe, kind, safe_tx_hash, tx_hash, sender, "
+                "created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    chain_id,
+                    safe.lower(),
+                    kind,
+                    safe_tx_hash.lower() if safe_tx_hash else None,
+                    tx_hash.lower() if tx_hash else None,
+                    sender.lower() if sender else None,
+                    time.time(),
+                ),
+            )
+
+    def add_pending_transfer(
+        self,
+        safe_tx_hash: str,
+        chain_id: int,
+        safe: str,
+        nonce: int,
+        token: str,
+        dest: str,
+        amount: float,
+        to: str,
+        value: int,
+        data: bytes,
+    ):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pending_transfers (safe_tx_hash, chain_id, safe, nonce, "
+                "token, dest, amount, to_address, value, data, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    safe_tx_hash.lower(),
+                    chain_id,
+                    safe.lower(),
+                    nonce,
+                    token.lower(),
+                    dest.lower(),
+                    amount,
+                    to.lower(),
+                    str(value),
+                    "0x" + bytes(data).hex(),
+                    time.time(),
+                ),
+            )
+
+    def get_pending_transfer(self, safe_tx_hash: str) -> Optional[sqlite3.Row]:
+        return self.conn.execute(
+            "SELECT * FROM pending_transfers WHERE safe_tx_hash = ?",
+            (safe_tx_hash.lower(),),
+        ).fetchone()
+
+    def pending_transfers(self, chain_id: int, safe: str) -> List[sqlite3.Row]:
+        """
+        Transfers started for `safe` and not executed from this machine, in nonce order.
+        """
+        return self.conn.execute(
+            "SELECT * FROM pending_transfers WHERE chain_id = ? AND safe = ? "
+            "AND executed_tx_hash IS NULL ORDER BY nonce, created_at",
+            (chain_id, safe.lower()),
+        ).fetchall()
+
+    def mark_transfer_executed(self, safe_tx_hash: str, tx_hash: str):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE pending_transfers SET executed_tx_hash = ?, executed_at = ? "
+                "WHERE safe_tx_hash = ?",
+                (tx_hash.lower(), time.time(), safe_tx_hash.lower()),
+            )
+
+    def add_safe_signature(self, safe_tx_hash: str, owner: str, signature: bytes):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO safe_signatures (safe_tx_hash, owner, signature, "
+                "created_at) VALUES (?, ?, ?, ?)",
+                (
+                    safe_tx_hash.lower(),
+                    owner.lower(),
+                    "0x" + bytes(signature).hex(),
+                    time.time(),
+                ),
+            )
+
+    def get_safe_signatures(self, safe_tx_hash: str) -> Dict[str, bytes]:
+        """
+        Off-chain owner signatures imported for a Safe transaction, by owner.
+        """
+        rows = self.conn.execute(
+            "SELECT owner, signature FROM safe_signatures WHERE safe_tx_hash = ?",
+            (safe_tx_hash.lower(),),
+        )
+        return {r["owner"]: bytes.fromhex(r["signature"][2:]) for r in rows}
+
+    def get_setup_steps(
+        self, chain_id: int, trading_address: str
+    ) -> Dict[str, sqlite3.Row]:
+        rows = self.conn.execute(
+            "SELECT * FROM setup_steps WHERE chain_id = ? AND trading_address = ?",
+            (chain_id, trading_address.lower()),
+        )
+        return {r["step"]: r for r in rows}
+
+    def save_setup_step(
+        self,
+        chain_id: int,
+        trading_address: str,
+        step: str,
+        status: str,
+        inputs: Optional[str] = None,
+        tx_hash: Optional[str] = None,
+        result: Optional[str] = None,
+    ):
+        """
+        Upserts one journal entry. Fields passed as None keep their previous value, so a step's
+        inputs and transaction hash survive later status changes.
+        """
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO setup_steps (chain_id, trading_address, step, status, inputs, "
+                "tx_hash, result, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (chain_id, trading_address, step) DO UPDATE SET "
+                "status = excluded.status, "
+                "inputs = COALESCE(excluded.inputs, inputs), "
+                "tx_hash = COALESCE(excluded.tx_hash, tx_hash), "
+                "result = COALESCE(excluded.result, result), "
+                "updated_at = excluded.updated_at",
+                (
+                    chain_id,
+                    trading_address.lower(),
+                    step,
+                    status,
+                    inputs,
+                    tx_hash.lower() if tx_hash else None,
+                    result,
+                    time.time(),
+                ),
+            )
+
+    def query_events(
+        self,
+        chain_id: int,
+        safe: Optional[str] = None,
+        owner: Optional[str] = None,
+        kinds: Optional[List[str]] = None,
+        since: Optional[float] = None,
+        limit: Optional[int] = None,
+    ) -> List[sqlite3.Row]:
+        sql = (
+            "SELECT e.*, b.timestamp FROM events e LEFT JOIN blocks b "
+            "ON b.chain_id = e.chain_id AND b.block_number = e.block_number "
+            "WHERE e.chain_id = ?"
+        )
+        params: List = [chain_id]
+        if safe:
+            sql += " AND e.safe = ?"
+            params.append(safe.lower())
+        if owner:
+            sql += " AND e.owner = ?"
+            params.append(owner.lower())
+        if kinds:
+            sql += f" AND e.kind IN ({', '.join('?' for _ in kinds)})"
+            params.extend(kinds)
+        if since is not None:
+            sql += " AND b.timestamp >= ?"
+            params.append(int(since))
+        sql += " ORDER BY e.block_number DESC, e.log_index DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        return self.conn.execute(sql, params).fetchall()
+
+    def query_actions(
+        self,
+        chain_id: int,
+        safe: Optional[str] = None,
+        sender: Optional[str] = None,
+        kinds: Optional[List[str]] = None,
+        since: Optional[float] = None,
+        limit: Optional[int] = None,
+    ) -> List[sqlite3.Row]:
+        sql = "SELECT * FROM actions WHERE chain_id = ?"
+        params: List = [chain_id]
+        if safe:
+            sql += " AND safe = ?"
+            params.append(safe.lower())
+        if sender:
+            sql += " AND sender = ?"
+            params.append(sender.lower())
+        if kinds:
+            sql += f" AND kind IN ({', '.join('?' for _ in kinds)})"
+            params.extend(kinds)
+        if since is not None:
+            sql += " AND created_at >= ?"
+            params.append(since)
+        sql += " ORDER BY created_at DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        return self.conn.execute(sql, params).fetchall()
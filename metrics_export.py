@@ -0,0 +1,191 @@
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+from web3.exceptions import TransactionNotFound
+
+from eulith_web3.eulith_web3 import EulithWeb3
+
+from rpc_stats import KIND_EULITH_SERVICE, KIND_RPC, RpcStats
+
+METRIC_PREFIX = "armor"
+
+
+def escape_label(value) -> str:
+    return (
+        str(value if value is not None else "")
+        .replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+    )
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    return ",".join(f'{k}="{escape_label(v)}"' for k, v in labels.items())
+
+
+def transaction_costs(ew3: EulithWeb3, tx_hashes: List[str]) -> Tuple[int, int, int]:
+    """
+    Returns (pending, gas used, fees in wei) for `tx_hashes`; pending counts the transactions
+    that don't have a receipt yet.
+    """
+    pending = gas_used = fees = 0
+    for tx_hash in tx_hashes:
+        try:
+            receipt = ew3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            pending += 1
+            continue
+
+        gas_used += receipt["gasUsed"]
+        fees += receipt["gasUsed"] * receipt.get("effectiveGasPrice", 0)
+
+    return pending, gas_used, fees
+
+
+class MetricsRun:
+    """
+    Collects what one CLI run did and writes it as an OpenMetrics textfile for node_exporter's
+    textfile collector, so cron jobs can be monitored without a long-running exporter.
+
+    Used as a context manager around the whole run: the exit status is taken from how the block
+    ends (normally, SystemExit from bail(), or any other exception). Every metric is a gauge
+    describing the last run, labelled by subcommand, network type and safe.
+    """
+
+    def __init__(self, path: str, command: str, network: str, safe: Optional[str]):
+        self.path = path
+        self.labels = {"command": command or "", "network": network, "safe": safe}
+        self.stats: Optional[RpcStats] = None
+        self.rows = None
+        self.costs: Optional[Tuple[int, int, int]] = None
+        self.started = 0.0
+        self.start_unix = 0.0
+
+    def attach(self, stats: RpcStats):
+        self.stats = stats
+
+    def collect(self, ew3: EulithWeb3):
+        """
+        Fetches receipts for the transactions this run sent. Call it once the subcommand is done
+        and before `ew3` is closed, so these lookups aren't counted as the command's round trips.
+        """
+        if not self.stats:
+            return
+
+        self.rows = self.stats.rows()
+        try:
+            self.costs = transaction_costs(ew3, self.stats.sent_transactions)
+        except Exception as e:
+            print(
+                f"Warning: could not fetch transaction receipts: {e}", file=sys.stderr
+            )
+
+    def __enter__(self) -> "MetricsRun":
+        self.started = time.perf_counter()
+        self.start_unix = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        duration = time.perf_counter() - self.started
+
+        if exc_type is None:
+            status = 0
+        elif issubclass(exc_type, SystemExit):
+            code = exc_val.code
+            status = code if isinstance(code, int) else (0 if code is None else 1)
+        else:
+            status = 1
+
+        try:
+            self.write(duration, status)
+        except Exception as e:
+            # Never let monitoring turn a successful run into a failed one
+            print(
+                f"Warning: could not write metrics to {self.path}: {e}", file=sys.stderr
+            )
+
+    def samples(
+        self, duration: float, status: int
+    ) -> List[Tuple[str, str, Dict, float]]:
+        samples = []
+
+        def add(name, help_text, value, **extra):
+            samples.append((name, help_text, extra, value))
+
+        add("command_duration_seconds", "Wall time of the last run", round(duration, 6))
+        add("command_exit_status", "Exit status of the last run", status)
+        add(
+            "command_success",
+            "1 if the last run exited with status 0",
+            int(status == 0),
+        )
+        add(
+            "command_last_run_timestamp_seconds",
+            "When the last run started",
+            round(self.start_unix, 3),
+        )
+
+        if not self.stats:
+            return samples
+
+        rows = self.rows if self.rows is not None else self.stats.rows()
+        for kind in (KIND_RPC, KIND_EULITH_SERVICE):
+            add(
+                "round_trips",
+                "Calls made to the Eulith endpoint",
+                sum(s.count for k, _, s in rows if k == kind),
+                kind=kind,
+            )
+            add(
+                "call_errors",
+                "Calls that returned an error",
+                sum(s.errors for k, _, s in rows if k == kind),
+                kind=kind,
+            )
+        add("call_retries", "Calls that were retried", sum(self.stats.retries.values()))
+
+        sent = self.stats.sent_transactions
+        pending, gas_used, fees = self.costs or (len(sent), 0, 0)
+        add("transactions_sent", "Transactions sent", len(sent))
+        add("transactions_pending", "Sent transactions without a receipt yet", pending)
+        add("transaction_gas_used", "Gas used by the mined transactions", gas_used)
+        add("transaction_fees_wei", "Fees paid by the mined transactions", fees)
+
+        return samples
+
+    def render(self, duration: float, status: int) -> str:
+        # OpenMetrics wants all samples of a metric family next to each other
+        families: Dict[str, Tuple[str, List[str]]] = {}
+        for name, help_text, extra, value in self.samples(duration, status):
+            full_name = f"{METRIC_PREFIX}_{name}"
+            labels = format_labels({**self.labels, **extra})
+            families.setdefault(full_name, (help_text, []))[1].append(
+                f"{full_name}{{{labels}}} {value}"
+            )
+
+        lines = []
+        for full_name, (help_text, samples) in families.items():
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} gauge")
+            lines.extend(samples)
+
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, duration: float, status: int):
+        body = self.render(duration, status)
+
+        # Write and rename so the collector never reads a half-written file
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".armor-metrics-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(body)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
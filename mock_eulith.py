@@ -0,0 +1,229 @@
+"""
+A local stand-in for the Eulith endpoint that replays recorded cassettes.
+
+Record a cassette against the real endpoint:
+
+    ./run.sh --record addresses.jsonl addresses
+
+Then serve it where the `dev` network type points (ws://localhost:7777/v0):
+
+    python mock_eulith.py --cassette addresses.jsonl --latency-ms 40
+    EULITH_NETWORK_TYPE=dev ./run.sh addresses
+"""
+
+import argparse
+import json
+import random
+import ssl
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
+
+from websockets.sync.server import serve
+
+from providers import canonical_params, read_cassettes
+
+DEFAULT_PORT = 7777
+
+
+class ReplayStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.by_method = defaultdict(int)
+        self.misses = []
+
+    def record(self, method: str, n_in: int, n_out: int, hit: bool):
+        with self.lock:
+            self.requests += 1
+            self.bytes_in += n_in
+            self.bytes_out += n_out
+            self.by_method[method] += 1
+            if not hit:
+                self.misses.append(method)
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "by_method": dict(self.by_method),
+                "misses": list(self.misses),
+            }
+
+
+class Cassette:
+    """
+    Recorded responses, matched first on (method, params) and then on method alone. Repeated
+    identical requests get the recorded responses in order; the last one is reused once they
+    run out.
+    """
+
+    def __init__(self, exchanges: List[Dict]):
+        self.lock = threading.Lock()
+        self.exact = defaultdict(deque)
+        self.by_method = defaultdict(deque)
+        for e in exchanges:
+            key = (e["method"], canonical_params(e["params"]))
+            self.exact[key].append(e["response"])
+            self.by_method[e["method"]].append(e["response"])
+
+    def _take(self, queue: deque) -> Dict:
+        return queue.popleft() if len(queue) > 1 else queue[0]
+
+    def lookup(self, method: str, params) -> Optional[Dict]:
+        with self.lock:
+            queue = self.exact.get((method, canonical_params(params)))
+            if queue:
+                return self._take(queue)
+
+            queue = self.by_method.get(method)
+            if queue:
+                return self._take(queue)
+
+        return None
+
+
+class ReplayServer:
+    def __init__(
+        self,
+        cassette: Cassette,
+        host: str = "localhost",
+        port: int = DEFAULT_PORT,
+        latency_ms: float = 0,
+        jitter_ms: float = 0,
+        method_latency_ms: Optional[Dict[str, float]] = None,
+        ssl_context: Optional[ssl.SSLContext] = None,
+    ):
+        self.cassette = cassette
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.method_latency_ms = method_latency_ms or {}
+        self.ssl_context = ssl_context
+        self.stats = ReplayStats()
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        scheme = "https" if self.ssl_context else "http"
+        return f"{scheme}://{self.host}:{self.port}/v0"
+
+    def delay(self, method: str) -> float:
+        ms = self.method_latency_ms.get(method, self.latency_ms)
+        if self.jitter_ms:
+            ms += random.uniform(-self.jitter_ms, self.jitter_ms)
+
+        return max(ms, 0) / 1000
+
+    def respond(self, request: Dict) -> Dict:
+        method = request.get("method", "")
+        recorded = self.cassette.lookup(method, request.get("params"))
+        if recorded is None:
+            response = {
+                "jsonrpc": "2.0",
+                "error": {
+                    "code": -32601,
+                    "message": f"no recorded response for {method}",
+                },
+            }
+        else:
+            response = dict(recorded)
+
+        response["id"] = request.get("id")
+        time.sleep(self.delay(method))
+        return response
+
+    def handle(self, connection):
+        # Requests are answered concurrently, like the real endpoint does over one socket
+        send_lock = threading.Lock()
+
+        def answer(raw):
+            request = json.loads(raw)
+            response = self.respond(request)
+            out = json.dumps(response)
+            self.stats.record(
+                request.get("method", ""), len(raw), len(out), "error" not in response
+            )
+            with send_lock:
+                connection.send(out)
+
+        for message in connection:
+            threading.Thread(target=answer, args=(message,), daemon=True).start()
+
+    def start(self) -> "ReplayServer":
+        self.server = serve(
+            self.handle,
+            self.host,
+            self.port,
+            compression=None,
+            ssl=self.ssl_context,
+        )
+        self.port = self.server.socket.getsockname()[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.thread.join()
+
+    def __enter__(self) -> "ReplayServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def parse_method_latency(values: List[str]) -> Dict[str, float]:
+    out = {}
+    for v in values or []:
+        method, _, ms = v.partition("=")
+        out[method] = float(ms)
+
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--cassette", nargs="+", required=True)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--latency-ms", type=float, default=0, help="delay added to every response"
+    )
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument(
+        "--method-latency",
+        nargs="*",
+        metavar="METHOD=MS",
+        help="per-method delay, e.g. eth_call=80",
+    )
+    args = parser.parse_args()
+
+    server = ReplayServer(
+        Cassette(read_cassettes(args.cassette)),
+        args.host,
+        args.port,
+        args.latency_ms,
+        args.jitter_ms,
+        parse_method_latency(args.method_latency),
+    )
+
+    print(f"Replaying {', '.join(args.cassette)} on ws://{args.host}:{args.port}/v0")
+    with server:
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print(json.dumps(server.stats.snapshot(), indent=2))
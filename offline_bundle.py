@@ -0,0 +1,309 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from eth_account.messages import encode_typed_data
+from eth_keys.datatypes import Signature
+from hexbytes import HexBytes
+from web3 import Web3
+
+from eulith_web3.eulith_web3 import EulithWeb3
+
+from bindings import get_safe
+from bulk_signing import (
+    PresignedSigner,
+    get_enable_module_payload,
+    get_whitelist_payload,
+)
+from local_store import LocalStore
+from safe_utils import get_safe_tx_typed_data
+
+BUNDLE_VERSION = 1
+
+KIND_ENABLE_MODULE = "enable-module"
+KIND_WHITELIST = "whitelist"
+KIND_SAFE_TX = "safe-tx"
+
+
+def to_json_value(value):
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex()
+    if isinstance(value, dict):
+        return {k: to_json_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [to_json_value(v) for v in value]
+    return value
+
+
+def from_json_typed_data(typed_data: Dict) -> Dict:
+    """
+    Restores the `bytes` message fields that were written to the bundle as hex strings.
+    """
+    message = dict(typed_data["message"])
+    for field in typed_data["types"][typed_data["primaryType"]]:
+        value = message.get(field["name"])
+        if field["type"] == "bytes" and isinstance(value, str):
+            message[field["name"]] = bytes(HexBytes(value))
+
+    return dict(typed_data, message=message)
+
+
+def typed_data_hash(typed_data: Dict) -> bytes:
+    signable = encode_typed_data(full_message=typed_data)
+    return bytes(
+        Web3.keccak(b"\x19" + signable.version + signable.header + signable.body)
+    )
+
+
+def make_item(kind: str, digest: bytes, typed_data: Dict, **fields) -> Dict:
+    return {
+        "kind": kind,
+        "hash": "0x" + bytes(digest).hex(),
+        **fields,
+        "typed_data": to_json_value(typed_data),
+    }
+
+
+def collect_unsigned(
+    ew3: EulithWeb3, auth_address: Optional[str], safes: List[str]
+) -> List[Dict]:
+    """
+    Everything waiting on owner signatures: the enable-module message and the draft whitelist
+    of `auth_address`, and the transfers started from this machine for `safes` (by default the
+    trading key's safe) that the safe hasn't executed yet.
+    """
+    chain_id = ew3.eth.chain_id
+    items = []
+
+    if auth_address:
+        aa, sa = ew3.v0.get_armor_and_safe_addresses(auth_address)
+        if aa:
+            safe = get_safe(ew3, sa)
+            if not safe.is_module_enabled(ew3.to_checksum_address(aa)):
+                digest, typed_data = get_enable_module_payload(ew3, auth_address)
+                items.append(
+                    make_item(
+                        KIND_ENABLE_MODULE,
+                        digest,
+                        typed_data,
+                        trading_address=auth_address,
+                        safe=sa,
+                    )
+                )
+
+            current = ew3.v0.get_current_client_whitelist(auth_address, chain_id) or {}
+            draft = current.get("draft")
+            if draft:
+                digest, typed_data = get_whitelist_payload(ew3, draft["list_id"])
+                items.append(
+                    make_item(
+                        KIND_WHITELIST,
+                        digest,
+                        typed_data,
+                        trading_address=auth_address,
+                        list_id=draft["list_id"],
+                        addresses=draft["sorted_addresses"],
+                    )
+                )
+
+            if not safes:
+                safes = [sa]
+
+    with LocalStore() as store:
+        for safe in safes:
+            safe = ew3.to_checksum_address(safe)
+            nonce = get_safe(ew3, safe).nonce()
+            for t in store.pending_transfers(chain_id, safe):
+                if t["nonce"] < nonce:
+                    continue
+                typed_data = get_safe_tx_typed_data(
+                    safe,
+                    chain_id,
+                    ew3.to_checksum_address(t["to_address"]),
+                    int(t["value"]),
+                    bytes.fromhex(t["data"][2:]),
+                    t["nonce"],
+                )
+                items.append(
+                    make_item(
+                        KIND_SAFE_TX,
+                        HexBytes(t["safe_tx_hash"]),
+                        typed_data,
+                        safe=safe,
+                        nonce=t["nonce"],
+                        description=f"{t['amount']} of {t['token']} to {t['dest']}",
+                    )
+                )
+
+    return items
+
+
+def read_bundle(path: str) -> Dict:
+    with open(path) as f:
+        bundle = json.load(f)
+
+    if bundle.get("version") != BUNDLE_VERSION:
+        print(f"{path} is not a version {BUNDLE_VERSION} signing bundle")
+        exit(1)
+
+    return bundle
+
+
+def write_bundle(bundle: Dict, path: str):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(bundle, f, indent=2)
+        f.write("\n")
+    os.replace(tmp, path)
+
+
+def describe_item(item: Dict) -> str:
+    if item["kind"] == KIND_ENABLE_MODULE:
+        return f"enable Armor on safe {item['safe']}"
+    if item["kind"] == KIND_WHITELIST:
+        return f"whitelist {item['list_id']}: {', '.join(item['addresses'])}"
+
+    return f"safe {item['safe']} nonce {item['nonce']}: {item['description']}"
+
+
+def handle_export_unsigned(ew3, wallet, auth_address, args):
+    items = collect_unsigned(ew3, auth_address, args.safe or [])
+    if not items:
+        print("Nothing is waiting on owner signatures")
+        return
+
+    bundle = {
+        "version": BUNDLE_VERSION,
+        "chain_id": ew3.eth.chain_id,
+        "created_at": int(time.time()),
+        "items": items,
+        "signatures": [],
+    }
+    write_bundle(bundle, args.output)
+
+    print(f"Wrote {len(items)} unsigned payloads to {args.output}:")
+    for item in items:
+        print(f"  [{item['kind']}] {describe_item(item)}")
+
+
+def handle_sign_bundle(ew3, wallet, auth_address, args):
+    bundle = read_bundle(args.bundle)
+    owner = wallet.address
+    signed = {
+        s["hash"] for s in bundle["signatures"] if s["owner"].lower() == owner.lower()
+    }
+
+    to_sign = []
+    for item in bundle["items"]:
+        typed_data = from_json_typed_data(item["typed_data"])
+        digest = bytes(HexBytes(item["hash"]))
+        # Never sign a hash that doesn't follow from the data shown to the signer
+        if typed_data_hash(typed_data) != digest:
+            print(f"Skipping {item['hash']}: it does not match its typed data")
+            continue
+        if item["hash"] in signed:
+            continue
+        to_sign.append((item, typed_data, digest))
+
+    if not to_sign:
+        print(f"Nothing left for {owner} to sign in {args.bundle}")
+        return
+
+    print(f"Signing {len(to_sign)} payloads on chain {bundle['chain_id']} as {owner}:")
+    for item, _, _ in to_sign:
+        print(f"  [{item['kind']}] {describe_item(item)}")
+    input("\nPlease hit ENTER to proceed...\n")
+
+    for item, typed_data, digest in to_sign:
+        signature = wallet.sign_typed_data(typed_data, digest)
+        bundle["signatures"].append(
+            {
+                "hash": item["hash"],
+                "owner": owner,
+                "signature": "0x" + signature.to_bytes().hex(),
+            }
+        )
+
+    output = args.output or args.bundle
+    write_bundle(bundle, output)
+    print(f"Added {len(to_sign)} signatures to {output}")
+
+
+# Needs only the wallet; armor.py runs it without connecting to Eulith
+handle_sign_bundle.offline = True
+
+
+def submit_signature(
+    ew3: EulithWeb3, store: LocalStore, item: Dict, entry: Dict
+) -> Optional[str]:
+    """
+    :return: An error message, or None if the signature was accepted
+    """
+    digest = bytes(HexBytes(item["hash"]))
+    signature = Signature(signature_bytes=bytes(HexBytes(entry["signature"])))
+    owner = ew3.to_checksum_address(entry["owner"])
+
+    signer = signature.recover_public_key_from_msg_hash(digest).to_checksum_address()
+    if signer != owner:
+        return f"signature is from {signer}, not {owner}"
+
+    presigned = PresignedSigner(owner, {digest: signature})
+    if item["kind"] == KIND_ENABLE_MODULE:
+        ew3.v0.submit_enable_module_signature(item["trading_address"], presigned)
+    elif item["kind"] == KIND_WHITELIST:
+        if ew3.v0.submit_draft_client_whitelist_signature(item["list_id"], presigned):
+            print(f"Whitelist {item['list_id']} reached its threshold and is enabled")
+    else:
+        store.add_safe_signature(item["hash"], owner, signature.to_bytes())
+
+    return None
+
+
+def handle_import_signed(ew3, wallet, auth_address, args):
+    bundle = read_bundle(args.bundle)
+    if bundle["chain_id"] != ew3.eth.chain_id:
+        print(
+            f"{args.bundle} was exported for chain {bundle['chain_id']}, "
+            f"but this network is chain {ew3.eth.chain_id}"
+        )
+        exit(1)
+
+    items = {item["hash"]: item for item in bundle["items"]}
+    entries = [s for s in bundle["signatures"] if s["hash"] in items]
+    if not entries:
+        print(f"{args.bundle} has no signatures yet; run sign-bundle first")
+        exit(1)
+
+    with LocalStore() as store:
+
+        def run(entry):
+            try:
+                return submit_signature(ew3, store, items[entry["hash"]], entry)
+            except Exception as e:
+                return str(e)
+
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            errors = list(pool.map(run, entries))
+
+    for entry, error in zip(entries, errors):
+        item = items[entry["hash"]]
+        state = f"FAILED: {error}" if error else "ok"
+        print(f"[{item['kind']}] {describe_item(item)} -- {entry['owner']}: {state}")
+
+    executable = sorted(
+        {
+            items[e["hash"]]["hash"]
+            for e, error in zip(entries, errors)
+            if not error and items[e["hash"]]["kind"] == KIND_SAFE_TX
+        }
+    )
+    if executable:
+        print(
+            f"\nOff-chain signatures are stored; once enough owners signed, run:\n"
+            f"./run.sh execute-safe-transfer --hash {' '.join(executable)}"
+        )
+
+    if any(errors):
+        exit(1)
@@ -0,0 +1,282 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from eth_keys.datatypes import Signature
+
+from eulith_web3.eulith_web3 import EulithWeb3
+from eulith_web3.ledger import LedgerSigner
+from eulith_web3.signer import Signer
+from eulith_web3.trezor import TrezorSigner
+
+from bindings import get_safe
+from bulk_signing import (
+    PresignedSigner,
+    get_enable_module_payload,
+    get_whitelist_payload,
+)
+
+# get_wallet options a keyring entry may set
+WALLET_OPTIONS = ["kms_key", "aws_profile", "account_index", "derivation_path"]
+
+# What each wallet type must spell out. get_wallet fills anything missing from the
+# environment (PRIVATE_KEY, EULITH_KMS_KEY, ...), which would make one key sign as several
+# owners, so keyring entries never rely on that fallback.
+REQUIRED_OPTIONS = {
+    "kms": ["kms_key", "aws_profile"],
+    "ledger": [],
+    "trezor": [],
+    "text": ["private_key_env"],
+}
+
+
+def load_keyring(path: str) -> List[Dict]:
+    """
+    Load a keyring of owner signers. YAML needs PyYAML installed; JSON works out of the box.
+    Plain text keys are read from the environment variable named by `private_key_env`, never
+    from the file itself.
+
+    Example (YAML):
+
+        signers:
+          - type: kms
+            kms_key: owner-1
+            aws_profile: treasury
+          - type: kms
+            kms_key: owner-2
+            aws_profile: treasury
+          - type: ledger
+            account_index: 0
+          - type: text
+            private_key_env: OWNER_4_KEY
+    """
+    with open(path) as f:
+        raw = f.read()
+
+    if path.endswith(".json"):
+        keyring = json.loads(raw)
+    else:
+        try:
+            import yaml
+        except ImportError:
+            print("Reading a YAML keyring requires PyYAML: pip install pyyaml")
+            exit(1)
+        keyring = yaml.safe_load(raw)
+
+    if not isinstance(keyring, dict) or not keyring.get("signers"):
+        print(f"Keyring {path} must contain a non-empty `signers` list")
+        exit(1)
+
+    return keyring["signers"]
+
+
+def describe_entry(entry: Dict) -> str:
+    details = [
+        f"{k}={entry[k]}" for k in WALLET_OPTIONS + ["private_key_env"] if k in entry
+    ]
+    return (
+        f"{entry.get('type')} ({', '.join(details)})" if details else entry.get("type")
+    )
+
+
+def entry_problem(entry: Dict) -> Optional[str]:
+    """
+    Why a keyring entry can't be opened without falling back to the environment, if it can't.
+    """
+    if entry.get("type") not in REQUIRED_OPTIONS:
+        return f"type must be one of {', '.join(REQUIRED_OPTIONS)}"
+
+    missing = [k for k in REQUIRED_OPTIONS[entry["type"]] if not entry.get(k)]
+    if missing:
+        return f"missing {', '.join(missing)}"
+
+    if entry.get("private_key_env") and not os.environ.get(entry["private_key_env"]):
+        return f"{entry['private_key_env']} is not set"
+
+    return None
+
+
+def open_signers(entries: List[Dict]) -> List[Signer]:
+    """
+    Connects every signer in the keyring that is available right now; devices that are
+    unplugged or asleep, keys without credentials and second entries for an address that is
+    already open are skipped.
+    """
+    from armor import get_wallet
+
+    signers = []
+    for entry in entries:
+        problem = entry_problem(entry)
+        if problem:
+            print(f"Skipping {describe_entry(entry)}: {problem}")
+            continue
+
+        options = {k: entry[k] for k in WALLET_OPTIONS if k in entry}
+        if entry.get("private_key_env"):
+            options["private_key"] = os.environ[entry["private_key_env"]]
+
+        try:
+            signer = get_wallet(entry["type"], **options)
+        # Signer constructors and bail() exit on errors; neither should end the whole run
+        except (Exception, SystemExit) as e:
+            print(f"Skipping {describe_entry(entry)}: not available ({e})")
+            continue
+
+        if any(s.address.lower() == signer.address.lower() for s in signers):
+            print(
+                f"Skipping {describe_entry(entry)}: {signer.address} is already listed"
+            )
+            continue
+        signers.append(signer)
+
+    return signers
+
+
+def is_device(signer: Signer) -> bool:
+    return isinstance(signer, (LedgerSigner, TrezorSigner))
+
+
+def sign_with_all(
+    signers: List[Signer], typed_data: Dict, digest: bytes, needed: int
+) -> List[Tuple[Signer, Signature]]:
+    """
+    Signs with up to `needed` signers. Keys that sign without a person (KMS, plain text) go
+    first and concurrently; hardware wallets are then prompted one at a time for the rest.
+    """
+    automatic = [s for s in signers if not is_device(s)][:needed]
+    devices = [s for s in signers if is_device(s)][: max(0, needed - len(automatic))]
+
+    with ThreadPoolExecutor(max_workers=max(1, len(automatic))) as pool:
+        futures = [
+            pool.submit(s.sign_typed_data, typed_data, digest) for s in automatic
+        ]
+
+        signed = []
+        for s in devices:
+            print(f"Please sign on the device for {s.address}")
+            signed.append((s, s.sign_typed_data(typed_data, digest)))
+
+        return [(s, f.result()) for s, f in zip(automatic, futures)] + signed
+
+
+def submit_batch(
+    submit, signed: List[Tuple[Signer, Signature]], digest: bytes
+) -> List[Optional[str]]:
+    """
+    Submits every signature concurrently through `submit(PresignedSigner)`.
+
+    :return: One error message (or None) per signature
+    """
+
+    def run(pair):
+        signer, signature = pair
+        try:
+            submit(PresignedSigner(signer.address, {digest: signature}))
+            return None
+        except Exception as e:
+            return str(e)
+
+    with ThreadPoolExecutor(max_workers=max(1, len(signed))) as pool:
+        return list(pool.map(run, signed))
+
+
+def print_batch(signed: List[Tuple[Signer, Signature]], errors: List[Optional[str]]):
+    for (signer, _), error in zip(signed, errors):
+        print(f"  {signer.address}: {'FAILED: ' + error if error else 'submitted'}")
+
+
+def keyring_sign_armor(
+    ew3: EulithWeb3, auth_address: str, path: str, threshold: Optional[int]
+):
+    accepted = ew3.v0.get_accepted_enable_armor_signatures(auth_address)
+    already = {s["owner_address"].lower() for s in accepted}
+
+    signers = [
+        s for s in open_signers(load_keyring(path)) if s.address.lower() not in already
+    ]
+    needed = len(signers) if threshold is None else threshold - len(already)
+    if needed <= 0 or not signers:
+        print(f"Nothing to sign: {len(already)} owners have already signed")
+        return
+
+    digest, typed_data = get_enable_module_payload(ew3, auth_address)
+    signed = sign_with_all(signers, typed_data, digest, needed)
+    errors = submit_batch(
+        lambda signer: ew3.v0.submit_enable_module_signature(auth_address, signer),
+        signed,
+        digest,
+    )
+
+    print(f"Submitted {len(signed)} enable module signatures:")
+    print_batch(signed, errors)
+    total = len(already) + errors.count(None)
+    print(
+        f"{total} owners have signed"
+        + (f" (threshold {threshold})" if threshold else "")
+    )
+
+    if any(errors):
+        exit(1)
+
+
+def whitelist_enabled(ew3: EulithWeb3, auth_address: str, list_id: int) -> bool:
+    active = (ew3.v0.get_current_client_whitelist(auth_address) or {}).get("active")
+    return bool(active) and active.get("list_id") == list_id
+
+
+def keyring_sign_whitelist(ew3: EulithWeb3, auth_address: str, path: str, list_id: int):
+    """
+    The service enables the list on the signature that reaches the threshold and has no
+    call listing who signed before, so signatures are submitted one at a time and the run
+    stops as soon as the list is enabled. A signature rejected after that point, or for an
+    owner who already signed, is not a failure.
+    """
+    _, sa = ew3.v0.get_armor_and_safe_addresses(auth_address)
+    safe = get_safe(ew3, sa)
+    owners = {o.lower() for o in safe.get_owners()}
+    threshold = safe.get_threshold()
+
+    signers = []
+    for s in open_signers(load_keyring(path)):
+        if s.address.lower() not in owners:
+            print(f"Skipping {s.address}: not an owner of safe {sa}")
+        else:
+            signers.append(s)
+    if not signers:
+        print("No owner of the safe is available in the keyring")
+        exit(1)
+
+    digest, typed_data = get_whitelist_payload(ew3, list_id)
+    signed = sign_with_all(signers, typed_data, digest, threshold)
+
+    enabled = False
+    errors = []
+    print(f"Submitting up to {len(signed)} whitelist signatures:")
+    for signer, signature in signed:
+        try:
+            enabled = ew3.v0.submit_draft_client_whitelist_signature(
+                list_id, PresignedSigner(signer.address, {digest: signature})
+            )
+        except Exception as e:
+            if "already" in str(e).lower():
+                print(f"  {signer.address}: already signed")
+                continue
+            print(f"  {signer.address}: FAILED: {e}")
+            errors.append(str(e))
+            continue
+
+        print(f"  {signer.address}: submitted")
+        if enabled:
+            break
+
+    # A failure may have raced an owner signing elsewhere; the list being active is what counts
+    if not enabled and errors:
+        enabled = whitelist_enabled(ew3, auth_address, list_id)
+
+    if enabled:
+        print("Threshold of owners reached. Whitelist is enabled!")
+    else:
+        print(f"Threshold of {threshold} owners not yet reached.")
+        if errors:
+            exit(1)
@@ -0,0 +1,194 @@
+import builtins
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import List, Optional, Tuple
+
+CATEGORY_NETWORK = "network I/O"
+CATEGORY_DEVICE = "device I/O"
+CATEGORY_USER = "waiting for user input"
+CATEGORY_ABI = "CPU: ABI encoding"
+CATEGORY_SIGNING = "CPU: signing"
+CATEGORY_HASHING = "CPU: hashing/checksumming"
+CATEGORY_CPU = "CPU: other"
+
+# Checked against every frame from the innermost outwards; the first match decides the
+# category of a sample. Blocking on the Eulith websocket shows up as a threading wait inside
+# eulith_web3/websocket.py, which is why that file counts as network.
+CATEGORY_RULES: List[Tuple[str, Tuple[str, ...]]] = [
+    (
+        CATEGORY_DEVICE,
+        (
+            "ledgerblue",
+            "trezorlib",
+            "/hid",
+            "usb1",
+            "eulith_web3/ledger",
+            "eulith_web3/trezor",
+        ),
+    ),
+    (
+        CATEGORY_NETWORK,
+        (
+            "eulith_web3/websocket.py",
+            "/websocket/",
+            "/websockets/",
+            "/socket.py",
+            "/ssl.py",
+            "/http/client.py",
+            "/urllib3/",
+            "/requests/",
+            "/botocore/",
+        ),
+    ),
+    (CATEGORY_ABI, ("/eth_abi/", "/web3/_utils/abi.py", "/web3/_utils/contracts.py")),
+    (
+        CATEGORY_SIGNING,
+        ("/eth_keys/", "/coincurve/", "/eth_account/", "eulith_web3/signing.py"),
+    ),
+    (CATEGORY_HASHING, ("/eth_hash/", "/eth_utils/address.py", "/Crypto/Hash/")),
+]
+
+# A thread blocked on another thread's result. When one of the files below started the wait,
+# the other thread is making a request (FailoverProvider sends and hedges reads from a pool),
+# so the sample is network time rather than whatever else the stack passes through.
+THREAD_WAIT_FILES = ("/threading.py", "/concurrent/futures/")
+NETWORK_WAITERS = ("/providers.py",)
+
+
+def categorize(filenames: List[str], waiting_for_input: bool) -> str:
+    if waiting_for_input:
+        return CATEGORY_USER
+
+    normalized = [f.replace(os.sep, "/") for f in filenames]
+    if (
+        normalized
+        and any(p in normalized[0] for p in THREAD_WAIT_FILES)
+        and any(w in f for f in normalized for w in NETWORK_WAITERS)
+    ):
+        return CATEGORY_NETWORK
+
+    for filename in filenames:
+        filename = filename.replace(os.sep, "/")
+        for category, patterns in CATEGORY_RULES:
+            if any(p in filename for p in patterns):
+                return category
+
+    return CATEGORY_CPU
+
+
+class Profiler:
+    """
+    Profiles one block of code (normally a subcommand handler) on the current thread.
+
+    Writes three files next to `prefix`:
+      - `.pstats`: raw cProfile data, for snakeviz/pstats
+      - `.txt`: cProfile stats sorted by cumulative time
+      - `.collapsed`: sampled stacks in the folded format read by flamegraph.pl and speedscope
+
+    cProfile alone can't tell a thread that is blocked from one that is busy, so a sampler
+    thread also records the profiled thread's stack every `interval` seconds and attributes
+    each sample to network I/O, device I/O, user input or a kind of CPU work.
+    """
+
+    def __init__(self, prefix: str, interval: float = 0.002):
+        self.prefix = prefix
+        self.interval = interval
+        self.profile = cProfile.Profile()
+        self.stacks = Counter()
+        self.categories = Counter()
+        self.stop_event = threading.Event()
+        self.thread_id = None
+        self.sampler = None
+        self.in_input = False
+        self.original_input = None
+        self.started = 0.0
+        self.elapsed = 0.0
+
+    def _input(self, *args, **kwargs):
+        self.in_input = True
+        try:
+            return self.original_input(*args, **kwargs)
+        finally:
+            self.in_input = False
+
+    def _sample(self):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            names, filenames = [], []
+            while frame is not None:
+                code = frame.f_code
+                names.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                )
+                filenames.append(code.co_filename)
+                frame = frame.f_back
+
+            category = categorize(filenames, self.in_input)
+            self.categories[category] += 1
+            self.stacks[";".join([category] + names[::-1])] += 1
+
+    def __enter__(self) -> "Profiler":
+        self.thread_id = threading.get_ident()
+        self.original_input = builtins.input
+        builtins.input = self._input
+
+        self.sampler = threading.Thread(target=self._sample, daemon=True)
+        self.started = time.perf_counter()
+        self.sampler.start()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.profile.disable()
+        self.elapsed = time.perf_counter() - self.started
+        self.stop_event.set()
+        self.sampler.join()
+        builtins.input = self.original_input
+
+        self.write()
+        self.print_summary()
+
+    def write(self):
+        self.profile.dump_stats(f"{self.prefix}.pstats")
+
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats("cumulative").print_stats()
+        with open(f"{self.prefix}.txt", "w") as f:
+            f.write(out.getvalue())
+
+        with open(f"{self.prefix}.collapsed", "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def print_summary(self, file=sys.stderr):
+        total = sum(self.categories.values())
+        print(f"\nProfiled {self.elapsed:.3f}s ({total} samples)", file=file)
+        for category, count in self.categories.most_common():
+            share = count / total if total else 0
+            print(
+                f"  {category:<28}{share * self.elapsed:>9.3f}s {share:>7.1%}",
+                file=file,
+            )
+        print(
+            f"Wrote {self.prefix}.pstats, {self.prefix}.txt and {self.prefix}.collapsed",
+            file=file,
+        )
+
+
+def profile_option(value: Optional[str]) -> Optional[str]:
+    """
+    `--profile` may be given with or without an output prefix.
+    """
+    if value is None:
+        return None
+
+    return value or f"profile-{time.strftime('%Y%m%d-%H%M%S')}"
@@ -0,0 +1,401 @@
+import contextvars
+import json
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from urllib.parse import parse_qsl, urlparse
+
+from web3.providers import JSONBaseProvider
+from web3.types import RPCEndpoint, RPCResponse
+
+from eulith_web3.eulith_service import add_params_to_url, ensure_formatted_ws_url
+from eulith_web3.eulith_web3 import EulithWeb3
+
+from scheduler import RequestScheduler, get_shared_scheduler, is_overloaded
+from transport import TransportConfig, connect_endpoint
+
+EULITH_METHOD_PREFIX = "eulith_"
+
+# Reads that can safely be sent more than once and to more than one endpoint. Anything else
+# (transaction sends, whitelist and signature submissions, atomic transaction calls) is sent
+# exactly once to one endpoint.
+IDEMPOTENT_METHODS = frozenset(
+    [
+        "eth_blockNumber",
+        "eth_call",
+        "eth_chainId",
+        "eth_estimateGas",
+        "eth_feeHistory",
+        "eth_gasPrice",
+        "eth_getBalance",
+        "eth_getBlockByHash",
+        "eth_getBlockByNumber",
+        "eth_getCode",
+        "eth_getLogs",
+        "eth_getStorageAt",
+        "eth_getTransactionByHash",
+        "eth_getTransactionCount",
+        "eth_getTransactionReceipt",
+        "eth_maxPriorityFeePerGas",
+        "net_version",
+        "eulith_erc_lookup",
+        "eulith_get_contracts",
+        "eulith_get_current_client_whitelist",
+        "eulith_get_current_client_whitelist_v2",
+        "eulith_get_draft_client_whitelist_hash",
+        "eulith_get_draft_client_whitelist_hash_v2",
+        "eulith_get_enable_module_sigs",
+        "eulith_get_setup_safe_tx",
+    ]
+)
+
+
+def json_default(o):
+    if isinstance(o, (bytes, bytearray)):
+        return "0x" + bytes(o).hex()
+
+    return str(o)
+
+
+def canonical_params(params: Any) -> str:
+    return json.dumps(params, sort_keys=True, default=json_default)
+
+
+class ProviderWrapper(JSONBaseProvider):
+    """
+    Base class for providers that sit in front of the Eulith websocket provider. Anything that
+    isn't a plain request (subscriptions, terminate, ...) is passed through to the inner provider.
+    """
+
+    def __init__(self, inner: JSONBaseProvider):
+        super().__init__()
+        self.inner = inner
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        return self.inner.make_request(method, params)
+
+    def terminate(self):
+        self.inner.terminate()
+
+    def __getattr__(self, item):
+        return getattr(self.inner, item)
+
+
+def install_provider(ew3: EulithWeb3, provider: JSONBaseProvider):
+    """
+    Route both JSON-RPC calls (ew3.eth...) and Eulith service calls (ew3.eulith_service...)
+    through `provider`. They share one provider, so wrapping it in one place catches both.
+    """
+    ew3.provider = provider
+    ew3.eulith_service.eulith_provider = provider
+
+
+class OverloadedError(Exception):
+    def __init__(self, method: str, response: RPCResponse):
+        super().__init__(f"{method}: endpoint overloaded: {response.get('error')}")
+        self.response = response
+
+
+class Endpoint:
+    """
+    One Eulith URL, its provider (connected on first use) and its recent health.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        connect: Callable[[], JSONBaseProvider],
+        window: int = 100,
+    ):
+        self.url = url
+        self.connect = connect
+        self.lock = threading.Lock()
+        self._provider = None
+        self.latencies_ms = deque(maxlen=window)
+        self.down_until = 0.0
+
+    @property
+    def provider(self) -> JSONBaseProvider:
+        with self.lock:
+            if self._provider is None:
+                self._provider = self.connect()
+            return self._provider
+
+    def latency_percentile(self, p: float) -> Optional[float]:
+        with self.lock:
+            if not self.latencies_ms:
+                return None
+            ordered = sorted(self.latencies_ms)
+
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    def succeeded(self, elapsed_ms: float):
+        with self.lock:
+            self.latencies_ms.append(elapsed_ms)
+            self.down_until = 0.0
+
+    def failed(self, cooldown_s: float):
+        with self.lock:
+            self.down_until = time.monotonic() + cooldown_s
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    def terminate(self):
+        with self.lock:
+            if self._provider is not None:
+                self._provider.terminate()
+
+
+class FailoverProvider(ProviderWrapper):
+    """
+    Spreads requests over an ordered list of Eulith endpoints.
+
+    Writes (see IDEMPOTENT_METHODS) go once to the first healthy endpoint and are never retried,
+    so a transaction is sent at most once. Reads go to the first healthy endpoint too, but if it
+    hasn't answered within its own `hedge_percentile` latency a duplicate is sent to the next
+    endpoint and whichever answers first wins. A read that fails or times out everywhere is
+    retried with jittered exponential backoff, up to `max_attempts` times.
+
+    JSON-RPC error responses (reverts, bad params, ...) are answers, not failures, and are
+    returned as they are. The exception is a read rejected because the endpoint is throttling or
+    overloaded, which is retried like a failure but doesn't take the endpoint out of rotation.
+
+    Every request, including hedges and retries, first waits for a slot from `scheduler`, which
+    applies the per-endpoint rate and concurrency limits.
+    """
+
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        hedge_percentile: float = 90,
+        min_samples: int = 10,
+        initial_hedge_delay_s: float = 1.0,
+        timeout_s: float = 30.0,
+        max_attempts: int = 3,
+        backoff_s: float = 0.25,
+        cooldown_s: float = 30.0,
+        scheduler: Optional[RequestScheduler] = None,
+    ):
+        super().__init__(endpoints[0].provider)
+        self.endpoints = endpoints
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.initial_hedge_delay_s = initial_hedge_delay_s
+        self.timeout_s = timeout_s
+        self.max_attempts = max_attempts
+        self.backoff_s = backoff_s
+        self.cooldown_s = cooldown_s
+        self.scheduler = scheduler or get_shared_scheduler()
+        self.pool = ThreadPoolExecutor(
+            max_workers=2 * self.scheduler.max_concurrency,
+            thread_name_prefix="eulith_failover",
+        )
+        self.hedges = 0
+        self.on_retry: Optional[Callable[[str], None]] = None
+        # (method, endpoint url, start unix time, elapsed ms, error or None) per attempt
+        self.on_attempt: Optional[Callable] = None
+
+    def candidates(self) -> List[Endpoint]:
+        healthy = [e for e in self.endpoints if e.available()]
+        return healthy or list(self.endpoints)
+
+    def hedge_delay(self, endpoint: Endpoint) -> float:
+        if len(self.endpoints) < 2 or len(endpoint.latencies_ms) < self.min_samples:
+            return self.initial_hedge_delay_s
+
+        return endpoint.latency_percentile(self.hedge_percentile) / 1000
+
+    def call(self, endpoint: Endpoint, method: RPCEndpoint, params: Any) -> RPCResponse:
+        with self.scheduler.slot(endpoint.url) as slot:
+            start_unix, start = time.time(), time.perf_counter()
+            try:
+                response = endpoint.provider.make_request(method, params)
+            except Exception as e:
+                slot.report(error=e)
+                endpoint.failed(self.cooldown_s)
+                self.report_attempt(method, endpoint, start_unix, start, repr(e))
+                raise
+
+            slot.report(response)
+            endpoint.succeeded((time.perf_counter() - start) * 1000)
+            self.report_attempt(method, endpoint, start_unix, start, None)
+
+        if method in IDEMPOTENT_METHODS and is_overloaded(response):
+            raise OverloadedError(method, response)
+
+        return response
+
+    def report_attempt(self, method, endpoint, start_unix, start, error):
+        if self.on_attempt:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.on_attempt(method, endpoint.url, start_unix, elapsed_ms, error)
+
+    def submit(self, endpoint: Endpoint, method: RPCEndpoint, params: Any) -> Future:
+        # Run in a copy of the caller's context, so context variables such as the current
+        # trace span follow the request onto the pool thread
+        context = contextvars.copy_context()
+        return self.pool.submit(context.run, self.call, endpoint, method, params)
+
+    def hedged_call(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        candidates = self.candidates()
+        deadline = time.monotonic() + self.timeout_s
+
+        first = self.submit(candidates[0], method, params)
+        pending = {first: candidates[0]}
+        spare = candidates[1:]
+        wait_s = min(self.hedge_delay(candidates[0]), self.timeout_s)
+        error = None
+
+        while pending:
+            done, _ = wait(pending, timeout=wait_s, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.pop(future)
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            # Send to the next endpoint if the ones in flight are slow (a hedge) or all failed
+            if spare and (not done or not pending):
+                if not done:
+                    self.hedges += 1
+                endpoint = spare.pop(0)
+                pending[self.submit(endpoint, method, params)] = endpoint
+                wait_s = min(self.hedge_delay(endpoint), remaining)
+            else:
+                wait_s = min(wait_s, remaining) if spare else remaining
+
+        for endpoint in pending.values():
+            endpoint.failed(self.cooldown_s)
+
+        raise error or TimeoutError(f"{method} timed out after {self.timeout_s}s")
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        if method not in IDEMPOTENT_METHODS:
+            return self.call(self.candidates()[0], method, params)
+
+        for attempt in range(self.max_attempts):
+            try:
+                return self.hedged_call(method, params)
+            except OverloadedError as e:
+                if attempt == self.max_attempts - 1:
+                    return e.response
+            except Exception:
+                if attempt == self.max_attempts - 1:
+                    raise
+
+            if self.on_retry:
+                self.on_retry(method)
+            time.sleep(random.uniform(0, self.backoff_s * 2**attempt))
+
+    def terminate(self):
+        # Terminating the providers also releases any pool thread stuck waiting on one
+        for endpoint in self.endpoints:
+            endpoint.terminate()
+        self.pool.shutdown(wait=False)
+
+
+def install_failover(
+    ew3: EulithWeb3,
+    urls: List[str],
+    transport: Optional[TransportConfig] = None,
+    **kwargs,
+) -> FailoverProvider:
+    """
+    Puts a FailoverProvider over `urls` in front of `ew3`. The first URL must be the one `ew3`
+    was created with. Every endpoint uses the tuned transport, with the same token and query
+    parameters (auth address, private mempool) as `ew3`; the first connects right away and the
+    others on first use. `transport` defaults to TransportConfig.from_env().
+    """
+    service = ew3.eulith_service
+    query = dict(parse_qsl(urlparse(service.eulith_url).query))
+    transport = transport or TransportConfig.from_env()
+
+    def connector(url):
+        uri = add_params_to_url(ensure_formatted_ws_url(url), query)
+        return lambda: connect_endpoint(uri, service.token, transport)
+
+    endpoints = [Endpoint(url, connector(url)) for url in urls]
+    # Start connecting now, as EulithWeb3 does; the handshake overlaps with the command's setup
+    endpoints[0].provider
+
+    # The plain EulithWebsocketProvider EulithWeb3 opened is replaced, not reused. Its
+    # terminate() waits on its send queue, so close it off the calling thread.
+    threading.Thread(
+        target=ew3.provider.terminate, name="eulith_ws_close", daemon=True
+    ).start()
+
+    failover = FailoverProvider(endpoints, **kwargs)
+    install_provider(ew3, failover)
+    return failover
+
+
+class RecordingProvider(ProviderWrapper):
+    """
+    Appends every request/response exchange to a cassette file (one JSON object per line),
+    for later replay with mock_eulith.py.
+    """
+
+    def __init__(
+        self, inner: JSONBaseProvider, cassette_path: str, meta: Optional[Dict] = None
+    ):
+        super().__init__(inner)
+        self.cassette_path = cassette_path
+        self.lock = threading.Lock()
+        self.file = open(cassette_path, "a")
+
+        # Lets a cassette be replayed with the command that produced it (see benchmarks/)
+        if meta:
+            self.file.write(json.dumps({"kind": "meta", **meta}) + "\n")
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        start = time.perf_counter()
+        response = self.inner.make_request(method, params)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        exchange = {
+            "kind": "eulith" if method.startswith(EULITH_METHOD_PREFIX) else "rpc",
+            "method": str(method),
+            "params": params,
+            "response": {k: v for k, v in response.items() if k != "id"},
+            "elapsed_ms": round(elapsed_ms, 3),
+        }
+
+        line = json.dumps(exchange, default=json_default)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+        return response
+
+    def terminate(self):
+        with self.lock:
+            self.file.close()
+        super().terminate()
+
+
+def read_cassette(path: str) -> Iterator[Dict]:
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def read_cassettes(paths: List[str]) -> List[Dict]:
+    return [e for p in paths for e in read_cassette(p) if e.get("kind") != "meta"]
+
+
+def read_cassette_meta(path: str) -> Dict:
+    for e in read_cassette(path):
+        if e.get("kind") == "meta":
+            return e
+
+    return {}
@@ -0,0 +1,339 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import json
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from web3.types import RPCEndpoint, RPCResponse
+
+from eulith_web3.eulith_service import EulithService
+from eulith_web3.eulith_web3 import EulithWeb3
+
+from providers import json_default
+
+KIND_RPC = "rpc"
+KIND_EULITH_SERVICE = "eulith_service"
+
+# Upper bounds in milliseconds; the last bucket catches everything slower
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# print_summary shows a latency histogram for each of the methods with the most total time
+HISTOGRAM_TOP_METHODS = 5
+
+# The span new spans nest under. A context variable rather than a thread local, so that
+# FailoverProvider can carry it onto the pool threads that send each attempt.
+CURRENT_SPAN: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "rpc_stats_span", default=None
+)
+
+INSTRUMENTATION_MIDDLEWARE_NAME = "rpc_stats"
+
+SEND_METHODS = ("eth_sendRawTransaction", "eth_sendTransaction")
+
+
+def payload_size(obj: Any) -> int:
+    try:
+        return len(json.dumps(obj, default=json_default))
+    except (TypeError, ValueError):
+        return 0
+
+
+def percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def format_buckets(buckets: List[int]) -> str:
+    labels = [f"<={b}" for b in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}"]
+    return ", ".join(f"{label}: {n}" for label, n in zip(labels, buckets) if n)
+
+
+class CallStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.samples_ms = []
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, elapsed_ms: float, sent: int, received: int, error: bool):
+        self.count += 1
+        self.errors += int(error)
+        self.bytes_sent += sent
+        self.bytes_received += received
+        self.samples_ms.append(elapsed_ms)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    @property
+    def total_ms(self) -> float:
+        return sum(self.samples_ms)
+
+
+class RpcStats:
+    """
+    Per-method call counts, latency histograms, payload sizes and errors for one CLI run.
+
+    JSON-RPC calls are measured by a middleware at the innermost layer of the onion, so they are
+    counted as they go over the wire (after signing turns eth_sendTransaction into
+    eth_sendRawTransaction). Eulith service calls bypass the middleware onion, so they are
+    measured by wrapping the `ew3.eulith_service` methods.
+
+    If `trace_path` is set, every call is also written there as a span (one JSON object per
+    line), nested under the span of the subcommand that made it. With failover installed, each
+    attempt at an endpoint (including hedges) is a span nested under its JSON-RPC call.
+    """
+
+    def __init__(self, trace_path: Optional[str] = None):
+        self.lock = threading.Lock()
+        self.calls: Dict[Tuple[str, str], CallStats] = {}
+        self.retries: Dict[str, int] = {}
+        self.sent_transactions: List[str] = []
+        self.trace_id = uuid.uuid4().hex
+        self.trace_file = open(trace_path, "a") if trace_path else None
+
+    def record(
+        self,
+        kind: str,
+        name: str,
+        start: float,
+        elapsed_ms: float,
+        sent: int = 0,
+        received: int = 0,
+        error: Optional[str] = None,
+        span_id: Optional[str] = None,
+    ):
+        with self.lock:
+            stats = self.calls.setdefault((kind, name), CallStats())
+            stats.add(elapsed_ms, sent, received, error is not None)
+
+        self._write_span(
+            kind, name, start, elapsed_ms, sent, received, error, span_id=span_id
+        )
+
+    def record_retry(self, name: str):
+        with self.lock:
+            self.retries[name] = self.retries.get(name, 0) + 1
+
+    def record_attempt(
+        self,
+        method: str,
+        url: str,
+        start: float,
+        elapsed_ms: float,
+        error: Optional[str],
+    ):
+        """
+        One request to one endpoint, as reported by FailoverProvider.on_attempt. Only traced;
+        the call itself is already counted by the middleware.
+        """
+        # The host only: endpoint URLs may carry an API key in the path or query
+        host = urlsplit(url).netloc or url
+        self._write_span("endpoint", f"{method} {host}", start, elapsed_ms, 0, 0, error)
+
+    def _write_span(self, kind, name, start, elapsed_ms, sent, received, error, **kw):
+        if not self.trace_file:
+            return
+
+        span = {
+            "trace_id": self.trace_id,
+            "span_id": kw.pop("span_id", None) or uuid.uuid4().hex[:16],
+            "parent_id": kw.pop("parent_id", None) or CURRENT_SPAN.get(),
+            "kind": kind,
+            "name": name,
+            "thread": threading.current_thread().name,
+            "start_unix": start,
+            "duration_ms": round(elapsed_ms, 3),
+            "bytes_sent": sent,
+            "bytes_received": received,
+            "error": error,
+        }
+        line = json.dumps(span, default=json_default)
+        with self.lock:
+            self.trace_file.write(line + "\n")
+
+    @contextmanager
+    def span(self, name: str, kind: str = "command"):
+        span_id = uuid.uuid4().hex[:16]
+        parent = CURRENT_SPAN.get()
+        token = CURRENT_SPAN.set(span_id)
+        start, t0 = time.time(), time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            CURRENT_SPAN.reset(token)
+            elapsed_ms = (time.perf_counter() - t0) * 1000
+            self._write_span(
+                kind,
+                name,
+                start,
+                elapsed_ms,
+                0,
+                0,
+                error,
+                span_id=span_id,
+                parent_id=parent,
+            )
+
+    def middleware(
+        self, make_request: Callable[[RPCEndpoint, Any], Any], w3: "EulithWeb3"
+    ) -> Callable[[RPCEndpoint, Any], RPCResponse]:
+        def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
+            span_id = uuid.uuid4().hex[:16]
+            start, t0 = time.time(), time.perf_counter()
+            # Endpoint attempts made below this call nest under its span
+            token = CURRENT_SPAN.set(span_id)
+            try:
+                response = make_request(method, params)
+            except Exception as e:
+                CURRENT_SPAN.reset(token)
+                self.record(
+                    KIND_RPC,
+                    method,
+                    start,
+                    (time.perf_counter() - t0) * 1000,
+                    payload_size(params),
+                    0,
+                    repr(e),
+                    span_id=span_id,
+                )
+                raise
+            CURRENT_SPAN.reset(token)
+
+            error = response.get("error") if isinstance(response, dict) else None
+            if method in SEND_METHODS and not error and response.get("result"):
+                with self.lock:
+                    self.sent_transactions.append(response["result"])
+
+            self.record(
+                KIND_RPC,
+                method,
+                start,
+                (time.perf_counter() - t0) * 1000,
+                payload_size(params),
+                payload_size(response),
+                str(error) if error else None,
+                span_id=span_id,
+            )
+            return response
+
+        return middleware
+
+    def wrap_service_method(self, name: str, fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapped(*args, **kwargs):
+            start, t0 = time.time(), time.perf_counter()
+            error = None
+            result = None
+            try:
+                result = fn(*args, **kwargs)
+                # Most service calls report failure as a (False, error) tuple rather than raising
+                if (
+                    isinstance(result, tuple)
+                    and len(result) == 2
+                    and result[0] is False
+                ):
+                    error = str(result[1])
+                return result
+            except Exception as e:
+                error = repr(e)
+                raise
+            finally:
+                self.record(
+                    KIND_EULITH_SERVICE,
+                    name,
+                    start,
+                    (time.perf_counter() - t0) * 1000,
+                    payload_size([args, kwargs]),
+                    payload_size(result),
+                    error,
+                )
+
+        return wrapped
+
+    def install(self, ew3: EulithWeb3):
+        ew3.middleware_onion.inject(
+            self.middleware, name=INSTRUMENTATION_MIDDLEWARE_NAME, layer=0
+        )
+
+        service = ew3.eulith_service
+        for name, fn in inspect.getmembers(EulithService, inspect.isfunction):
+            if name.startswith("_") or name in ("terminate", "is_atomic"):
+                continue
+            setattr(
+                service, name, self.wrap_service_method(name, getattr(service, name))
+            )
+
+    def rows(self) -> List[Tuple[str, str, CallStats]]:
+        with self.lock:
+            return sorted(
+                ((k, n, s) for (k, n), s in self.calls.items()),
+                key=lambda r: -r[2].total_ms,
+            )
+
+    def print_summary(self, file=sys.stderr):
+        rows = self.rows()
+        if not rows:
+            print("\nNo RPC calls were made.", file=file)
+            return
+
+        print(
+            f"\n{'kind':<16}{'method':<44}{'calls':>6}{'errors':>7}{'p50 ms':>9}"
+            f"{'p95 ms':>9}{'max ms':>9}{'total ms':>10}{'sent B':>9}{'recv B':>9}",
+            file=file,
+        )
+        for kind, name, s in rows:
+            print(
+                f"{kind:<16}{name:<44}{s.count:>6}{s.errors:>7}"
+                f"{percentile(s.samples_ms, 50):>9.1f}{percentile(s.samples_ms, 95):>9.1f}"
+                f"{max(s.samples_ms):>9.1f}{s.total_ms:>10.1f}"
+                f"{s.bytes_sent:>9}{s.bytes_received:>9}",
+                file=file,
+            )
+
+        rpc = [s for k, _, s in rows if k == KIND_RPC]
+        print(
+            f"\n{sum(s.count for s in rpc)} JSON-RPC round trips, "
+            f"{sum(s.count for k, _, s in rows if k == KIND_EULITH_SERVICE)} Eulith service calls",
+            file=file,
+        )
+        if not rpc:
+            return
+
+        print(
+            "Latency histogram (all JSON-RPC calls, upper bound ms): "
+            + ", ".join(
+                f"<={b}: {sum(s.buckets[i] for s in rpc)}"
+                for i, b in enumerate(LATENCY_BUCKETS_MS)
+            )
+            + f", >{LATENCY_BUCKETS_MS[-1]}: {sum(s.buckets[-1] for s in rpc)}",
+            file=file,
+        )
+
+        top = [(k, n, s) for k, n, s in rows if k == KIND_RPC][:HISTOGRAM_TOP_METHODS]
+        print(
+            f"Latency histogram of the {len(top)} methods with the most total time "
+            f"(upper bound ms, empty buckets omitted):",
+            file=file,
+        )
+        for _, name, s in top:
+            print(f"  {name:<42}{format_buckets(s.buckets)}", file=file)
+
+    def close(self):
+        if self.trace_file:
+            self.trace_file.close()
+            self.trace_file = None
@@ -2,7 +2,7 @@
 
 # Check if the first argument is "interactive"
 if [ "$1" = "interactive" ]; then
-    source .venv/bin/activate && python interactive.py
+    source .venv/bin/activate && python interactive.py "${@:2}"
 else
     source .venv/bin/activate && python armor.py "$@"
 fi
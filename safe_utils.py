@@ -1,11 +1,14 @@
-from typing import List
+from typing import Dict, List, Optional
 
 import web3
 from web3.types import ChecksumAddress
 
-from eulith_web3.contract_bindings.safe.i_safe import ISafe
-from eulith_web3.erc20 import EulithERC20
 from eulith_web3.eulith_web3 import EulithWeb3
+from eulith_web3.exceptions import EulithRpcException
+
+from balance_watch import BalanceReader, TrackedToken, watch_balances
+from bindings import get_chain_id, get_erc20, get_safe
+from local_store import LocalStore
 
 
 NULL_ADDRESS = "0x0000000000000000000000000000000000000000"
@@ -28,7 +31,7 @@ def int_to_byte(value: int) -> bytes:
 
 
 def approve_tx_hash(ew3: EulithWeb3, tx_hash: bytes, safe_addr: str) -> str:
-    safe = ISafe(ew3, ew3.to_checksum_address(safe_addr))
+    safe = get_safe(ew3, safe_addr)
 
     approve_tx = safe.approve_hash(tx_hash, {"from": ew3.wallet_address, "gas": 300000})
 
@@ -38,13 +41,24 @@ def approve_tx_hash(ew3: EulithWeb3, tx_hash: bytes, safe_addr: str) -> str:
 
 
 def get_safe_balance(ew3, wallet, auth_address, args):
-    token = get_token_address(ew3, args.token)
-    safe = ew3.to_checksum_address(args.safe)
-
-    tc = EulithERC20(ew3, token)
-    bal = tc.balance_of_float(safe)
-
-    print(f"\nYour safe has a balance of {bal} for token {tc.symbol} ({tc.address}).")
+    safes = [ew3.to_checksum_address(s) for s in args.safe]
+    tokens = [resolve_token(ew3, t) for t in args.token]
+    reader = BalanceReader(ew3, safes, tokens)
+
+    if args.watch:
+        try:
+            watch_balances(ew3, reader, args.interval, args.poll)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    for i, balance in enumerate(reader.read("latest")):
+        row = reader.describe(i, balance, "latest")
+        owner = "Your safe" if len(safes) == 1 else f"Safe {row['safe']}"
+        print(
+            f"\n{owner} has a balance of {row['amount']} for token "
+            f"{row['symbol']} ({row['token']})."
+        )
 
 
 def handle_start_transfer(ew3, wallet, auth_address, args):
@@ -59,24 +73,64 @@ def handle_start_transfer(ew3, wallet, auth_address, args):
         data = b""
         to = dest
     else:
-        erc = EulithERC20(ew3, token)
+        erc = get_erc20(ew3, token)
         print(f"Starting a transfer of {amount} {erc.symbol} ({erc.address}) to {dest}")
         value = 0
-        tt = erc.transfer_float(dest, amount, {"from": safe, "gas": 0})
-        data = bytearray.fromhex(tt.get("data")[2:])
+        data = erc.transfer_data_float(dest, amount)
         to = erc.address
 
-    tx_hash = get_tx_hash(ew3, safe, to, value, data)
+    isafe = get_safe(ew3, safe)
+    chain_id = get_chain_id(ew3)
+
+    with LocalStore() as store:
+        nonce = isafe.nonce()
+        queued = [
+            t["nonce"]
+            for t in store.pending_transfers(chain_id, safe)
+            if t["nonce"] >= nonce
+        ]
+        if args.queue and queued:
+            nonce = max(queued) + 1
+        elif nonce in queued:
+            print(
+                f"Another transfer started from this machine also uses nonce {nonce}; only one "
+                f"of them can execute. Pass --queue to use the next free nonce instead."
+            )
+
+        tx_hash = get_tx_hash(ew3, safe, to, value, data, nonce)
+        store.add_pending_transfer(
+            "0x" + tx_hash.hex(),
+            chain_id,
+            safe,
+            nonce,
+            token,
+            dest,
+            amount,
+            to,
+            value,
+            data,
+        )
 
-    safe = ISafe(ew3, safe)
-    thresh = safe.get_threshold()
+    thresh = isafe.get_threshold()
 
     print(
         f"Please approve this hash with at least {thresh} owners: 0x{tx_hash.hex()}\n"
+        f"It uses Safe nonce {nonce}; once approved, execute it with "
+        f"`execute-safe-transfer --hash 0x{tx_hash.hex()} --owners ...`\n"
     )
 
 
 def handle_execute_transfer(ew3, wallet, auth_address, args):
+    if args.hash:
+        execute_pending_transfers(ew3, args.hash, args.owners or [])
+        return
+
+    if None in (args.safe, args.token, args.dest, args.amount, args.owners):
+        print(
+            "Pass either --hash or all of --safe, --token, --dest, --amount and --owners"
+        )
+        exit(1)
+
     safe = ew3.to_checksum_address(args.safe)
     token = get_token_address(ew3, args.token)
     amount = args.amount
@@ -92,7 +146,7 @@ def handle_execute_transfer(ew3, wallet, auth_address, args):
         bal_before = float(ew3.eth.get_balance(dest) / 1e18)
         to = dest
     else:
-        erc = EulithERC20(ew3, token)
+        erc = get_erc20(ew3, token)
         print(
             f"Executing a transfer of {amount} {erc.symbol} ({erc.address}) from | SAFE: {safe} | ---> to {dest}"
         )
@@ -101,10 +155,7 @@ def handle_execute_transfer(ew3, wallet, auth_address, args):
         safe_bal_of_token = erc.balance_of_float(safe)
         assert safe_bal_of_token >= amount
 
-        tt = erc.transfer_float(
-            dest, amount, {"gas": 200000, "from": ew3.wallet_address}
-        )
-        data = bytearray.fromhex(tt.get("data")[2:])
+        data = erc.transfer_data_float(dest, amount)
         bal_before = erc.balance_of_float(dest)
         to = erc.address
 
@@ -115,11 +166,10 @@ def handle_execute_transfer(ew3, wallet, auth_address, args):
         print(f"Something went wrong with the execution, received error: {e}")
         exit(1)
 
-    if token == NULL_ADDRESS:
-        bal_now = float(ew3.eth.get_balance(dest) / 1e18)
-    else:
-        erc = EulithERC20(ew3, token)
-        bal_now = erc.balance_of_float(dest)
+    require_success(ew3, tx_hash)
+    record_local_action(ew3, safe, "execute", None, tx_hash)
+
+    bal_now = get_balance_float(ew3, token, dest)
 
     print(f"Successfully executed the transfer from safe {safe} at tx: {tx_hash}")
     print(
@@ -127,11 +177,146 @@ def handle_execute_transfer(ew3, wallet, auth_address, args):
     )
 
 
+def load_pending_transfers(ew3: EulithWeb3, hashes: List[str]) -> List:
+    """
+    Loads transfers saved by start-safe-transfer, in nonce order, and checks they are the next
+    ones the safe will execute.
+    """
+    chain_id = get_chain_id(ew3)
+
+    with LocalStore() as store:
+        transfers = []
+        for h in hashes:
+            transfer = store.get_pending_transfer(h)
+            if transfer is None or transfer["chain_id"] != chain_id:
+                print(
+                    f"No transfer with hash {h} was started from this machine on this network"
+                )
+                exit(1)
+            if transfer["executed_tx_hash"]:
+                print(
+                    f"Transfer {h} was already executed at tx: {transfer['executed_tx_hash']}"
+                )
+                exit(1)
+            transfers.append(transfer)
+
+        if len({t["safe"] for t in transfers}) > 1:
+            print("Transfers executed together must all be from the same safe")
+            exit(1)
+
+        transfers.sort(key=lambda t: t["nonce"])
+        safe = transfers[0]["safe"]
+        nonce = get_safe(ew3, safe).nonce()
+
+        for i, transfer in enumerate(transfers):
+            expected = nonce + i
+            if transfer["nonce"] < expected:
+                print(
+                    f"The safe's nonce has moved past transfer {transfer['safe_tx_hash']} "
+                    f"(nonce {transfer['nonce']}); start it again to get a new hash"
+                )
+                exit(1)
+            if transfer["nonce"] > expected:
+                earlier = [
+                    t["safe_tx_hash"]
+                    for t in store.pending_transfers(chain_id, safe)
+                    if expected <= t["nonce"] < transfer["nonce"]
+                ]
+                print(
+                    f"Transfer {transfer['safe_tx_hash']} has nonce {transfer['nonce']}, but the "
+                    f"safe will execute nonce {expected} next. Execute these first: "
+                    f"{', '.join(earlier) or 'none started from this machine'}"
+                )
+                exit(1)
+
+    return transfers
+
+
+def execute_pending_transfers(ew3: EulithWeb3, hashes: List[str], owners: List[str]):
+    transfers = load_pending_transfers(ew3, hashes)
+    safe = ew3.to_checksum_address(transfers[0]["safe"])
+
+    # Owners who signed off-chain (see import-signed) don't need to be passed with --owners
+    with LocalStore() as store:
+        signatures = {
+            t["safe_tx_hash"]: store.get_safe_signatures(t["safe_tx_hash"])
+            for t in transfers
+        }
+
+    for t in transfers:
+        token = ew3.to_checksum_address(t["token"])
+        symbol = (
+            "native token" if token == NULL_ADDRESS else get_erc20(ew3, token).symbol
+        )
+        print(
+            f"Nonce {t['nonce']}: transfer of {t['amount']} {symbol} from | SAFE: {safe} | "
+            f"---> to {ew3.to_checksum_address(t['dest'])} ({t['safe_tx_hash']})"
+        )
+
+    input("\nPlease hit ENTER to proceed...\n")
+    for i, t in enumerate(transfers):
+        token = ew3.to_checksum_address(t["token"])
+        dest = ew3.to_checksum_address(t["dest"])
+        bal_before = get_balance_float(ew3, token, dest)
+
+        signed = signatures[t["safe_tx_hash"]]
+        signers = {o.lower() for o in owners} | set(signed)
+        if not signers:
+            print(
+                f"No owners given or signatures imported for {t['safe_tx_hash']}; pass --owners"
+            )
+            exit(1)
+
+        try:
+            tx_hash = execute_tx(
+                ew3,
+                safe,
+                ew3.to_checksum_address(t["to_address"]),
+                int(t["value"]),
+                bytes.fromhex(t["data"][2:]),
+                sorted(signers),
+                signed,
+            )
+        except web3.exceptions.ContractLogicError as e:
+            print(f"Something went wrong with the execution, received error: {e}")
+            exit(1)
+
+        # The next transfer's signatures are only valid once this one bumped the nonce, and
+        # a reverted transfer must stay pending so it can be executed again
+        require_success(ew3, tx_hash, t["safe_tx_hash"])
+        record_local_action(ew3, safe, "execute", t["safe_tx_hash"], tx_hash)
+
+        bal_now = get_balance_float(ew3, token, dest)
+        print(f"Successfully executed the transfer from safe {safe} at tx: {tx_hash}")
+        print(
+            f"Destination: {dest} had balance {bal_before} before the transfer, and now has balance: {bal_now}\n"
+        )
+
+
+def require_success(ew3: EulithWeb3, tx_hash: str, safe_tx_hash: Optional[str] = None):
+    """
+    Waits for the receipt of an execTransaction and exits if it reverted.
+    """
+    receipt = ew3.eth.wait_for_transaction_receipt(tx_hash)
+    if receipt["status"] != 1:
+        pending = f"; transfer {safe_tx_hash} is still pending" if safe_tx_hash else ""
+        print(f"The execution reverted at tx: {tx_hash}{pending}")
+        exit(1)
+
+    return receipt
+
+
+def get_balance_float(ew3: EulithWeb3, token: str, holder: str) -> float:
+    if token == NULL_ADDRESS:
+        return float(ew3.eth.get_balance(holder) / 1e18)
+    return get_erc20(ew3, token).balance_of_float(holder)
+
+
 def handle_approve_hash(ew3, wallet, auth_address, args):
     safe = ew3.to_checksum_address(args.safe)
     to_approve = args.hash
 
-    isafe = ISafe(ew3, safe)
+    isafe = get_safe(ew3, safe)
     is_owner = isafe.is_owner(ew3.to_checksum_address(ew3.wallet_address))
 
     if not is_owner:
@@ -143,26 +328,49 @@ def handle_approve_hash(ew3, wallet, auth_address, args):
     parsed_hash = bytearray.fromhex(to_approve[2:])
 
     tx_hash = approve_tx_hash(ew3, parsed_hash, safe)
+    record_local_action(ew3, safe, "approve", to_approve, tx_hash)
 
     print(
         f"Successfully approved hash for owner: {ew3.wallet_address} at tx: {tx_hash}\n"
     )
 
 
+def record_local_action(
+    ew3: EulithWeb3, safe: str, kind: str, safe_tx_hash, tx_hash: str
+):
+    # The transaction is already sent; a broken local store must not make it look failed
+    try:
+        with LocalStore() as store:
+            store.record_action(
+                get_chain_id(ew3), safe, kind, safe_tx_hash, tx_hash, ew3.wallet_address
+            )
+            if kind == "execute" and safe_tx_hash:
+                store.mark_transfer_executed(safe_tx_hash, tx_hash)
+    except Exception as e:
+        print(f"Could not record the {kind} in the local store: {e}")
+
+
 def get_tx_hash(
-    ew3: EulithWeb3, safe_addr: str, to: str, value: int, data: bytes
+    ew3: EulithWeb3,
+    safe_addr: str,
+    to: str,
+    value: int,
+    data: bytes,
+    nonce: Optional[int] = None,
 ) -> bytes:
     """
     Note: This is a simplified abstraction over the full safe method. We do not handle any gas parameters
     in this method; they are set automatically by the estimation logic. If you would like to modify them, you can
     call the safe directly like we do below.
 
+    :param nonce: Safe nonce to build the hash for; defaults to the safe's current nonce
     :return: Transaction hash as bytes
     """
 
-    safe = ISafe(ew3, ew3.to_checksum_address(safe_addr))
+    safe = get_safe(ew3, safe_addr)
 
-    nonce = safe.nonce()
+    if nonce is None:
+        nonce = safe.nonce()
 
     tx_hash = safe.get_transaction_hash(
         to, value, data, 0, 0, 0, 0, NULL_ADDRESS, NULL_ADDRESS, nonce
@@ -171,23 +379,81 @@ def get_tx_hash(
     return tx_hash
 
 
+def get_safe_tx_typed_data(
+    safe_addr: str, chain_id: int, to: str, value: int, data: bytes, nonce: int
+) -> Dict:
+    """
+    EIP-712 typed data of a Safe transaction with no gas refund, as built by `get_tx_hash`.
+    Its hash is the Safe transaction hash, so hardware wallets can show what they sign.
+    """
+    return {
+        "types": {
+            "EIP712Domain": [
+                {"name": "chainId", "type": "uint256"},
+                {"name": "verifyingContract", "type": "address"},
+            ],
+            "SafeTx": [
+                {"name": "to", "type": "address"},
+                {"name": "value", "type": "uint256"},
+                {"name": "data", "type": "bytes"},
+                {"name": "operation", "type": "uint8"},
+                {"name": "safeTxGas", "type": "uint256"},
+                {"name": "baseGas", "type": "uint256"},
+                {"name": "gasPrice", "type": "uint256"},
+                {"name": "gasToken", "type": "address"},
+                {"name": "refundReceiver", "type": "address"},
+                {"name": "nonce", "type": "uint256"},
+            ],
+        },
+        "primaryType": "SafeTx",
+        "domain": {"chainId": chain_id, "verifyingContract": safe_addr},
+        "message": {
+            "to": to,
+            "value": value,
+            "data": bytes(data),
+            "operation": 0,
+            "safeTxGas": 0,
+            "baseGas": 0,
+            "gasPrice": 0,
+            "gasToken": NULL_ADDRESS,
+            "refundReceiver": NULL_ADDRESS,
+            "nonce": nonce,
+        },
+    }
+
+
 def execute_tx(
-    ew3: EulithWeb3, safe_addr: str, to: str, value: int, data: bytes, owners: List[str]
+    ew3: EulithWeb3,
+    safe_addr: str,
+    to: str,
+    value: int,
+    data: bytes,
+    owners: List[str],
+    signatures: Optional[Dict[str, bytes]] = None,
 ) -> str:
     """
-    This method assumes you have approved the tx hash generated by the specified tx parameters.
+    This method assumes you have approved the tx hash generated by the specified tx parameters,
+    either on-chain with approveHash or off-chain with a signature in `signatures`.
 
     Note: This is a simplified abstraction over the full safe method. We do not handle any gas parameters
     in this method; they are set automatically by the estimation logic. If you would like to modify them, you can
     call the safe directly like we do below.
 
+    :param signatures: 65 byte ECDSA signatures (v of 0 or 1) of the Safe tx hash, by owner
     :return: Transaction hash of the executed transaction
     """
-    safe = ISafe(ew3, ew3.to_checksum_address(safe_addr))
+    safe = get_safe(ew3, safe_addr)
+    offchain = {o.lower(): sig for o, sig in (signatures or {}).items()}
 
     signatures = bytearray()
 
-    for o in owners:
+    # The Safe checks signatures in ascending owner order
+    for o in sorted(owners, key=lambda o: int(o, 16)):
+        sig = offchain.get(o.lower())
+        if sig is not None:
+            signatures += sig[:64] + int_to_byte(sig[64] + 27)
+            continue
+
         r = pad32(int_to_big_endian(int(ew3.to_checksum_address(o), 16)))
         s = pad32(int_to_big_endian(0))
         v = int_to_byte(1)
@@ -218,9 +484,28 @@ def execute_tx(
     return r.hex()
 
 
+def resolve_token(ew3: EulithWeb3, token: str) -> TrackedToken:
+    if token.startswith("0x"):
+        address = ew3.to_checksum_address(token)
+        if address == NULL_ADDRESS:
+            return TrackedToken(address, "native", 18, True)
+        erc20 = get_erc20(ew3, address)
+        return TrackedToken(erc20.address, erc20.symbol, erc20.decimals, False)
+
+    status, address, decimals = ew3.eulith_service.lookup_token_symbol(token)
+    if not status:
+        raise EulithRpcException(address)
+
+    return TrackedToken(ew3.to_checksum_address(address), token, decimals, False)
+
+
 def get_token_address(ew3: EulithWeb3, token: str) -> ChecksumAddress:
     if token.startswith("0x"):
-        return ew3.to_checksum_address(args.token)
+        return ew3.to_checksum_address(token)
     else:
-        erc20 = ew3.eulith_get_erc_token(token)
-        return ew3.to_checksum_address(erc20.address)
+        # Only the address is needed, so skip the symbol read eulith_get_erc_token does
+        status, address, _ = ew3.eulith_service.lookup_token_symbol(token)
+        if not status:
+            raise EulithRpcException(address)
+
+        return ew3.to_checksum_address(address)
@@ -0,0 +1,220 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+DEFAULT_RATE_LIMIT = 25.0
+DEFAULT_BURST = 50
+DEFAULT_INITIAL_CONCURRENCY = 4
+DEFAULT_MAX_CONCURRENCY = 32
+
+OUTCOME_OK = "ok"
+OUTCOME_OVERLOADED = "overloaded"
+OUTCOME_FAILED = "failed"
+
+# JSON-RPC error codes used for "slow down": HTTP 429 passed through, and the codes commonly
+# used by node providers for request/limit exceeded
+OVERLOAD_ERROR_CODES = {429, -32005, -32029}
+OVERLOAD_MARKERS = (
+    "rate limit",
+    "rate-limit",
+    "too many requests",
+    "service unavailable",
+    "bad gateway",
+    "gateway timeout",
+    "overloaded",
+)
+
+
+def is_overloaded(response: Any = None, error: Optional[Exception] = None) -> bool:
+    """
+    True if a response or exception means the endpoint is throttling us or is overloaded
+    (HTTP 429/5xx or their JSON-RPC equivalents), as opposed to an ordinary error.
+    """
+    if error is not None:
+        status = getattr(error, "status_code", None)
+        if isinstance(status, int) and (status == 429 or status >= 500):
+            return True
+        text = str(error)
+    else:
+        rpc_error = response.get("error") if isinstance(response, dict) else None
+        if not rpc_error:
+            return False
+        if isinstance(rpc_error, dict):
+            if rpc_error.get("code") in OVERLOAD_ERROR_CODES:
+                return True
+            text = str(rpc_error.get("message", ""))
+        else:
+            text = str(rpc_error)
+
+    text = text.lower()
+    return any(m in text for m in OVERLOAD_MARKERS)
+
+
+class TokenBucket:
+    """
+    Allows `rate` requests per second on average, with bursts of up to `burst`.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_s = (1 - self.tokens) / self.rate
+
+            time.sleep(wait_s)
+
+
+class AimdLimiter:
+    """
+    Caps the number of requests in flight. The cap grows by one for every `limit` successful
+    requests and is halved when the endpoint says it is overloaded, at most once per
+    `cooldown_s` so that one burst of rejections only counts once.
+    """
+
+    def __init__(
+        self,
+        initial: int = DEFAULT_INITIAL_CONCURRENCY,
+        minimum: int = 1,
+        maximum: int = DEFAULT_MAX_CONCURRENCY,
+        decrease: float = 0.5,
+        cooldown_s: float = 1.0,
+    ):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.cooldown_s = cooldown_s
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, outcome: str):
+        with self.condition:
+            self.in_flight -= 1
+            if outcome == OUTCOME_OVERLOADED:
+                now = time.monotonic()
+                if now - self.last_decrease >= self.cooldown_s:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self.last_decrease = now
+            elif outcome == OUTCOME_OK:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+
+class Slot:
+    def __init__(self):
+        self.outcome = OUTCOME_FAILED
+
+    def report(self, response: Any = None, error: Optional[Exception] = None):
+        if is_overloaded(response, error):
+            self.outcome = OUTCOME_OVERLOADED
+        elif error is not None:
+            self.outcome = OUTCOME_FAILED
+        else:
+            self.outcome = OUTCOME_OK
+
+
+class RequestScheduler:
+    """
+    Back-pressure for everything that talks to a Eulith endpoint. Each endpoint gets a token
+    bucket (`rate` requests per second, None for no limit) and an AIMD concurrency limit.
+    Callers that fan out with thread pools don't need their own limits: threads beyond the
+    current limit simply wait in `slot`.
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float] = DEFAULT_RATE_LIMIT,
+        burst: int = DEFAULT_BURST,
+        initial_concurrency: int = DEFAULT_INITIAL_CONCURRENCY,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.lock = threading.Lock()
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.limiters: Dict[str, AimdLimiter] = {}
+        self.overloaded = 0
+
+    def _for(self, key: str):
+        with self.lock:
+            if key not in self.limiters:
+                self.limiters[key] = AimdLimiter(
+                    min(self.initial_concurrency, self.max_concurrency),
+                    maximum=self.max_concurrency,
+                )
+                if self.rate:
+                    self.buckets[key] = TokenBucket(self.rate, self.burst)
+            return self.buckets.get(key), self.limiters[key]
+
+    @contextmanager
+    def slot(self, key: str):
+        """
+        Waits for a token and a concurrency slot for endpoint `key`. The caller reports how the
+        request went with `slot.report(...)`; a slot that isn't reported counts as failed.
+        """
+        bucket, limiter = self._for(key)
+        if bucket:
+            bucket.acquire()
+        limiter.acquire()
+
+        slot = Slot()
+        try:
+            yield slot
+        finally:
+            if slot.outcome == OUTCOME_OVERLOADED:
+                with self.lock:
+                    self.overloaded += 1
+            limiter.release(slot.outcome)
+
+    def concurrency(self) -> Dict[str, int]:
+        with self.lock:
+            return {k: int(v.limit) for k, v in self.limiters.items()}
+
+
+_shared_scheduler = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_scheduler() -> RequestScheduler:
+    """
+    The process-wide scheduler, so that every EulithWeb3 talking to the same endpoint (one per
+    network in `audit --networks`, for example) shares its limits. EULITH_RATE_LIMIT
+    (requests per second, 0 for none) and EULITH_MAX_CONCURRENCY override the defaults.
+    """
+    global _shared_scheduler
+
+    with _shared_lock:
+        if _shared_scheduler is None:
+            rate = float(os.environ.get("EULITH_RATE_LIMIT", DEFAULT_RATE_LIMIT))
+            _shared_scheduler = RequestScheduler(
+                rate=rate or None,
+                max_concurrency=int(
+                    os.environ.get("EULITH_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)
+                ),
+            )
+        return _shared_scheduler
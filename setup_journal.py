@@ -0,0 +1,468 @@
+import json
+from typing import Callable, Dict, List, Optional, Tuple
+
+from hexbytes import HexBytes
+from web3 import Web3
+
+from eulith_web3.eulith_web3 import EulithWeb3
+from eulith_web3.exceptions import EulithRpcException
+
+from bindings import get_safe
+from fleet_utils import whitelist_addresses, wait_for_success
+from local_store import LocalStore
+
+STEP_PLAN = "plan"
+STEP_DEPLOY = "deploy"
+STEP_OWNER_SIGNATURES = "owner-signatures"
+STEP_ENABLE = "enable"
+STEP_SUBMIT_SETUP_SAFE = "submit-setup-safe"
+STEP_CREATE_WHITELIST = "create-whitelist"
+STEP_SIGN_WHITELIST = "sign-whitelist"
+
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_WAITING = "waiting"
+STATUS_FAILED = "failed"
+STATUS_DONE = "done"
+
+
+class SetupJournal:
+    """
+    The setup steps recorded for one trading key on one chain. A transaction's sender and nonce
+    are journaled before it is broadcast and its hash before waiting for its receipt, so a
+    restarted setup finds the same transaction instead of sending another one.
+    """
+
+    def __init__(self, store: LocalStore, chain_id: int, trading_address: str):
+        self.store = store
+        self.chain_id = chain_id
+        self.trading_address = trading_address
+        self.steps = store.get_setup_steps(chain_id, trading_address)
+
+    def status(self, step: str) -> Optional[str]:
+        row = self.steps.get(step)
+        return row["status"] if row else None
+
+    def tx_hash(self, step: str) -> Optional[str]:
+        row = self.steps.get(step)
+        return row["tx_hash"] if row else None
+
+    def sent_tx_hash(self, step: str) -> Optional[str]:
+        """
+        The step's transaction if it was sent and its outcome is not known yet.
+        """
+        return self.tx_hash(step) if self.status(step) == STATUS_SENT else None
+
+    def inputs(self, step: str) -> Optional[Dict]:
+        row = self.steps.get(step)
+        return json.loads(row["inputs"]) if row and row["inputs"] else None
+
+    def result(self, step: str) -> Dict:
+        row = self.steps.get(step)
+        return json.loads(row["result"]) if row and row["result"] else {}
+
+    def record(
+        self,
+        step: str,
+        status: str,
+        inputs: Optional[Dict] = None,
+        tx_hash: Optional[str] = None,
+        result: Optional[Dict] = None,
+    ):
+        self.store.save_setup_step(
+            self.chain_id,
+            self.trading_address,
+            step,
+            status,
+            json.dumps(inputs) if inputs is not None else None,
+            tx_hash,
+            json.dumps(result) if result is not None else None,
+        )
+        self.steps = self.store.get_setup_steps(self.chain_id, self.trading_address)
+
+
+def resolve_plan(ew3: EulithWeb3, journal: SetupJournal, args) -> Dict:
+    """
+    The owners, threshold and whitelist are fixed by the first run. Later runs (for example
+    with another owner's wallet) may omit them, but can't change them.
+    """
+    given = {}
+    if args.threshold is not None:
+        given["threshold"] = args.threshold
+    if args.owner_addresses:
+        given["owners"] = [ew3.to_checksum_address(o) for o in args.owner_addresses]
+    if args.whitelist is not None:
+        given["whitelist"] = [ew3.to_checksum_address(a) for a in args.whitelist]
+
+    plan = journal.inputs(STEP_PLAN)
+    if plan is None:
+        if "threshold" not in given or "owners" not in given:
+            print("The first run of setup needs --threshold and --owner-addresses")
+            exit(1)
+        if not 1 <= given["threshold"] <= len(given["owners"]):
+            print(f"--threshold must be between 1 and {len(given['owners'])}")
+            exit(1)
+
+        plan = {"whitelist": [], **given}
+        journal.record(STEP_PLAN, STATUS_DONE, inputs=plan)
+        return plan
+
+    for key, value in given.items():
+        journaled = plan.get(key)
+        if isinstance(value, list):
+            value, journaled = sorted(a.lower() for a in value), sorted(
+                a.lower() for a in journaled or []
+            )
+        if value != journaled:
+            print(
+                f"--{key.replace('_', '-')} differs from the setup journaled for "
+                f"{journal.trading_address} ({plan.get(key)}); pass the same value or leave it out"
+            )
+            exit(1)
+
+    return plan
+
+
+def wait_for_step(ew3: EulithWeb3, journal: SetupJournal, step: str, tx_hash: str):
+    print(f"[{step}] waiting for {tx_hash}")
+    try:
+        wait_for_success(ew3, tx_hash)
+    except EulithRpcException as e:
+        # A reverted transaction is final; the next run builds and sends a new one
+        journal.record(step, STATUS_FAILED, result={"error": str(e)})
+        raise
+
+
+def tx_fingerprint(tx: Dict) -> Dict:
+    return {
+        "to": (tx.get("to") or "").lower(),
+        "data_hash": Web3.keccak(
+            HexBytes(tx.get("data") or tx.get("input") or b"")
+        ).hex(),
+    }
+
+
+def send_journaled(
+    ew3, wallet, journal: SetupJournal, step: str, tx: Dict, inputs: Dict
+):
+    """
+    Pins the wallet's next nonce and journals it before broadcasting, so a crash or a lost
+    response between the broadcast and journaling the hash can be recovered by
+    `recover_sending` instead of sending the transaction again.
+    """
+    nonce = ew3.eth.get_transaction_count(wallet.address, "pending")
+    tx.update({"from": wallet.address, "nonce": nonce})
+    journal.record(
+        step,
+        STATUS_SENDING,
+        inputs={
+            **inputs,
+            "from": wallet.address,
+            "nonce": nonce,
+            "block": ew3.eth.block_number,
+            **tx_fingerprint(tx),
+        },
+    )
+
+    h = ew3.eth.send_transaction(tx).hex()
+    journal.record(step, STATUS_SENT, tx_hash=h)
+    return h
+
+
+def find_tx_by_nonce(ew3, sender: str, nonce: int, from_block: int) -> Optional[Dict]:
+    """
+    The mined transaction of `sender` with `nonce`, found by bisecting on the sender's
+    transaction count from `from_block` and then reading the single block that used it.
+    """
+    lo, hi = from_block, ew3.eth.block_number
+    if ew3.eth.get_transaction_count(sender, hi) <= nonce:
+        return None
+
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if ew3.eth.get_transaction_count(sender, mid) > nonce:
+            hi = mid
+        else:
+            lo = mid + 1
+
+    for tx in ew3.eth.get_block(lo, full_transactions=True)["transactions"]:
+        if tx["from"].lower() == sender.lower() and tx["nonce"] == nonce:
+            return tx
+
+    return None
+
+
+def recover_sending(ew3, journal: SetupJournal, step: str) -> Optional[str]:
+    """
+    Resolves a step journaled as sending: the hash of its transaction if it was mined, or None
+    if it never reached the chain (the nonce is unused, or was used by another transaction).
+    Stops setup while the nonce is taken by a transaction that is still pending.
+    """
+    inputs = journal.inputs(step)
+    sender, nonce = inputs["from"], inputs["nonce"]
+
+    if ew3.eth.get_transaction_count(sender, "latest") <= nonce:
+        if ew3.eth.get_transaction_count(sender, "pending") > nonce:
+            print(
+                f"[{step}] a transaction with nonce {nonce} from {sender} is still pending; "
+                f"run setup again once it is mined"
+            )
+            exit(1)
+        print(f"[{step}] the interrupted transaction never reached the network")
+        journal.record(step, STATUS_FAILED, result={"error": "not broadcast"})
+        return None
+
+    tx = find_tx_by_nonce(ew3, sender, nonce, inputs["block"])
+    if tx is None or tx_fingerprint(tx) != {
+        "to": inputs["to"],
+        "data_hash": inputs["data_hash"],
+    }:
+        print(f"[{step}] nonce {nonce} of {sender} was used by another transaction")
+        journal.record(step, STATUS_FAILED, result={"error": "nonce used elsewhere"})
+        return None
+
+    h = "0x" + bytes(tx["hash"]).hex()
+    print(f"[{step}] found the interrupted transaction {h}")
+    journal.record(step, STATUS_SENT, tx_hash=h)
+    return h
+
+
+def step_deploy(ew3, wallet, auth_address, journal, plan, args) -> bool:
+    h = journal.sent_tx_hash(STEP_DEPLOY)
+    if journal.status(STEP_DEPLOY) == STATUS_SENDING:
+        h = recover_sending(ew3, journal, STEP_DEPLOY)
+    if h is None:
+        aa, sa = ew3.v0.get_armor_and_safe_addresses(auth_address)
+        if aa:
+            journal.record(
+                STEP_DEPLOY,
+                STATUS_DONE,
+                result={"armor": aa, "safe": sa, "adopted": True},
+            )
+            print(f"[{STEP_DEPLOY}] found existing Armor {aa} and Safe {sa}")
+            return True
+
+        print(
+            "Deploying Armor is expensive (potentially 0.3 ETH or more on mainnet depending on gas price)."
+        )
+        input("\nPlease hit ENTER to proceed...\n")
+
+        tx = ew3.v0.get_armor_deploy_tx(auth_address, True)
+        tx["gas"] = args.gas
+        h = send_journaled(ew3, wallet, journal, STEP_DEPLOY, tx, {"gas": args.gas})
+
+    wait_for_step(ew3, journal, STEP_DEPLOY, h)
+    # A run that stopped after submitting the hash but before journaling it as done has
+    # already registered the Armor; submitting again would be rejected
+    aa, sa = ew3.v0.get_armor_and_safe_addresses(auth_address)
+    if not aa:
+        if not ew3.eulith_service.submit_new_armor_hash(h, None):
+            raise EulithRpcException("failed to submit new armor tx hash")
+        aa, sa = ew3.v0.get_armor_and_safe_addresses(auth_address)
+
+    journal.record(STEP_DEPLOY, STATUS_DONE, result={"armor": aa, "safe": sa})
+    print(f"[{STEP_DEPLOY}] Armor address: {aa}, Safe address: {sa}")
+    return True
+
+
+def step_owner_signatures(ew3, wallet, auth_address, journal, plan, args) -> bool:
+    owners = [o.lower() for o in plan["owners"]]
+    threshold = plan["threshold"]
+
+    signatures = ew3.v0.get_accepted_enable_armor_signatures(auth_address)
+    # Only signatures from the planned owners count towards its threshold
+    signed = {s["owner_address"].lower() for s in signatures} & set(owners)
+
+    me = wallet.address.lower()
+    if len(signed) < threshold and me in owners and me not in signed:
+        print("When prompted, please sign the request")
+        ew3.v0.submit_enable_module_signature(auth_address, wallet)
+        signed.add(me)
+
+    if len(signed) >= threshold:
+        journal.record(
+            STEP_OWNER_SIGNATURES, STATUS_DONE, result={"signers": sorted(signed)}
+        )
+        return True
+
+    aa, sa = ew3.v0.get_armor_and_safe_addresses(auth_address)
+    if get_safe(ew3, sa).is_module_enabled(ew3.to_checksum_address(aa)):
+        journal.record(STEP_OWNER_SIGNATURES, STATUS_DONE, result={"adopted": True})
+        return True
+
+    journal.record(
+        STEP_OWNER_SIGNATURES, STATUS_WAITING, result={"signers": sorted(signed)}
+    )
+    missing = [o for o in plan["owners"] if o.lower() not in signed]
+    print(
+        f"[{STEP_OWNER_SIGNATURES}] {len(signed)}/{threshold} owner signatures. Run setup "
+        f"again with the wallet of one of: {', '.join(missing)}"
+    )
+    return False
+
+
+def step_enable(ew3, wallet, auth_address, journal, plan, args) -> bool:
+    h = journal.sent_tx_hash(STEP_ENABLE)
+    if journal.status(STEP_ENABLE) == STATUS_SENDING:
+        h = recover_sending(ew3, journal, STEP_ENABLE)
+    if h is None:
+        aa, sa = ew3.v0.get_armor_and_safe_addresses(auth_address)
+        if get_safe(ew3, sa).is_module_enabled(ew3.to_checksum_address(aa)):
+            journal.record(STEP_ENABLE, STATUS_DONE, result={"adopted": True})
+            print(f"[{STEP_ENABLE}] Armor is already enabled on the Safe")
+            return True
+
+        status, tx = ew3.eulith_service.get_enable_safe_tx(
+            auth_address, plan["threshold"], plan["owners"]
+        )
+        if not status:
+            raise EulithRpcException(tx)
+
+        print("When prompted, please sign transaction.")
+        tx["gas"] = args.enable_gas
+        h = send_journaled(
+            ew3, wallet, journal, STEP_ENABLE, tx, {"gas": args.enable_gas}
+        )
+
+    wait_for_step(ew3, journal, STEP_ENABLE, h)
+    journal.record(STEP_ENABLE, STATUS_DONE, result={})
+    return True
+
+
+def step_submit_setup_safe(ew3, wallet, auth_address, journal, plan, args) -> bool:
+    if journal.result(STEP_ENABLE).get("adopted"):
+        journal.record(
+            STEP_SUBMIT_SETUP_SAFE,
+            STATUS_DONE,
+            result={"skipped": "Armor was enabled outside this setup"},
+        )
+        print(
+            f"[{STEP_SUBMIT_SETUP_SAFE}] skipped; if you enabled Armor yourself, run "
+            f"submit-setup-safe with that transaction's hash"
+        )
+        return True
+
+    status, error = ew3.eulith_service.submit_enable_safe_tx_hash(
+        journal.tx_hash(STEP_ENABLE), has_ace=False
+    )
+    if error:
+        raise EulithRpcException(error)
+    if not status:
+        journal.record(STEP_SUBMIT_SETUP_SAFE, STATUS_WAITING)
+        print(f"[{STEP_SUBMIT_SETUP_SAFE}] the setup safe hash was not accepted yet")
+        return False
+
+    journal.record(STEP_SUBMIT_SETUP_SAFE, STATUS_DONE, result={})
+    return True
+
+
+def step_create_whitelist(ew3, wallet, auth_address, journal, plan, args) -> bool:
+    want = sorted(a.lower() for a in plan["whitelist"])
+    current = ew3.v0.get_current_client_whitelist(auth_address, journal.chain_id) or {}
+
+    for state in ("active", "draft"):
+        existing = current.get(state)
+        if whitelist_addresses(existing) == want:
+            journal.record(
+                STEP_CREATE_WHITELIST,
+                STATUS_DONE,
+                result={"list_id": existing["list_id"], "adopted": state},
+            )
+            print(
+                f"[{STEP_CREATE_WHITELIST}] found the {state} whitelist {existing['list_id']}"
+            )
+            return True
+
+    list_id = ew3.v0.create_draft_client_whitelist(auth_address, plan["whitelist"])
+    journal.record(STEP_CREATE_WHITELIST, STATUS_DONE, result={"list_id": list_id})
+    print(f"[{STEP_CREATE_WHITELIST}] created draft client whitelist with ID {list_id}")
+    return True
+
+
+def step_sign_whitelist(ew3, wallet, auth_address, journal, plan, args) -> bool:
+    list_id = journal.result(STEP_CREATE_WHITELIST)["list_id"]
+    want = sorted(a.lower() for a in plan["whitelist"])
+
+    current = ew3.v0.get_current_client_whitelist(auth_address, journal.chain_id) or {}
+    if whitelist_addresses(current.get("active")) == want:
+        journal.record(STEP_SIGN_WHITELIST, STATUS_DONE, result={"list_id": list_id})
+        return True
+
+    signers: List[str] = journal.result(STEP_SIGN_WHITELIST).get("signers", [])
+    me = wallet.address.lower()
+    if me in (o.lower() for o in plan["owners"]) and me not in signers:
+        print("When prompted, please sign transaction.")
+        enabled = ew3.v0.submit_draft_client_whitelist_signature(list_id, wallet)
+        signers.append(me)
+        if enabled:
+            journal.record(
+                STEP_SIGN_WHITELIST,
+                STATUS_DONE,
+                result={"list_id": list_id, "signers": signers},
+            )
+            print(
+                f"[{STEP_SIGN_WHITELIST}] threshold of owners reached, whitelist is enabled"
+            )
+            return True
+
+    journal.record(
+        STEP_SIGN_WHITELIST,
+        STATUS_WAITING,
+        result={"list_id": list_id, "signers": signers},
+    )
+    print(
+        f"[{STEP_SIGN_WHITELIST}] signed by {len(signers)} owner(s) from this machine. Run "
+        f"setup again with another owner's wallet"
+    )
+    return False
+
+
+SETUP_STEPS: List[Tuple[str, Callable]] = [
+    (STEP_DEPLOY, step_deploy),
+    (STEP_OWNER_SIGNATURES, step_owner_signatures),
+    (STEP_ENABLE, step_enable),
+    (STEP_SUBMIT_SETUP_SAFE, step_submit_setup_safe),
+    (STEP_CREATE_WHITELIST, step_create_whitelist),
+    (STEP_SIGN_WHITELIST, step_sign_whitelist),
+]
+WHITELIST_STEPS = {STEP_CREATE_WHITELIST, STEP_SIGN_WHITELIST}
+
+
+def print_journal(journal: SetupJournal, plan: Optional[Dict]):
+    print(f"Setup of {journal.trading_address} on chain {journal.chain_id}:")
+    for step, _ in SETUP_STEPS:
+        if plan is not None and not plan["whitelist"] and step in WHITELIST_STEPS:
+            continue
+        status = journal.status(step) or "pending"
+        tx_hash = journal.tx_hash(step)
+        detail = f" {tx_hash}" if tx_hash else ""
+        result = journal.result(step)
+        if result:
+            detail += f" {json.dumps(result)}"
+        print(f"  {step:<20}{status:<10}{detail}".rstrip())
+
+
+def handle_setup(ew3, wallet, auth_address, args):
+    if not auth_address:
+        print("setup needs EULITH_TRADING_ADDRESS")
+        exit(1)
+
+    with LocalStore() as store:
+        journal = SetupJournal(store, ew3.eth.chain_id, auth_address)
+
+        if args.status:
+            print_journal(journal, journal.inputs(STEP_PLAN))
+            return
+
+        plan = resolve_plan(ew3, journal, args)
+        for step, run in SETUP_STEPS:
+            if step in WHITELIST_STEPS and not plan["whitelist"]:
+                continue
+            # Completed steps are trusted without asking the chain again
+            if journal.status(step) == STATUS_DONE:
+                print(f"[{step}] done")
+                continue
+            if not run(ew3, wallet, auth_address, journal, plan, args):
+                return
+
+        print(f"\nSetup of {auth_address} is complete.")
@@ -0,0 +1,268 @@
+import os
+import random
+import socket
+import ssl
+import threading
+import time
+import weakref
+from typing import Any, Dict, List, Optional
+
+import websocket
+from web3.providers import JSONBaseProvider
+from web3.types import RPCEndpoint, RPCResponse
+
+from eulith_web3.websocket import CouldNotConnectException, EulithWebsocketProvider
+
+DEFAULT_POOL_SIZE = 1
+DEFAULT_PING_INTERVAL_S = 20.0
+DEFAULT_CONNECT_TIMEOUT_S = 10.0
+
+
+class TransportConfig:
+    """
+    How connections to a Eulith endpoint are made. Read from the environment by `from_env`:
+
+      EULITH_POOL_SIZE            websocket connections per endpoint (default 1)
+      EULITH_PING_INTERVAL_S      websocket ping on idle connections, 0 to disable (default 20)
+      EULITH_CONNECT_TIMEOUT_S    TCP + TLS + upgrade timeout (default 10)
+      EULITH_TLS_RESUMPTION       0 to always do a full TLS handshake (default 1)
+    """
+
+    def __init__(
+        self,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        ping_interval_s: float = DEFAULT_PING_INTERVAL_S,
+        connect_timeout_s: float = DEFAULT_CONNECT_TIMEOUT_S,
+        tls_resumption: bool = True,
+    ):
+        self.pool_size = max(1, pool_size)
+        self.ping_interval_s = ping_interval_s
+        self.connect_timeout_s = connect_timeout_s
+        self.tls_resumption = tls_resumption
+
+    @classmethod
+    def from_env(cls) -> "TransportConfig":
+        return cls(
+            pool_size=int(os.environ.get("EULITH_POOL_SIZE", DEFAULT_POOL_SIZE)),
+            ping_interval_s=float(
+                os.environ.get("EULITH_PING_INTERVAL_S", DEFAULT_PING_INTERVAL_S)
+            ),
+            connect_timeout_s=float(
+                os.environ.get("EULITH_CONNECT_TIMEOUT_S", DEFAULT_CONNECT_TIMEOUT_S)
+            ),
+            tls_resumption=os.environ.get("EULITH_TLS_RESUMPTION", "1") != "0",
+        )
+
+
+class ResumingSSLSocket(ssl.SSLSocket):
+    def _remember_session(self):
+        try:
+            if self.session is not None and self.server_hostname:
+                self.context.remember(self.server_hostname, self.session)
+        except (AttributeError, ValueError, OSError):
+            pass
+
+    def shutdown(self, how):
+        self._remember_session()
+        super().shutdown(how)
+
+    def close(self):
+        self._remember_session()
+        super().close()
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """
+    A client SSLContext that offers the last TLS session it saw for a host when it opens another
+    connection to that host, so later connections skip the full handshake.
+
+    Sessions are taken from a live connection to the host, or saved when one closes (with TLS
+    1.3 the session ticket only arrives after the handshake). Python can't serialize TLS
+    sessions, so this only helps within one process: a pool of connections, failover to another
+    endpoint on the same host, or a reconnect.
+    """
+
+    sslsocket_class = ResumingSSLSocket
+
+    def __new__(cls, protocol=ssl.PROTOCOL_TLS_CLIENT, *args, **kwargs):
+        return super().__new__(cls, protocol, *args, **kwargs)
+
+    def __init__(self, protocol=ssl.PROTOCOL_TLS_CLIENT):
+        self.session_lock = threading.Lock()
+        self.sessions: Dict[str, ssl.SSLSession] = {}
+        self.live: Dict[str, weakref.ref] = {}
+        self.handshakes = 0
+        self.resumed = 0
+        self.load_default_certs(ssl.Purpose.SERVER_AUTH)
+
+    def remember(self, hostname: str, session: ssl.SSLSession):
+        with self.session_lock:
+            self.sessions[hostname] = session
+
+    def session_for(self, hostname: str) -> Optional[ssl.SSLSession]:
+        with self.session_lock:
+            live = self.live.get(hostname)
+            sock = live() if live else None
+            session = self.sessions.get(hostname)
+
+        if sock is not None:
+            try:
+                session = sock.session or session
+            except (AttributeError, ValueError, OSError):
+                pass
+
+        return session
+
+    def wrap_socket(self, sock, *args, server_hostname=None, session=None, **kwargs):
+        if session is None and server_hostname:
+            session = self.session_for(server_hostname)
+
+        try:
+            ssock = super().wrap_socket(
+                sock, *args, server_hostname=server_hostname, session=session, **kwargs
+            )
+        except ValueError:
+            # A session from another context or protocol version; fall back to a full handshake
+            ssock = super().wrap_socket(
+                sock, *args, server_hostname=server_hostname, **kwargs
+            )
+
+        with self.session_lock:
+            self.handshakes += 1
+            self.resumed += int(ssock.session_reused)
+            if server_hostname:
+                self.live[server_hostname] = weakref.ref(ssock)
+
+        return ssock
+
+
+_shared_ssl_context = None
+_shared_ssl_lock = threading.Lock()
+
+
+def get_shared_ssl_context() -> ResumingSSLContext:
+    global _shared_ssl_context
+
+    with _shared_ssl_lock:
+        if _shared_ssl_context is None:
+            _shared_ssl_context = ResumingSSLContext()
+        return _shared_ssl_context
+
+
+class TunedWebsocketProvider(EulithWebsocketProvider):
+    """
+    EulithWebsocketProvider with a connect timeout, TLS session resumption and websocket pings on
+    idle connections (TCP keepalive is already on by default in websocket-client). The
+    reconnect loop is the library's; only how a connection is opened changes.
+    """
+
+    def __init__(
+        self,
+        uri: str,
+        bearer_token: str,
+        config: Optional[TransportConfig] = None,
+        ssl_context: Optional[ssl.SSLContext] = None,
+        **kwargs,
+    ):
+        # Must be set before the base class starts its connection thread
+        self.config = config or TransportConfig()
+        if ssl_context is None and self.config.tls_resumption:
+            ssl_context = get_shared_ssl_context()
+        self.ssl_context = ssl_context
+        self.live_connection = None
+
+        super().__init__(uri, bearer_token, **kwargs)
+
+        if self.config.ping_interval_s:
+            threading.Thread(
+                target=self.ping_loop, name="eulith_ws_ping", daemon=True
+            ).start()
+
+    def connect(self):
+        options: Dict[str, Any] = {
+            "header": {"Authorization": f"Bearer {self.bearer}"},
+            "suppress_origin": True,
+            "timeout": self.config.connect_timeout_s,
+        }
+        if self.ssl_context is not None and self.uri.startswith("wss://"):
+            options["sslopt"] = {"context": self.ssl_context}
+
+        sleep = 1
+        attempts = 0
+
+        while attempts < self.max_reconnect_attempts:
+            try:
+                connection = websocket.create_connection(self.uri, **options)
+                # The timeout is for connecting only; the receive loop blocks indefinitely
+                connection.settimeout(None)
+                self.live_connection = connection
+                return connection
+            except (
+                ConnectionRefusedError,
+                socket.timeout,
+                websocket.WebSocketTimeoutException,
+            ):
+                time.sleep(random.uniform(0, sleep))
+                sleep *= 2
+                attempts += 1
+
+        raise CouldNotConnectException()
+
+    def ping_loop(self):
+        while not self.shutdown_event.wait(self.config.ping_interval_s):
+            connection = self.live_connection
+            if connection is None or not connection.connected:
+                continue
+            try:
+                connection.ping()
+            except Exception:
+                # The receive loop notices a dead connection and reconnects
+                pass
+
+
+class ConnectionPool(JSONBaseProvider):
+    """
+    Several websocket connections to one endpoint. Each request goes to the connection with the
+    fewest requests in flight. Subscriptions and anything else that isn't a plain request stay
+    on the first connection.
+    """
+
+    def __init__(self, members: List[JSONBaseProvider]):
+        super().__init__()
+        self.members = members
+        self.in_flight = [0] * len(members)
+        self.lock = threading.Lock()
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        with self.lock:
+            i = min(range(len(self.members)), key=self.in_flight.__getitem__)
+            self.in_flight[i] += 1
+        try:
+            return self.members[i].make_request(method, params)
+        finally:
+            with self.lock:
+                self.in_flight[i] -= 1
+
+    def terminate(self):
+        for member in self.members:
+            member.terminate()
+
+    def __getattr__(self, item):
+        return getattr(self.members[0], item)
+
+
+def connect_endpoint(
+    uri: str, bearer_token: str, config: TransportConfig
+) -> JSONBaseProvider:
+    """
+    A provider for `uri` with `config.pool_size` tuned connections.
+    """
+    members = [
+        TunedWebsocketProvider(uri, bearer_token, config)
+        for _ in range(max(1, config.pool_size))
+    ]
+
+    if len(members) == 1:
+        return members[0]
+
+    return ConnectionPool(members)